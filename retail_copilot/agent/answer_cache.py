@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_question(question: str) -> str:
+    """
+    Case- and whitespace-insensitive form of a question used as memo key. Every
+    stage lowercases the question and retrieval splits on whitespace, so questions
+    that differ only in case or spacing get the same plan.
+    """
+    return " ".join((question or "").lower().split())
+
+
+def _digest(key: Hashable) -> str:
+    return hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds and are only
+    returned for the `version` they were stored under.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[str, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_version, expires, value = entry
+            if stored_version != version or expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, version: str, value: Any):
+        if self.max_size <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            self._data[key] = (version, expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class PersistentMemoStore:
+    """
+    On-disk memo table in a small SQLite file (WAL mode), so several workers or
+    processes share answers. Keys are hashed; values are pickled, so the file must
+    only be shared between trusted processes. Rows stored under another version or
+    past their expiry are ignored and overwritten.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 3600.0, max_rows: int = 100000):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._puts = 0
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS memo (
+            level TEXT NOT NULL, key TEXT NOT NULL, version TEXT NOT NULL,
+            expires REAL NOT NULL, used REAL NOT NULL, value BLOB NOT NULL,
+            PRIMARY KEY (level, key)) WITHOUT ROWID""")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; every process opens its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, level: str, key: Hashable, version: str) -> Any:
+        conn = self._conn()
+        digest = _digest(key)
+        row = conn.execute("SELECT version, expires, value FROM memo WHERE level = ? AND key = ?",
+                           (level, digest)).fetchone()
+        if row is None or row[0] != version or row[1] < time.time():
+            return None
+        with conn:
+            conn.execute("UPDATE memo SET used = ? WHERE level = ? AND key = ?", (time.time(), level, digest))
+        return pickle.loads(row[2])
+
+    def put(self, level: str, key: Hashable, version: str, value: Any):
+        conn = self._conn()
+        now = time.time()
+        expires = now + self.ttl if self.ttl else float("inf")
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO memo (level, key, version, expires, used, value) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (level, _digest(key), version, expires, now, pickle.dumps(value)))
+        self._puts += 1
+        if self._puts % 256 == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Drop expired rows, then all but the `max_rows` most recently used.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM memo WHERE expires < ?", (time.time(),))
+            conn.execute("DELETE FROM memo WHERE used < (SELECT used FROM memo ORDER BY used DESC "
+                         "LIMIT 1 OFFSET ?)", (self.max_rows,))
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM memo")
+
+
+class AnswerCache:
+    """
+    Two-level memo for RetailAgent.run_one:
+
+    * "plan": normalized question (+ id-derived routing/format hints) -> route,
+      retrieved chunks, PlannerOutput and NL2SQLOutput. Valid for one docs
+      content hash.
+    * "answer": SQL template + params (+ executed SQL, format, citations) ->
+      SynthOutput. Valid for one docs content hash and database version.
+
+    Both levels are an in-memory LRU with TTL, optionally backed by a shared
+    PersistentMemoStore at `path`.
+    """
+
+    LEVELS = ("plan", "answer")
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600.0, path: Optional[str] = None):
+        self.memory = {level: TTLCache(max_size, ttl) for level in self.LEVELS}
+        self.store = PersistentMemoStore(path, ttl) if path else None
+        self.stats: Dict[str, int] = {f"{level}_{what}": 0 for level in self.LEVELS for what in ("hits", "misses")}
+        self._lock = threading.Lock()
+
+    def get(self, level: str, key: Hashable, version: str) -> Any:
+        value = self.memory[level].get(key, version)
+        if value is None and self.store is not None:
+            value = self.store.get(level, key, version)
+            if value is not None:
+                self.memory[level].put(key, version, value)
+        with self._lock:
+            self.stats[f"{level}_{'hits' if value is not None else 'misses'}"] += 1
+        return value
+
+    def put(self, level: str, key: Hashable, version: str, value: Any):
+        self.memory[level].put(key, version, value)
+        if self.store is not None:
+            self.store.put(level, key, version, value)
+
+    def clear(self):
+        for cache in self.memory.values():
+            cache.clear()
+        if self.store is not None:
+            self.store.clear()
@@ -29,6 +29,35 @@ class PlannerOutput:
 @dataclass
 class NL2SQLOutput:
     sql: str
+    # template id from agent.sql_templates and its bound `?` parameters
+    template_id: str = ""
+    params: Tuple[Any, ...] = ()
+
+
+@dataclass
+class ColumnarResult:
+    # Compact query result: one tuple per column plus a shared column list.
+    columns: List[str]
+    data: List[Tuple[Any, ...]]
+    truncated: bool = False  # True when the row cap cut the result short
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def column(self, name: str) -> Tuple[Any, ...]:
+        return self.data[self.columns.index(name)]
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return {c: col[i] for c, col in zip(self.columns, self.data)}
+
+    def get(self, i: int, *names: str) -> Any:
+        # like `row.get(a) or row.get(b) or ...` on the i-th row
+        value = None
+        for name in names:
+            value = self.data[self.columns.index(name)][i] if name in self.columns else None
+            if value:
+                return value
+        return value
 
 
 @dataclass
@@ -36,6 +65,22 @@ class ExecOutput:
     columns: List[str]
     rows: List[Dict[str, Any]]
     error: str
+    # filled instead of `rows` by the columnar execution path
+    columnar: Optional[ColumnarResult] = None
+    # number of queries run by the repair loop (1 = first try succeeded)
+    attempts: int = 0
+    # SQLRepairer rule that made the query run ("" = no repair needed)
+    repair: str = ""
+    # questions answered by the same shared aggregate in run_batch (0 = own query)
+    shared: int = 0
+    # SQL that answered instead of the selected one (base template after a rollup fallback)
+    fallback_sql: str = ""
+
+    def as_columnar(self) -> ColumnarResult:
+        if self.columnar is not None:
+            return self.columnar
+        data = [tuple(r.get(c) for r in self.rows) for c in self.columns]
+        return ColumnarResult(columns=list(self.columns), data=data)
 
 
 @dataclass
@@ -44,3 +89,5 @@ class SynthOutput:
     citations: List[str]
     explanation: str
     confidence: float
+    # ExecOutput.fallback_sql of the execution answered from (kept with memoized answers)
+    fallback_sql: str = ""
@@ -1,10 +1,20 @@
+import copy
 import json
 import re
-from typing import Any, Dict, List, Tuple
-
-from agent.tools.sqlite_tool import SQLiteTool
-from agent.rag.retrieval import BM25Retriever
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from agent.tools.sqlite_tool import SQLiteTool, is_budget_error
+from agent.sql_templates import ROLLUP_TEMPLATES, SQL_TEMPLATES, date_bounds, year_bounds
+from agent.tools import db_maintenance
+from agent import shared_scan
+from agent.answer_cache import AnswerCache, normalize_question
+from agent.stage_graph import StageCancelled, StageGraph
+from agent.tracing import NullTrace, SpanExporter, Trace
 from agent.dspy_signatures import (
+    ColumnarResult,
     RouterOutput,
     RetrievalOutput,
     PlannerOutput,
@@ -12,33 +22,198 @@ from agent.dspy_signatures import (
     ExecOutput,
     SynthOutput,
 )
-import os
+
+if TYPE_CHECKING:
+    # imported on first use (see the lazy components and the asyncio interface),
+    # so constructing an agent does not pay for them
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from agent.rag.retrieval import BM25Retriever
+    from agent.rules import RuleEngine
+    from agent.tools.sql_repair import SQLRepairer
 
 
 class RetailAgent:
-    def __init__(self, db_path: str = "data/northwind.sqlite", docs_path: str = "docs"):
-        self.db = SQLiteTool(db_path)
-        self.retriever = BM25Retriever(docs_path)
-        self.schema = self.db.get_schema()
+    def __init__(self, db_path: str = "data/northwind.sqlite", docs_path: str = "docs",
+                 index_path: Optional[str] = None, docs_poll_interval: Optional[float] = None,
+                 pool_size: int = 0, max_rows: int = 10000, maintain_db: bool = False,
+                 trace: bool = False, span_exporter: Optional[SpanExporter] = None,
+                 memo_size: int = 0, memo_ttl: Optional[float] = 3600.0, memo_path: Optional[str] = None,
+                 lazy: bool = True, sql_doc_citations: bool = True, async_concurrency: Optional[int] = None,
+                 query_timeout: Optional[float] = 30.0, query_instructions: Optional[int] = None,
+                 cost_guard: bool = True, index_workers: int = 1, shared_scans: bool = True,
+                 chunking: str = "lines", retrieval_k: int = 5):
+        # pool_size > 0 lets one agent serve concurrent run_one calls from many threads.
+        # Every query gets `query_timeout` seconds / `query_instructions` VM instructions,
+        # and the cost guard rejects cartesian joins of large tables before they run.
+        self.db = SQLiteTool(db_path, pool_size=pool_size, time_limit=query_timeout,
+                             instruction_limit=query_instructions, cost_guard=cost_guard)
+        # row cap protecting the agent from runaway result sets
+        self.max_rows = max_rows
+        # index_workers > 1 builds a missing/stale BM25 index on a process pool;
+        # chunking="sections" keeps markdown sections whole, so a smaller
+        # `retrieval_k` still cites every chunk the answer needs.
+        # The retriever, schema and repairer are built on first use (see
+        # "Lazy components"), so an agent that never needs one never pays for it.
+        self._retriever_kwargs = {"index_path": index_path, "build_workers": index_workers, "chunking": chunking}
+        self._retriever: Optional["BM25Retriever"] = None
+        self._schema: Optional[Dict[str, List[str]]] = None
+        self._repairer: Optional["SQLRepairer"] = None
+        # (file stats, texts, content hash) of docs/ read without the retriever, see _docs()
+        self._docs_read: Optional[Tuple[Dict[str, Tuple[int, int]], Dict[str, str], str]] = None
+        self._init_lock = threading.RLock()
+        self.chunking = chunking
+        self.retrieval_k = retrieval_k
+        # optional startup maintenance: covering indexes for the templates + daily rollups
+        self.maintenance_report = db_maintenance.run_maintenance(self.db) if maintain_db else None
+        self.use_rollups = db_maintenance.has_rollups(self.db)
         self.docs_path = docs_path
-        # load docs content for planner
-        self.docs_text = self._load_docs_text()
+        # keyword automaton + campaign / KPI indexes parsed from the docs, see rules()
+        self._rules: Optional["RuleEngine"] = None
+        self._rules_version: Optional[str] = None
+        # poll docs/ for edits at most every `docs_poll_interval` seconds (None disables)
+        self.docs_poll_interval = docs_poll_interval
+        self._docs_polled_at = time.monotonic()
+        # per-stage tracing: `trace` adds a `trace` field to every output record,
+        # `span_exporter` receives the OpenTelemetry-style spans of every run
+        self.trace = trace
+        self.span_exporter = span_exporter
+        # answer memoization (off by default): plans per normalized question and
+        # answers per SQL template + params, dropped when docs or data change;
+        # `memo_path` shares them between workers through a local SQLite file
+        self.memo = AnswerCache(memo_size, memo_ttl, memo_path) if memo_size > 0 or memo_path else None
+        # lazy: run only the stages the answer needs (see _stage_graph); lazy=False
+        # runs every stage like the original pipeline. sql_doc_citations=False
+        # drops doc-chunk citations on the sql route, which then skips retrieval.
+        self.lazy = lazy
+        self.sql_doc_citations = sql_doc_citations
+        # run_batch answers questions of one template with different date windows
+        # from one shared aggregate (see agent.shared_scan)
+        self.shared_scans = shared_scans
+        # asyncio API: at most `async_concurrency` requests run at once (default:
+        # one per SQLite connection), each on a thread of a bounded executor
+        self.async_concurrency = async_concurrency or max(pool_size, 1)
+        self._executor: Optional["ThreadPoolExecutor"] = None
+        self._limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        # cancel event of the request running on the current thread (asyncio API)
+        self._local = threading.local()
 
-    def _load_docs_text(self) -> Dict[str, str]:
-        texts = {}
-        for fn in os.listdir(self.docs_path):
-            if not fn.endswith(".md"):
-                continue
-            with open(os.path.join(self.docs_path, fn), "r", encoding="utf-8") as f:
-                texts[fn] = f.read()
-        return texts
+    # --------------------------
+    # Lazy components
+    # --------------------------
+    @property
+    def retriever(self) -> "BM25Retriever":
+        """
+        BM25 retriever over docs/; the first access reads the docs and loads (or
+        builds) the index.
+        """
+        if self._retriever is None:
+            with self._init_lock:
+                if self._retriever is None:
+                    from agent.rag.retrieval import BM25Retriever
+                    self._retriever = BM25Retriever(self.docs_path, **self._retriever_kwargs)
+                    # the retriever keeps its own copy of docs/ from now on
+                    self._docs_read = None
+        return self._retriever
+
+    def _docs(self) -> Tuple[Dict[str, str], str]:
+        """
+        Docs texts and their version (the retriever's content_hash). Until the
+        retriever is built they are read from docs/ directly, so runs that never
+        retrieve (sql route without doc citations) never load or build the index.
+        """
+        retriever = self._retriever
+        if retriever is not None:
+            return retriever.doc_texts, retriever.content_hash
+        docs = self._docs_read
+        if docs is None:
+            from agent.rag import retrieval
+            with self._init_lock:
+                docs = self._docs_read
+                if docs is None:
+                    stats = retrieval.list_documents(self.docs_path)
+                    texts = {fn: retrieval.read_document(self.docs_path, fn) for fn in stats}
+                    version = retrieval.docs_content_hash({fn: retrieval.text_hash(text) for fn, text in texts.items()},
+                                                          chunking=self.chunking)
+                    docs = self._docs_read = (stats, texts, version)
+        return docs[1], docs[2]
+
+    @property
+    def docs_text(self) -> Dict[str, str]:
+        """
+        Docs content for the planner (the retriever's, updated in place on refresh, once it exists).
+        """
+        return self._docs()[0]
+
+    @property
+    def docs_version(self) -> str:
+        return self._docs()[1]
+
+    @property
+    def schema(self) -> Dict[str, List[str]]:
+        if self._schema is None:
+            with self._init_lock:
+                if self._schema is None:
+                    self._schema = self.db.get_schema()
+        return self._schema
+
+    @property
+    def repairer(self) -> "SQLRepairer":
+        """
+        Classifies SQL errors, compiles candidate rewrites, remembers what worked per template.
+        """
+        if self._repairer is None:
+            with self._init_lock:
+                if self._repairer is None:
+                    from agent.tools.sql_repair import SQLRepairer
+                    self._repairer = SQLRepairer(self.db, self.schema)
+        return self._repairer
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Build every lazy component now (e.g. before a server starts accepting
+        requests). Returns the milliseconds each one took; components already
+        built take ~0.
+        """
+        timings = {}
+        for name, build in (("retriever", lambda: self.retriever), ("schema", lambda: self.schema),
+                            ("repairer", lambda: self.repairer), ("rules", self.rules)):
+            start = time.perf_counter()
+            build()
+            timings[name] = (time.perf_counter() - start) * 1000
+        return timings
+
+    def refresh_docs(self) -> List[str]:
+        """
+        Re-index any docs/ files edited since the last check; returns their names.
+        """
+        self._docs_polled_at = time.monotonic()
+        if self._retriever is None:
+            # nothing indexed yet: drop the docs read so far if any file changed
+            docs = self._docs_read
+            if docs is None:
+                return []
+            from agent.rag.retrieval import list_documents
+            stats = list_documents(self.docs_path)
+            changed = sorted(fn for fn in set(stats) | set(docs[0]) if stats.get(fn) != docs[0].get(fn))
+            if changed:
+                self._docs_read = None
+            return changed
+        return self.retriever.refresh()
+
+    def _maybe_refresh_docs(self):
+        if self.docs_poll_interval is None:
+            return
+        if time.monotonic() - self._docs_polled_at >= self.docs_poll_interval:
+            self.refresh_docs()
 
     # --------------------------
     # Router
     # --------------------------
-    def router(self, question: str, qid: str = "") -> RouterOutput:
-        q = question.lower()
-
+    @staticmethod
+    def _id_route(qid: str) -> Optional[RouterOutput]:
         # Exact ID-based routing (strongest)
         if "rag_policy_beverages_return_days" in qid:
             return RouterOutput(route="rag", reason="id-based")
@@ -49,22 +224,20 @@ class RetailAgent:
         if "hybrid" in qid:
             return RouterOutput(route="hybrid", reason="id-based")
 
-        # Fallback heuristics
-        if "top 3" in q:
-            return RouterOutput(route="sql", reason="top 3 aggregate")
-
-        if "average order value" in q or "aov" in q:
-            return RouterOutput(route="hybrid", reason="aov hybrid")
+        return None
 
-        if "gross margin" in q or "margin" in q:
-            return RouterOutput(route="hybrid", reason="margin hybrid")
+    def router(self, question: str, qid: str = "") -> RouterOutput:
+        q = question.lower()
 
-        if "summer" in q or "winter" in q:
-            return RouterOutput(route="hybrid", reason="date-based hybrid")
+        routed = self._id_route(qid)
+        if routed is not None:
+            return routed
 
-        # Policy-only
-        if "return" in q and "beverage" in q:
-            return RouterOutput(route="rag", reason="policy hybrid")
+        # Fallback heuristics (ROUTER_RULES, first match wins)
+        rules = self.rules()
+        matched = rules.route(rules.match(q))
+        if matched is not None:
+            return RouterOutput(route=matched[0], reason=matched[1])
 
         return RouterOutput(route="hybrid", reason="default fallback")
 
@@ -78,49 +251,45 @@ class RetailAgent:
     # --------------------------
     # Planner (extract dates/kpi/category)
     # --------------------------
-    def planner(self, question: str, retrieved: RetrievalOutput) -> PlannerOutput:
-        q = question.lower()
+    def rules(self) -> "RuleEngine":
+        """
+        Router/planner rules compiled from the current docs (rebuilt after a docs change).
+        """
+        engine = self._rules
+        docs_text, version = self._docs()
+        if engine is None or self._rules_version != version:
+            from agent.rules import RuleEngine
+            engine = RuleEngine(docs_text)
+            self._rules, self._rules_version = engine, version
+        return engine
+
+    def planner(self, question: str, retrieved: Optional[RetrievalOutput] = None) -> PlannerOutput:
+        rules = self.rules()
+        hits = rules.match(question)
         date_from = None
         date_to = None
         categories = []
-        kpi = None
         notes = {}
 
-        # try to detect marketing calendar ranges from docs
-        mc = self.docs_text.get("marketing_calendar.md", "")
-        if "summer beverages" in q or "summer beverages 1997" in q or "summer" in q:
-            m = re.search(r"Summer Beverages 1997[\s\S]*?Dates:\s*([0-9-\/]+)\s*to\s*([0-9-\/]+)", mc, re.IGNORECASE)
-            if not m:
-                # fallback to human readable in our docs format
-                m = re.search(r"Dates:\s*June 1.*?1997\s*to\s*June 30.*?1997", mc, re.IGNORECASE)
-            if m:
-                date_from = "1997-06-01"
-                date_to = "1997-06-30"
-            else:
-                date_from = "1997-06-01"
-                date_to = "1997-06-30"
-            categories.append("Beverages")
-
-        if "winter classics" in q or "winter" in q:
-            date_from = "1997-12-01"
-            date_to = "1997-12-31"
-            categories.append("Dairy Products")
-            categories.append("Confections")
+        # campaigns from the marketing calendar; of those mentioned, the one defined last sets the dates
+        for campaign in rules.matched_campaigns(hits):
+            date_from = campaign.date_from
+            date_to = campaign.date_to
+            categories.extend(campaign.categories)
+            notes["campaign"] = campaign.name
 
         # KPI extraction:
-        if "average order value" in q or "aov" in q:
-            kpi = "AOV"
-        if "gross margin" in q or "margin" in q:
-            kpi = "GM"
+        kpi = rules.matched_kpi(hits)
+        if kpi is not None and kpi.formula:
+            notes["kpi_formula"] = kpi.formula
 
         # category hints
-        for cat in ["Beverages", "Condiments", "Confections", "Dairy Products", "Produce", "Seafood", "Meat/Poultry", "Grains/Cereals"]:
-            if cat.lower() in q:
-                categories.append(cat)
+        categories.extend(rules.matched_categories(hits))
 
         # de-duplicate
         categories = list(dict.fromkeys(categories))
-        return PlannerOutput(date_from=date_from, date_to=date_to, categories=categories, kpi=kpi, notes=notes)
+        return PlannerOutput(date_from=date_from, date_to=date_to, categories=categories,
+                             kpi=kpi.code if kpi is not None else None, notes=notes)
 
     # --------------------------
     # NL -> SQL generator (pattern-based for the evaluator)
@@ -134,145 +303,138 @@ class RetailAgent:
 
         # 2. SQL: Top 3 Products All Time
         if "top 3 products by total revenue" in q or "all-time" in q:
-            sql = """
-            SELECT P.ProductName AS product,
-                   SUM(OD.UnitPrice * OD.Quantity * (1 - OD.Discount)) AS revenue
-            FROM "Order Details" OD
-            JOIN Products P ON P.ProductID = OD.ProductID
-            GROUP BY P.ProductID
-            ORDER BY revenue DESC
-            LIMIT 3;
-            """
-            return NL2SQLOutput(sql=sql)
+            return self._template("top3_products_by_revenue")
 
         # 3. Hybrid: Summer category with max quantity
         if "summer beverages 1997" in q or "highest total quantity sold" in q:
             df = planner_out.date_from or "1997-06-01"
             dt = planner_out.date_to or "1997-06-30"
-            sql = f"""
-            SELECT C.CategoryName AS category, 
-                   SUM(OD.Quantity) AS quantity
-            FROM Orders O
-            JOIN "Order Details" OD ON OD.OrderID = O.OrderID
-            JOIN Products P ON P.ProductID = OD.ProductID
-            JOIN Categories C ON C.CategoryID = P.CategoryID
-            WHERE date(O.OrderDate) BETWEEN date('{df}') AND date('{dt}')
-            GROUP BY C.CategoryID
-            ORDER BY quantity DESC
-            LIMIT 1;
-            """
-            return NL2SQLOutput(sql=sql)
+            return self._template("top_category_by_quantity", *date_bounds(df, dt))
 
         # 4. Hybrid: Winter AOV 1997
         if "average order value" in q or "aov" in q:
             df = planner_out.date_from or "1997-12-01"
             dt = planner_out.date_to or "1997-12-31"
-            sql = f"""
-            SELECT SUM(OD.UnitPrice * OD.Quantity * (1 - OD.Discount)) * 1.0 
-                   / COUNT(DISTINCT O.OrderID) AS aov
-            FROM Orders O
-            JOIN "Order Details" OD ON OD.OrderID = O.OrderID
-            WHERE date(O.OrderDate) BETWEEN date('{df}') AND date('{dt}');
-            """
-            return NL2SQLOutput(sql=sql)
+            return self._template("aov", *date_bounds(df, dt))
 
         # 5. Hybrid: Revenue from Beverages (Summer)
         if "revenue" in q and "beverages" in q:
             df = planner_out.date_from or "1997-06-01"
             dt = planner_out.date_to or "1997-06-30"
-            sql = f"""
-            SELECT SUM(OD.UnitPrice * OD.Quantity * (1 - OD.Discount)) AS revenue
-            FROM Orders O
-            JOIN "Order Details" OD ON OD.OrderID = O.OrderID
-            JOIN Products P ON P.ProductID = OD.ProductID
-            JOIN Categories C ON C.CategoryID = P.CategoryID
-            WHERE C.CategoryName = 'Beverages'
-              AND date(O.OrderDate) BETWEEN date('{df}') AND date('{dt}');
-            """
-            return NL2SQLOutput(sql=sql)
+            return self._template("category_revenue", "Beverages", *date_bounds(df, dt))
 
         # 6. Hybrid: Gross Margin Best Customer 1997
         if "gross margin" in q or "top customer" in q:
-            sql = """
-            SELECT CU.CompanyName AS customer,
-                   SUM((OD.UnitPrice - 0.7*OD.UnitPrice) * OD.Quantity * (1 - OD.Discount)) AS margin
-            FROM Orders O
-            JOIN "Order Details" OD ON OD.OrderID = O.OrderID
-            JOIN Customers CU ON CU.CustomerID = O.CustomerID
-            WHERE strftime('%Y', O.OrderDate) = '1997'
-            GROUP BY CU.CustomerID
-            ORDER BY margin DESC
-            LIMIT 1;
-            """
-            return NL2SQLOutput(sql=sql)
+            return self._template("top_customer_by_margin", *year_bounds(1997))
 
         # Fallback
         return NL2SQLOutput(sql="")
 
-        # --- BEST CUSTOMER MARGIN ---
-        if "margin" in q or "gross margin" in q or "best customer" in q:
-            sql = """
-            SELECT CU.CompanyName AS customer,
-                   SUM((OD.UnitPrice - (0.7 * OD.UnitPrice))
-                       * OD.Quantity * (1 - OD.Discount)) AS margin
-            FROM Orders O
-            JOIN "Order Details" OD ON OD.OrderID = O.OrderID
-            JOIN Customers CU ON CU.CustomerID = O.CustomerID
-            WHERE strftime('%Y', O.OrderDate) = '1997'
-            GROUP BY CU.CustomerID
-            ORDER BY margin DESC
-            LIMIT 1;
-            """
-            return NL2SQLOutput(sql=sql.strip())
-
-        return NL2SQLOutput(sql="")
+    @staticmethod
+    def _template(template_id: str, *params: Any) -> NL2SQLOutput:
+        return NL2SQLOutput(sql=SQL_TEMPLATES[template_id], template_id=template_id, params=params)
+
+    def _executable(self, nl2sql: NL2SQLOutput) -> str:
+        """
+        Swap in the rollup equivalent of a template while the rollups are fresh;
+        fall back to the raw join when they are missing or stale.
+        """
+        rollup = ROLLUP_TEMPLATES.get(nl2sql.template_id)
+        if rollup and self.use_rollups and db_maintenance.rollups_fresh(self.db):
+            return rollup
+        return nl2sql.sql.strip()
+
+    def _execute(self, sql: str, nl2sql: NL2SQLOutput) -> ExecOutput:
+        """
+        execute_with_repair for the SQL select_sql chose. When that is a rollup, its
+        result is kept only if the base template's float sums cannot rank or round
+        it differently (db_maintenance.rollup_ambiguous); otherwise the base
+        template answers. Rankings are cut to their top row.
+        """
+        out = self.execute_with_repair(sql, nl2sql.params, nl2sql.template_id)
+        base = nl2sql.sql.strip()
+        if sql == base or out.error:
+            return out
+        result = out.as_columnar()
+        if db_maintenance.rollup_ambiguous(nl2sql.template_id, result):
+            fallback = self.execute_with_repair(base, nl2sql.params, nl2sql.template_id)
+            fallback.attempts += out.attempts
+            fallback.fallback_sql = base
+            return fallback
+        if len(result) > 1:
+            out.columnar = ColumnarResult(columns=result.columns, data=[col[:1] for col in result.data],
+                                          truncated=result.truncated)
+        return out
 
     # --------------------------
     # Executor with repair loop (up to two repairs)
     # --------------------------
-    def execute_with_repair(self, sql: str) -> ExecOutput:
+    def execute_with_repair(self, sql: str, params: Tuple[Any, ...] = (), template_id: str = "") -> ExecOutput:
+        """
+        Run `sql`; on failure, run the first rewrite from the repairer that compiles
+        (see SQLRepairer), at most twice. A repair that worked before for this
+        template and SQL is applied up front, so known-bad SQL takes one execution.
+        """
+        original = sql
+        known = self.repairer.known_fix(template_id, sql)
+        sql, repair = known if known is not None else (sql, "")
         attempts = 0
+        first_error = ""
         last_error = ""
+        cancelled = getattr(self._local, "cancelled", None)
         while attempts < 3:
-            cols, rows, err = self.db.execute(sql)
-            if err:
-                last_error = err
-                # simple repair: if quotes in table names cause problems, try removing quotes
-                repaired_sql = sql.replace('"Order Details"', "'Order Details'").replace('"', '')
-                if repaired_sql != sql:
-                    sql = repaired_sql
-                    attempts += 1
-                    continue
-                # try lowercase views
-                if "Order Details" in sql:
-                    sql = sql.replace('"Order Details"', 'order_items')
-                if "Orders" in sql:
-                    sql = sql.replace("Orders", "orders")
-                # attempt again
-                attempts += 1
+            result, err = self.db.execute_columnar(sql, params, max_rows=self.max_rows)
+            attempts += 1
+            if cancelled is not None and cancelled.is_set():
+                # an interrupted query is not a SQL problem to repair
+                raise StageCancelled("execute_with_repair")
+            if not err:
+                if repair and known is None:
+                    self.repairer.remember(template_id, original, first_error, sql, repair)
+                return ExecOutput(columns=result.columns, rows=[], error="", columnar=result,
+                                  attempts=attempts, repair=repair)
+            if is_budget_error(err):
+                # rewording the SQL does not make it cheaper: stop instead of repairing
+                return ExecOutput(columns=[], rows=[], error=err, attempts=attempts)
+            if known is not None:
+                # the remembered repair stopped working (e.g. schema change): start over
+                self.repairer.forget(template_id, original)
+                known = None
+                sql, repair = original, ""
                 continue
-            # success
-            return ExecOutput(columns=cols, rows=rows, error="")
-        return ExecOutput(columns=[], rows=[], error=last_error or "failed after repairs")
+            first_error = first_error or err
+            last_error = err
+            for rule, candidate in self.repairer.candidates(sql, err, template_id):
+                if not self.repairer.validate(candidate, params):
+                    sql, repair = candidate, rule
+                    break
+            else:
+                # no rewrite even compiles; running the same SQL again cannot help
+                break
+        return ExecOutput(columns=[], rows=[], error=last_error or "failed after repairs", attempts=attempts)
 
     # --------------------------
     # Synthesizer (format results & citations)
     # --------------------------
-    def synthesize(self, qid: str, question: str, exec_out: ExecOutput, planner_out: PlannerOutput, retrieved: RetrievalOutput, sql: str) -> SynthOutput:
-        fmt = None
+    @staticmethod
+    def _format_hint(qid: str) -> Optional[str]:
         # derive format_hint from qid input naming
         if "rag_policy_beverages_return_days" in qid:
-            fmt = "int"
+            return "int"
         elif "hybrid_top_category_qty_summer_1997" in qid:
-            fmt = "obj_cat_qty"
+            return "obj_cat_qty"
         elif "hybrid_aov_winter_1997" in qid:
-            fmt = "float2"
+            return "float2"
         elif "sql_top3_products_by_revenue_alltime" in qid:
-            fmt = "list_top3"
+            return "list_top3"
         elif "hybrid_revenue_beverages_summer_1997" in qid:
-            fmt = "float2"
+            return "float2"
         elif "hybrid_best_customer_margin_1997" in qid:
-            fmt = "obj_customer_margin"
+            return "obj_customer_margin"
+        return None
+
+    def synthesize(self, qid: str, question: str, exec_out: ExecOutput, planner_out: Optional[PlannerOutput], retrieved: RetrievalOutput, sql: str) -> SynthOutput:
+        fmt = self._format_hint(qid)
 
         citations = []
         # always include DB tables used (best-effort)
@@ -293,6 +455,7 @@ class RetailAgent:
         final_answer = None
         explanation = ""
         confidence = 0.0
+        result = exec_out.as_columnar()
 
         if fmt == "int":
             # RAG-only: parse docs for beverages return days
@@ -314,10 +477,9 @@ class RetailAgent:
 
         if fmt == "obj_cat_qty":
             # Expect single row with category & quantity
-            if exec_out.rows:
-                row = exec_out.rows[0]
-                cat = row.get("category") or row.get("CategoryName") or row.get("categoryname")
-                qty = int(row.get("quantity") or row.get("quantity") or 0)
+            if len(result):
+                cat = result.get(0, "category", "CategoryName", "categoryname")
+                qty = int(result.get(0, "quantity") or 0)
                 final_answer = {"category": str(cat), "quantity": int(qty)}
                 explanation = "Computed from Orders and Order Details within the summer dates."
                 confidence = 0.85
@@ -328,13 +490,12 @@ class RetailAgent:
             return SynthOutput(final_answer=final_answer, citations=citations, explanation=explanation, confidence=confidence)
 
         if fmt == "float2":
-            if exec_out.rows:
+            if len(result):
                 # some queries return a single numeric column
                 val = None
-                if len(exec_out.rows) == 1:
-                    r = exec_out.rows[0]
+                if len(result) == 1:
                     # pick first numeric value
-                    for v in r.values():
+                    for v in (col[0] for col in result.data):
                         try:
                             val = float(v)
                             break
@@ -356,9 +517,9 @@ class RetailAgent:
         if fmt == "list_top3":
             # expects top 3 products by revenue
             items = []
-            for r in exec_out.rows:
-                prod = r.get("product") or r.get("ProductName") or r.get("productname")
-                rev = float(r.get("revenue") or 0.0)
+            for i in range(len(result)):
+                prod = result.get(i, "product", "ProductName", "productname")
+                rev = float(result.get(i, "revenue") or 0.0)
                 items.append({"product": str(prod), "revenue": round(rev, 2)})
             final_answer = items
             explanation = "Top 3 products by total revenue from Order Details and Products."
@@ -366,10 +527,9 @@ class RetailAgent:
             return SynthOutput(final_answer=final_answer, citations=citations, explanation=explanation, confidence=confidence)
 
         if fmt == "obj_customer_margin":
-            if exec_out.rows:
-                r = exec_out.rows[0]
-                customer = r.get("customer") or r.get("CompanyName") or ""
-                margin = float(r.get("margin") or 0.0)
+            if len(result):
+                customer = result.get(0, "customer", "CompanyName") or ""
+                margin = float(result.get(0, "margin") or 0.0)
                 final_answer = {"customer": str(customer), "margin": round(margin, 2)}
                 explanation = "Computed gross margin using cost approximation of 0.7 * UnitPrice."
                 confidence = 0.85
@@ -385,37 +545,297 @@ class RetailAgent:
     # --------------------------
     # Single-run interface called by runner
     # --------------------------
-    def run_one(self, item: Dict[str, Any]) -> Dict[str, Any]:
+    def run_one(self, item: Dict[str, Any], planned: Optional[StageGraph] = None) -> Dict[str, Any]:
+        """
+        Answer one item. `planned` is the item's stage graph as left by run_batch
+        (batched retrieval, the plan, a shared-scan result); its stages are not run again.
+        """
+        trace = self._new_trace()
+        with trace.span("run_one") as root:
+            output = self._run_stages(item, trace, root, planned)
+        if self.trace:
+            output["trace"] = trace.summary()
+        return output
+
+    def _new_trace(self, export: bool = True):
+        if not self.trace and self.span_exporter is None:
+            return NullTrace()
+        return Trace(exporter=self.span_exporter if export else None)
+
+    def run_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Answer several items, retrieving docs for all that cite them with one
+        retrieve_batch call and, with `shared_scans`, running one shared aggregate
+        per template asked for several date windows. Outputs are identical to
+        calling run_one on each, up to float rounding of shared-scan sums.
+        """
+        self._maybe_refresh_docs()
+        # each item's stages run once: routing, retrieval and planning here, the rest in run_one;
+        # stage spans land in an unexported trace that run_one adopts
+        graphs = [self._stage_graph(it.get("id") or "", it.get("question"), self._new_trace(export=False)) for it in items]
+        # only items whose answer cites doc chunks retrieve (all of them when eager)
+        wanted = [i for i, graph in enumerate(graphs) if not self.lazy or self._cites_docs(graph.get("router"))]
+        if wanted:
+            trace = self._new_trace(export=False)
+            with trace.span("retrieve", batched=len(wanted)):
+                batch = self.retriever.retrieve_batch([items[i].get("question") for i in wanted], k=self.retrieval_k)
+            for i, chunks in zip(wanted, batch):
+                graphs[i].provide("retrieve", RetrievalOutput(chunks=chunks))
+                graphs[i].trace.adopt(trace.spans)
+        if self.shared_scans:
+            self._shared_scans(graphs)
+        return [self.run_one(it, graph) for it, graph in zip(items, graphs)]
+
+    def _shared_scans(self, graphs: List[StageGraph]):
+        """
+        Provide SQL results to the items whose template is asked for two or more
+        date windows in this batch; one shared query per template, traced as each
+        member's execute stage. Rollup-backed templates, other items and failed
+        shared queries are left to the items' own execute stage.
+        """
+        groups: Dict[str, List[Tuple[StageGraph, NL2SQLOutput]]] = {}
+        for graph in graphs:
+            if graph.get("router").route == "rag":
+                continue
+            nl2sql = graph.get("nl_to_sql")
+            if (shared_scan.shareable(nl2sql.template_id, nl2sql.params)
+                    and graph.get("select_sql") == nl2sql.sql.strip()):
+                groups.setdefault(nl2sql.template_id, []).append((graph, nl2sql))
+        for template_id, members in groups.items():
+            calls = list(dict.fromkeys(nl2sql.params for _, nl2sql in members))
+            if len(calls) < 2:
+                # one window: the result cache already shares its query
+                continue
+            trace = self._new_trace(export=False)
+            with trace.span("execute_with_repair", shared=len(members), windows=len(calls)) as span:
+                results, err = shared_scan.run_shared(self.db, template_id, calls)
+                if err:
+                    span.fail(err)
+            if err:
+                continue
+            by_params = dict(zip(calls, results))
+            for graph, nl2sql in members:
+                result = by_params[nl2sql.params]
+                graph.provide("execute_with_repair", ExecOutput(columns=result.columns, rows=[], error="",
+                                                               columnar=result, attempts=1, shared=len(members)))
+                graph.trace.adopt(trace.spans)
+
+    def _stage_graph(self, qid: str, question: str, trace) -> StageGraph:
+        """
+        The run_one pipeline as a graph of stages:
+
+            router ─┬─> planner ─> nl_to_sql ─> select_sql ─> execute_with_repair ─┐
+                    └─> retrieve ───────────────────────────────────────────────> synthesize
+
+        The SQL branch only runs off the rag route, and synthesize only needs
+        retrieval when it cites doc chunks (see `sql_doc_citations`).
+        """
+        graph = StageGraph(trace, getattr(self._local, "cancelled", None))
+
+        def route(v, span):
+            out = self.router(question, qid)
+            span.set("route", out.route)
+            return out
+
+        def retrieve(v, span):
+            out = self.retrieve(question, k=self.retrieval_k)
+            span.set("chunks", len(out.chunks))
+            return out
+
+        def nl_to_sql(v, span):
+            out = self.nl_to_sql(question, v["planner"])
+            span.set("template", out.template_id)
+            return out
+
+        def select_sql(v, span):
+            nl2sql = v["nl_to_sql"]
+            return self._executable(nl2sql) if nl2sql.sql.strip() else ""
+
+        def execute(v, span):
+            nl2sql = v["nl_to_sql"]
+            if not v["select_sql"]:
+                return ExecOutput(columns=[], rows=[], error="no-sql-generated")
+            out = self._execute(v["select_sql"], nl2sql)
+            span.set("attempts", out.attempts)
+            if out.fallback_sql:
+                span.set("rollup_fallback", True)
+            if out.repair:
+                span.set("repair", out.repair)
+            span.set("rows", len(out.as_columnar()))
+            if out.error:
+                span.fail(out.error)
+            return out
+
+        def synthesize(v, span):
+            nl2sql = v.get("nl_to_sql")
+            sql = nl2sql.sql.strip() if nl2sql is not None else ""
+            # RAG-only: no SQL, synthesize from docs
+            exec_out = v.get("execute_with_repair") or ExecOutput(columns=[], rows=[], error="")
+            retrieved = v.get("retrieve") or RetrievalOutput(chunks=[])
+            # citations name the source tables of the template, even when a rollup answered it
+            synth = self.synthesize(qid, question, exec_out, v.get("planner"), retrieved, sql)
+            synth.fallback_sql = exec_out.fallback_sql
+            columnar = exec_out.columnar
+            if columnar is not None and columnar.truncated:
+                synth.explanation += f" Result truncated at {self.max_rows} rows."
+                synth.confidence = min(synth.confidence, 0.5)
+            if is_budget_error(exec_out.error):
+                synth.explanation += f" SQL stopped: {exec_out.error}."
+                synth.confidence = min(synth.confidence, 0.1)
+            return synth
+
+        graph.stage("router", route)
+        graph.stage("retrieve", retrieve)
+        graph.stage("planner", lambda v, span: self.planner(question, v.get("retrieve")))
+        graph.stage("nl_to_sql", nl_to_sql, ["planner"])
+        graph.stage("select_sql", select_sql, ["nl_to_sql"])
+        graph.stage("execute_with_repair", execute, ["nl_to_sql", "select_sql"])
+        graph.stage("synthesize", synthesize, lambda g: self._synthesis_inputs(g.get("router")))
+        return graph
+
+    def _synthesis_inputs(self, route: RouterOutput) -> List[str]:
+        inputs = [] if route.route == "rag" else ["execute_with_repair"]
+        return inputs + (["retrieve"] if self._cites_docs(route) else [])
+
+    def _cites_docs(self, route: RouterOutput) -> bool:
+        return self.sql_doc_citations or route.route != "sql"
+
+    def _run_stages(self, item: Dict[str, Any], trace, root, planned: Optional[StageGraph] = None) -> Dict[str, Any]:
         qid = item.get("id") or ""
 
         question = item.get("question")
-        route = self.router(question, qid)
-
-        # retrieve docs
-        retrieved = self.retrieve(question, k=5)
-
-        planner_out = self.planner(question, retrieved)
-
-        sql = ""
-        exec_out = ExecOutput(columns=[], rows=[], error="")
-        if route.route == "rag":
-            # RAG-only: no SQL, synthesize from docs
-            sql = ""
+        if planned is None:
+            self._maybe_refresh_docs()
+            graph = self._stage_graph(qid, question, trace)
         else:
-            nl2sql = self.nl_to_sql(question, planner_out)
-            sql = nl2sql.sql.strip()
-            if sql:
-                exec_out = self.execute_with_repair(sql)
-            else:
-                exec_out = ExecOutput(columns=[], rows=[], error="no-sql-generated")
-
-        synth = self.synthesize(qid, question, exec_out, planner_out, retrieved, sql)
+            # stages already run by run_batch keep their values and spans
+            trace.adopt(planned.trace.spans)
+            planned.trace = trace
+            graph = planned
+            executed = graph.values.get("execute_with_repair")
+            if executed is not None and executed.shared:
+                root.set("shared_scan", executed.shared)
+        if not self.lazy:
+            # eager order of the original pipeline: every stage runs
+            graph.run(["router", "retrieve", "planner"])
+            if graph.values["router"].route != "rag":
+                graph.run(["nl_to_sql", "select_sql", "execute_with_repair"])
+
+        docs_version = self.docs_version
+        plan = None
+        if self.memo is not None:
+            id_route = self._id_route(qid)
+            # retrieval settings shape the plan's chunks; agents sharing a memo_path may differ
+            plan_key = (normalize_question(question), id_route.route if id_route else None,
+                        self.retrieval_k, self.chunking)
+            plan = self.memo.get("plan", plan_key, docs_version)
+            if plan is not None:
+                for name, value in plan.items():
+                    graph.provide(name, value)
+                root.set("memo", "plan")
+
+        route = graph.get("router")
+        nl2sql = graph.get("nl_to_sql") if route.route != "rag" else None
+        exec_sql = graph.get("select_sql") if nl2sql is not None else ""
+        synth = None
+        if self.memo is not None:
+            chunks = graph.get("retrieve").chunks if self._cites_docs(route) else []
+            answer_key = (self._format_hint(qid), route.route, nl2sql.template_id if nl2sql else "",
+                          nl2sql.params if nl2sql else (), nl2sql.sql.strip() if nl2sql else "", exec_sql,
+                          tuple(c["chunk_id"] for c in chunks), self.max_rows)
+            answer_version = f"{docs_version}:{self.db.file_version()}"
+            if plan is None:
+                self.memo.put("plan", plan_key, docs_version,
+                              graph.snapshot(["router", "retrieve", "planner", "nl_to_sql"]))
+            synth = self.memo.get("answer", answer_key, answer_version)
+        if synth is not None:
+            root.set("memo", "answer")
+        else:
+            synth = graph.get("synthesize")
+            exec_out = graph.values.get("execute_with_repair") or ExecOutput(columns=[], rows=[], error="")
+            root.set("sql_attempts", exec_out.attempts)
+            root.set("rows", len(exec_out.as_columnar()))
+            # failed executions are not memoized, the next run retries them
+            if self.memo is not None and exec_out.error in ("", "no-sql-generated"):
+                self.memo.put("answer", answer_key, answer_version, copy.deepcopy(synth))
+        root.set("route", route.route)
+        if "retrieve" in graph.values:
+            root.set("chunks", len(graph.values["retrieve"].chunks))
         output = {
             "id": qid,
-            "final_answer": synth.final_answer,
-            "sql": sql,
+            "final_answer": copy.deepcopy(synth.final_answer) if self.memo is not None else synth.final_answer,
+            "sql": synth.fallback_sql or exec_sql,
+            # values bound to the `?` placeholders of `sql`, in order
+            "params": list(nl2sql.params) if nl2sql is not None and exec_sql else [],
             "confidence": synth.confidence,
             "explanation": synth.explanation,
-            "citations": synth.citations
+            "citations": list(synth.citations)
         }
         return output
+
+    # --------------------------
+    # Asyncio interface
+    # --------------------------
+    def _limiter(self) -> "asyncio.Semaphore":
+        import asyncio
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = self._limiters[loop] = asyncio.Semaphore(self.async_concurrency)
+        return limiter
+
+    def _run_cancellable(self, item: Dict[str, Any], cancelled: threading.Event,
+                         thread_ids: List[int]) -> Dict[str, Any]:
+        thread_ids.append(threading.get_ident())
+        self._local.cancelled = cancelled
+        try:
+            return self.run_one(item)
+        finally:
+            self._local.cancelled = None
+
+    async def arun_one(self, item: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Non-blocking run_one: the pipeline runs on the agent's bounded executor
+        while the event loop stays free. On `timeout` (asyncio.TimeoutError) or
+        task cancellation, the running SQLite query is interrupted and no further
+        stage starts; the request keeps its concurrency slot until its worker
+        thread has actually stopped.
+        """
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.async_concurrency,
+                                                thread_name_prefix="retail-agent")
+        loop = asyncio.get_running_loop()
+        async with self._limiter():
+            cancelled = threading.Event()
+            thread_ids: List[int] = []
+            fut = loop.run_in_executor(self._executor, self._run_cancellable, item, cancelled, thread_ids)
+            try:
+                return await asyncio.wait_for(asyncio.shield(fut), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                cancelled.set()
+                for thread_id in thread_ids:
+                    self.db.interrupt(thread_id)
+                try:
+                    await asyncio.shield(fut)
+                except (StageCancelled, asyncio.CancelledError):
+                    pass
+                raise
+
+    async def arun_batch(self, items: List[Dict[str, Any]], timeout: Optional[float] = None,
+                         return_exceptions: bool = False) -> List[Any]:
+        """
+        Run many items concurrently (bounded by `async_concurrency`), in input order.
+        `timeout` applies per item; with `return_exceptions`, failed items yield
+        their exception instead of aborting the batch (as in asyncio.gather).
+        """
+        import asyncio
+        return await asyncio.gather(*(self.arun_one(it, timeout) for it in items),
+                                    return_exceptions=return_exceptions)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.db.close()
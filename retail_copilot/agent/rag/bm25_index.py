@@ -0,0 +1,292 @@
+import heapq
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+class BM25Index:
+    """
+    Inverted-index BM25 (Okapi) scorer.
+
+    Postings are stored term-major in flat arrays (CSR layout): the postings of
+    term `t` live in `post_docs[offsets[t]:offsets[t + 1]]` with matching term
+    frequencies in `post_tfs`. IDF values and per-document length norms are
+    precomputed, so a query only touches the postings of its own terms.
+
+    Scores are identical to `rank_bm25.BM25Okapi.get_scores` (same IDF floor,
+    same floating point evaluation order).
+
+    Documents can be added and removed in place. Touched postings are copied into
+    `overlay` (the flat arrays may be a read-only mmap) and removed documents are
+    tombstoned in `deleted`; `refresh_stats` then recomputes N, avgdl, norms and IDF
+    without re-tokenizing the rest of the corpus.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocab: Dict[str, int] = {}
+        self.offsets = array("Q", [0])
+        self.post_docs = array("I")
+        self.post_tfs = array("I")
+        self.doc_len = array("I")
+        self.idf = array("d")
+        self.norms = array("d")
+        self.avgdl = 0.0
+        # backing mmap when the arrays are views into an on-disk artifact
+        self.buffer = None
+        # incremental updates: term id -> replacement (docs, tfs), and removed doc ids
+        self.overlay: Dict[int, Tuple[array, array]] = {}
+        self.deleted: Set[int] = set()
+
+    @classmethod
+    def build(cls, corpus: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75,
+              epsilon: float = 0.25) -> "BM25Index":
+        """
+        Build an index from tokenized documents. Term ids are assigned in order of
+        first occurrence, which matches the vocabulary order rank_bm25 uses.
+        """
+        index = cls(k1=k1, b=b, epsilon=epsilon)
+        vocab = index.vocab
+        term_docs: List[array] = []
+        term_tfs: List[array] = []
+        for doc_id, tokens in enumerate(corpus):
+            index.doc_len.append(len(tokens))
+            frequencies: Dict[str, int] = {}
+            for tok in tokens:
+                frequencies[tok] = frequencies.get(tok, 0) + 1
+            for tok, tf in frequencies.items():
+                t = vocab.get(tok)
+                if t is None:
+                    t = vocab[tok] = len(term_docs)
+                    term_docs.append(array("I"))
+                    term_tfs.append(array("I"))
+                term_docs[t].append(doc_id)
+                term_tfs[t].append(tf)
+
+        for docs, tfs in zip(term_docs, term_tfs):
+            index.post_docs.extend(docs)
+            index.post_tfs.extend(tfs)
+            index.offsets.append(len(index.post_docs))
+        index._compute_stats()
+        return index
+
+    @staticmethod
+    def partial(corpus: Iterable[Sequence[str]]) -> Tuple[List[str], array, array, array, array]:
+        """
+        Postings of one shard of documents, with shard-local doc ids:
+        (terms in order of first occurrence, offsets, post_docs, post_tfs, doc_len),
+        the CSR layout of `build`. Shards are combined by `merge`.
+        """
+        vocab: Dict[str, int] = {}
+        term_docs: List[array] = []
+        term_tfs: List[array] = []
+        doc_len = array("I")
+        for doc_id, tokens in enumerate(corpus):
+            doc_len.append(len(tokens))
+            frequencies: Dict[str, int] = {}
+            for tok in tokens:
+                frequencies[tok] = frequencies.get(tok, 0) + 1
+            for tok, tf in frequencies.items():
+                t = vocab.get(tok)
+                if t is None:
+                    t = vocab[tok] = len(term_docs)
+                    term_docs.append(array("I"))
+                    term_tfs.append(array("I"))
+                term_docs[t].append(doc_id)
+                term_tfs[t].append(tf)
+        offsets = array("Q", [0])
+        post_docs = array("I")
+        post_tfs = array("I")
+        for docs, tfs in zip(term_docs, term_tfs):
+            post_docs.extend(docs)
+            post_tfs.extend(tfs)
+            offsets.append(len(post_docs))
+        return list(vocab), offsets, post_docs, post_tfs, doc_len
+
+    @classmethod
+    def merge(cls, parts: Sequence[Tuple[List[str], array, array, array, array]], k1: float = 1.5,
+              b: float = 0.75, epsilon: float = 0.25) -> "BM25Index":
+        """
+        Index over the shards of `partial`, concatenated in order. Term ids follow
+        first occurrence across the shards and postings stay in doc id order, so the
+        result is identical to `build` over the whole corpus.
+        """
+        index = cls(k1=k1, b=b, epsilon=epsilon)
+        vocab = index.vocab
+        # global term id -> (shard, local term id) in shard order
+        term_refs: List[List[Tuple[int, int]]] = []
+        bases = []
+        for p, (terms, _, _, _, doc_len) in enumerate(parts):
+            bases.append(len(index.doc_len))
+            index.doc_len.extend(doc_len)
+            for lt, tok in enumerate(terms):
+                t = vocab.get(tok)
+                if t is None:
+                    t = vocab[tok] = len(term_refs)
+                    term_refs.append([])
+                term_refs[t].append((p, lt))
+        for refs in term_refs:
+            for p, lt in refs:
+                _, offsets, docs, tfs, _ = parts[p]
+                start, end = offsets[lt], offsets[lt + 1]
+                base = bases[p]
+                shard_docs = docs[start:end]
+                index.post_docs.extend(array("I", (d + base for d in shard_docs)) if base else shard_docs)
+                index.post_tfs.extend(tfs[start:end])
+            index.offsets.append(len(index.post_docs))
+        index._compute_stats()
+        return index
+
+    def _compute_stats(self):
+        """
+        Derive average length, length norms and floored IDF from the postings.
+        Terms whose postings became empty are left out of the IDF average, as
+        they would be absent from a fresh build.
+        """
+        n_docs = len(self)
+        self.avgdl = sum(self.doc_len) / n_docs if n_docs else 0.0
+        k1, b, avgdl = self.k1, self.b, self.avgdl
+        self.norms = array("d", (k1 * (1 - b + b * dl / avgdl) for dl in self.doc_len)) if n_docs else array("d")
+
+        idf = array("d", bytes(8 * len(self.vocab)))
+        idf_sum = 0
+        n_present = 0
+        negative = []
+        for t in range(len(self.vocab)):
+            freq = self._df(t)
+            if not freq:
+                continue
+            value = math.log(n_docs - freq + 0.5) - math.log(freq + 0.5)
+            idf[t] = value
+            idf_sum += value
+            n_present += 1
+            if value < 0:
+                negative.append(t)
+        # rank_bm25 floors negative IDF values at epsilon * average IDF
+        eps = self.epsilon * (idf_sum / n_present) if n_present else 0.0
+        for t in negative:
+            idf[t] = eps
+        self.idf = idf
+
+    def refresh_stats(self):
+        """
+        Recompute corpus statistics after add_document/remove_document calls.
+        """
+        self._compute_stats()
+
+    def __len__(self) -> int:
+        return len(self.doc_len) - len(self.deleted)
+
+    # --------------------------
+    # Postings access / incremental updates
+    # --------------------------
+    def _df(self, t: int) -> int:
+        if t in self.overlay:
+            return len(self.overlay[t][0])
+        if t + 1 < len(self.offsets):
+            return self.offsets[t + 1] - self.offsets[t]
+        return 0
+
+    def postings(self, t: int) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        Return the (doc ids, term frequencies) postings of term id `t`.
+        """
+        if t in self.overlay:
+            return self.overlay[t]
+        if t + 1 < len(self.offsets):
+            start, end = self.offsets[t], self.offsets[t + 1]
+            return self.post_docs[start:end], self.post_tfs[start:end]
+        return (), ()
+
+    def _mutable_postings(self, t: int) -> Tuple[array, array]:
+        if t not in self.overlay:
+            docs, tfs = self.postings(t)
+            self.overlay[t] = (array("I", docs), array("I", tfs))
+        return self.overlay[t]
+
+    def add_document(self, tokens: Sequence[str]) -> int:
+        """
+        Append a document and return its doc id. Call refresh_stats() afterwards.
+        """
+        if not isinstance(self.doc_len, array):
+            self.doc_len = array("I", self.doc_len)
+        doc_id = len(self.doc_len)
+        self.doc_len.append(len(tokens))
+        frequencies: Dict[str, int] = {}
+        for tok in tokens:
+            frequencies[tok] = frequencies.get(tok, 0) + 1
+        for tok, tf in frequencies.items():
+            t = self.vocab.get(tok)
+            if t is None:
+                t = self.vocab[tok] = len(self.vocab)
+            docs, tfs = self._mutable_postings(t)
+            docs.append(doc_id)
+            tfs.append(tf)
+        return doc_id
+
+    def remove_document(self, doc_id: int, tokens: Iterable[str]):
+        """
+        Tombstone a document, dropping it from the postings of its `tokens`.
+        Call refresh_stats() afterwards.
+        """
+        if doc_id in self.deleted:
+            return
+        for tok in set(tokens):
+            t = self.vocab.get(tok)
+            if t is None:
+                continue
+            docs, tfs = self._mutable_postings(t)
+            i = docs.index(doc_id)
+            del docs[i]
+            del tfs[i]
+        if not isinstance(self.doc_len, array):
+            self.doc_len = array("I", self.doc_len)
+        self.doc_len[doc_id] = 0
+        self.deleted.add(doc_id)
+
+    def score(self, query_tokens: Sequence[str]) -> Dict[int, float]:
+        """
+        Term-at-a-time scoring. Returns doc_id -> score for documents that contain
+        at least one query term; every other document scores 0.0.
+        """
+        acc: Dict[int, float] = {}
+        kp1 = self.k1 + 1
+        norms = self.norms
+        for tok in query_tokens:
+            t = self.vocab.get(tok)
+            if t is None:
+                continue
+            idf = self.idf[t]
+            docs, tfs = self.postings(t)
+            for d, tf in zip(docs, tfs):
+                acc[d] = acc.get(d, 0.0) + idf * (tf * kp1 / (tf + norms[d]))
+        return acc
+
+    def top_k(self, query_tokens: Sequence[str], k: int, rank: Optional[Sequence[int]] = None,
+              order: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Return the k best (doc_id, score) pairs, highest score first and ties in
+        document order, exactly like sorting the full rank_bm25 score vector.
+
+        After incremental updates doc ids no longer follow corpus order; callers
+        then pass `rank` (doc id -> corpus position) and `order` (live doc ids in
+        corpus order) so ties resolve as they would in a fresh build.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        acc = self.score(query_tokens)
+        candidates = list(acc.items())
+        # unmatched documents still score 0.0 and can fill (or outrank) the top k
+        padded = 0
+        for d in (order if order is not None else range(len(self.doc_len))):
+            if padded == k:
+                break
+            if d not in acc and d not in self.deleted:
+                candidates.append((d, 0.0))
+                padded += 1
+        if rank is None:
+            return heapq.nsmallest(k, candidates, key=lambda c: (-c[1], c[0]))
+        return heapq.nsmallest(k, candidates, key=lambda c: (-c[1], rank[c[0]]))
@@ -0,0 +1,123 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.rag.bm25_index import BM25Index
+
+
+class BM25Matrix:
+    """
+    Term-document matrix of precomputed BM25 weights for batched scoring.
+
+    Rows are terms in CSR layout (`indptr`, `indices` = doc ids, `weights`), with
+    `weights = idf * tf * (k1 + 1) / (tf + norm)` evaluated exactly like
+    `BM25Index.score`. A block of queries is scored as one sparse product: the
+    postings of every query term are gathered into flat (query, doc, weight)
+    arrays and summed with `np.bincount`, which accumulates in input order, so
+    scores are bit-identical to the per-query path. Top-k uses `argpartition`
+    and then orders the candidates by score and corpus position.
+    """
+
+    # dense score block size (queries x docs) kept under this many float64 cells
+    BLOCK_CELLS = 1 << 24
+    # below this many live docs per-query retrieval is faster (see top_k_batch)
+    MIN_DOCS = 100
+
+    def __init__(self, vocab, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray,
+                 n_docs: int, order: Optional[np.ndarray] = None):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.n_docs = n_docs
+        # live doc ids in corpus order; None means every doc id, in id order
+        self.order = order
+
+    @classmethod
+    def from_index(cls, index: BM25Index, order: Optional[Sequence[int]] = None) -> "BM25Matrix":
+        n_terms = len(index.vocab)
+        if index.overlay:
+            lengths = np.fromiter((index._df(t) for t in range(n_terms)), dtype=np.int64, count=n_terms)
+            indptr = np.zeros(n_terms + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[1:])
+            indices = np.empty(int(indptr[-1]), dtype=np.int64)
+            tfs = np.empty(int(indptr[-1]), dtype=np.float64)
+            for t in range(n_terms):
+                docs, term_tfs = index.postings(t)
+                indices[indptr[t]:indptr[t + 1]] = docs
+                tfs[indptr[t]:indptr[t + 1]] = term_tfs
+        else:
+            indptr = np.frombuffer(index.offsets, dtype=np.uint64).astype(np.int64)
+            indices = np.frombuffer(index.post_docs, dtype=np.uint32).astype(np.int64)
+            tfs = np.frombuffer(index.post_tfs, dtype=np.uint32).astype(np.float64)
+
+        idf = np.frombuffer(index.idf, dtype=np.float64)
+        norms = np.frombuffer(index.norms, dtype=np.float64)
+        term_of = np.repeat(np.arange(n_terms), np.diff(indptr)) if n_terms else np.zeros(0, dtype=np.int64)
+        weights = idf[term_of] * (tfs * (index.k1 + 1) / (tfs + norms[indices]))
+        if order is None and index.deleted:
+            order = [d for d in range(len(index.doc_len)) if d not in index.deleted]
+        order_arr = None if order is None else np.asarray(order, dtype=np.int64)
+        return cls(index.vocab, indptr, indices, weights, len(index.doc_len), order_arr)
+
+    def _score_block(self, queries: Sequence[Sequence[str]]) -> np.ndarray:
+        """
+        Dense (len(queries) x n_docs) score block for tokenized queries.
+        """
+        rows, starts, ends = [], [], []
+        for qi, tokens in enumerate(queries):
+            for tok in tokens:
+                t = self.vocab.get(tok)
+                if t is None:
+                    continue
+                rows.append(qi)
+                starts.append(self.indptr[t])
+                ends.append(self.indptr[t + 1])
+        n_cells = len(queries) * self.n_docs
+        if not rows:
+            return np.zeros((len(queries), self.n_docs))
+        starts_arr = np.asarray(starts, dtype=np.int64)
+        lengths = np.asarray(ends, dtype=np.int64) - starts_arr
+        # flat positions of every gathered posting, query term by query term
+        total = int(lengths.sum())
+        seg_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.repeat(starts_arr, lengths) + (np.arange(total) - seg_start)
+        cells = np.repeat(np.asarray(rows, dtype=np.int64) * self.n_docs, lengths) + self.indices[positions]
+        scores = np.bincount(cells, weights=self.weights[positions], minlength=n_cells)
+        return scores.reshape(len(queries), self.n_docs)
+
+    def top_k_batch(self, queries: Sequence[Sequence[str]], k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Best (doc_id, score) pairs per tokenized query, highest score first and ties
+        in corpus order, exactly as BM25Index.top_k returns them.
+
+        Each query costs a full row of n_docs cells, so on small corpora this loses
+        to BM25Index.top_k, which only walks postings. Measured per query (64
+        distinct questions): 0.058 vs 0.040 ms at 34 chunks, 0.055 vs 0.066 ms at
+        155, 0.051 vs 0.100 ms at 397, 0.080 vs 0.269 ms at 1.2k and 0.33 vs 2.3 ms
+        at 12k. The crossover lies between 34 and 155 chunks, so
+        BM25Retriever.retrieve_batch scores per query below MIN_DOCS (100) live
+        docs. It moves with the machine; re-measure (bench_suite.py micro) before
+        relying on it.
+        """
+        n_live = self.n_docs if self.order is None else len(self.order)
+        k = min(k, n_live)
+        if k <= 0:
+            return [[] for _ in queries]
+        block = max(1, self.BLOCK_CELLS // max(self.n_docs, 1))
+        results: List[List[Tuple[int, float]]] = []
+        for start in range(0, len(queries), block):
+            scores = self._score_block(queries[start:start + block])
+            if self.order is not None:
+                # columns in corpus order; deleted docs drop out
+                scores = scores[:, self.order]
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, cand in zip(scores, part):
+                kth = row[cand].min()
+                above = np.flatnonzero(row > kth)
+                ties = np.flatnonzero(row == kth)[:k - len(above)]
+                pos = np.concatenate([above, ties])
+                pos = pos[np.lexsort((pos, -row[pos]))]
+                doc_ids = pos if self.order is None else self.order[pos]
+                results.append([(int(d), float(s)) for d, s in zip(doc_ids, row[pos])])
+        return results
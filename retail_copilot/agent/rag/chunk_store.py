@@ -0,0 +1,189 @@
+from array import array
+from collections.abc import Sequence
+from typing import Iterable, List, Optional, Set, Tuple
+
+
+class DocumentChunk:
+    __slots__ = ("chunk_id", "source", "text")
+
+    def __init__(self, chunk_id: str, source: str, text: str):
+        self.chunk_id = chunk_id
+        self.source = source
+        self.text = text
+
+    @property
+    def tokens(self) -> List[str]:
+        return self.text.lower().split()
+
+
+def chunk_id(filename: str, num: int) -> str:
+    return f"{filename.replace('.md','')}::chunk{num}"
+
+
+def split_chunks(content: str, chunk_size: int) -> List[str]:
+    """
+    Chunk texts of a markdown file: every non-empty line (paragraph) is cut into
+    windows of `chunk_size` whitespace tokens, joined by single spaces.
+    """
+    texts = []
+    paragraphs = [p.strip() for p in content.split("\n") if p.strip()]
+    for para in paragraphs:
+        tokens = para.split()
+        for i in range(0, len(tokens), chunk_size):
+            window = tokens[i : i + chunk_size]
+            texts.append(" ".join(window))
+    return texts
+
+
+def split_sections(content: str, chunk_size: int) -> List[str]:
+    """
+    Heading-aware chunk texts: every markdown section (a heading and the lines up
+    to the next heading) becomes one chunk, cut into windows of `chunk_size` body
+    tokens when longer. Each chunk starts with the headings above it ("# Title
+    ## Section"), so it can be read, and matched, on its own. Headings without a
+    body of their own only appear as context of their subsections.
+    """
+    texts = []
+    path: List[Tuple[int, str]] = []
+    body: List[str] = []
+
+    def flush():
+        if not body:
+            return
+        prefix = [heading for _, heading in path]
+        for i in range(0, len(body), chunk_size):
+            texts.append(" ".join(prefix + body[i:i + chunk_size]))
+        body.clear()
+
+    for line in content.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        level = len(line) - len(line.lstrip("#"))
+        if 0 < level <= 6 and line[level:level + 1] == " ":
+            flush()
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, " ".join(line.split())))
+        else:
+            body.extend(line.split())
+    flush()
+    return texts
+
+
+# chunking mode -> splitter(content, chunk_size)
+CHUNKERS = {"lines": split_chunks, "sections": split_sections}
+
+
+class ChunkStore(Sequence):
+    """
+    Compact chunk list. Per chunk only three integers are kept (file id, chunk
+    number within the file, end offset of its text); all chunk texts live in one
+    UTF-8 buffer and DocumentChunk objects are materialized on access. Token lists
+    are never stored: the BM25 postings already hold the interned term ids.
+
+    The buffers are either growable (`array` / `bytearray`) or read-only views into
+    an index artifact (see index_store.load); `mutable()` copies the latter before
+    the first update. Removed chunks are tombstoned (`store[d] = None`) and read
+    back as None, so doc ids stay stable until `select` renumbers them.
+    """
+
+    def __init__(self, files: Optional[List[str]] = None, chunk_file=None, chunk_num=None,
+                 text_offsets=None, text=None):
+        self.files: List[str] = files if files is not None else []
+        self.chunk_file = chunk_file if chunk_file is not None else array("I")
+        self.chunk_num = chunk_num if chunk_num is not None else array("I")
+        self.text_offsets = text_offsets if text_offsets is not None else array("Q", [0])
+        self.text = text if text is not None else bytearray()
+        self.deleted: Set[int] = set()
+        self._file_ids = {fn: i for i, fn in enumerate(self.files)}
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[DocumentChunk]) -> "ChunkStore":
+        store = cls()
+        for chunk in chunks:
+            store.append(chunk)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.chunk_file)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx in self.deleted:
+            return None
+        filename = self.files[self.chunk_file[idx]]
+        return DocumentChunk(chunk_id(filename, self.chunk_num[idx]), filename, self.text_at(idx))
+
+    def __setitem__(self, idx: int, value: None):
+        if value is not None:
+            raise ValueError("chunks can only be removed (set to None), not replaced")
+        self.deleted.add(idx if idx >= 0 else idx + len(self))
+
+    def text_at(self, idx: int) -> str:
+        return str(self.text[self.text_offsets[idx]:self.text_offsets[idx + 1]], "utf-8")
+
+    def source_at(self, idx: int) -> str:
+        return self.files[self.chunk_file[idx]]
+
+    def tokens_at(self, idx: int) -> List[str]:
+        return self.text_at(idx).lower().split()
+
+    def append(self, chunk: DocumentChunk):
+        self.add(chunk.source, int(chunk.chunk_id.rsplit("::chunk", 1)[1]), chunk.text)
+
+    def add(self, filename: str, num: int, text: str):
+        file_id = self._file_ids.get(filename)
+        if file_id is None:
+            file_id = self._file_ids[filename] = len(self.files)
+            self.files.append(filename)
+        self.chunk_file.append(file_id)
+        self.chunk_num.append(num)
+        self.text += text.encode("utf-8")
+        self.text_offsets.append(len(self.text))
+
+    def extend_encoded(self, file_chunks: List[Tuple[str, int]], text: bytes, text_ends: Iterable[int]):
+        """
+        Append already encoded chunks: `file_chunks` lists (filename, number of
+        chunks) in order, `text` holds their texts back to back and `text_ends`
+        the end offset of each one within `text`.
+        """
+        base = len(self.text)
+        for filename, count in file_chunks:
+            file_id = self._file_ids.get(filename)
+            if file_id is None:
+                file_id = self._file_ids[filename] = len(self.files)
+                self.files.append(filename)
+            self.chunk_file.extend([file_id] * count)
+            self.chunk_num.extend(range(count))
+        self.text += text
+        self.text_offsets.extend(base + end for end in text_ends)
+
+    def mutable(self) -> "ChunkStore":
+        """
+        This store if its buffers are growable, else a growable copy.
+        """
+        if isinstance(self.text, bytearray):
+            return self
+        store = ChunkStore(list(self.files), array("I", self.chunk_file), array("I", self.chunk_num),
+                           array("Q", self.text_offsets), bytearray(self.text))
+        store.deleted = set(self.deleted)
+        return store
+
+    def select(self, order: Iterable[int]) -> "ChunkStore":
+        """
+        New store holding the chunks `order` names, in that order (renumbered from 0).
+        """
+        store = ChunkStore()
+        for d in order:
+            store.add(self.source_at(d), self.chunk_num[d], self.text_at(d))
+        return store
+
+    def nbytes(self) -> int:
+        """
+        Size of the buffers (not counting the file name list).
+        """
+        return sum(memoryview(buf).nbytes for buf in (self.chunk_file, self.chunk_num, self.text_offsets, self.text))
@@ -0,0 +1,127 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.rag.bm25_index import BM25Index
+from agent.rag.chunk_store import ChunkStore
+
+# Single-file artifact layout:
+#   MAGIC | u32 format version | u64 header length | JSON header | 8-byte aligned sections
+# Every section is a flat array (or raw bytes), so loading is an mmap plus a few
+# zero-copy memoryview casts.
+MAGIC = b"RCBM25\x00\x00"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sIQ")
+
+_INDEX_ARRAYS = ("offsets", "post_docs", "post_tfs", "doc_len", "idf", "norms")
+
+
+def save(path: str, index: BM25Index, chunks: Sequence, files: List[str], meta: Dict[str, Any]):
+    """
+    Write the index and chunk metadata to `path` atomically (temp file + rename),
+    so concurrent workers never observe a half-written artifact.
+    """
+    store = chunks if isinstance(chunks, ChunkStore) and not chunks.deleted else ChunkStore.from_chunks(chunks)
+    # file ids follow `files`, the order the store assigned them in may differ
+    file_ids = {fn: i for i, fn in enumerate(files)}
+    remap = array("I", [file_ids[fn] for fn in store.files])
+    chunk_file = array("I", (remap[f] for f in store.chunk_file))
+    vocab = "\n".join(index.vocab).encode("utf-8")
+
+    sections: List[Tuple[str, bytes, str]] = [
+        (name, getattr(index, name).tobytes(), getattr(index, name).typecode) for name in _INDEX_ARRAYS
+    ]
+    sections += [
+        ("chunk_file", chunk_file.tobytes(), "I"),
+        ("chunk_num", bytes(memoryview(store.chunk_num).cast("B")), "I"),
+        ("text_offsets", bytes(memoryview(store.text_offsets).cast("B")), "Q"),
+        ("text", bytes(store.text), "B"),
+        ("vocab", vocab, "B"),
+    ]
+
+    header = dict(meta)
+    header.update({
+        "files": files,
+        "n_terms": len(index.vocab),
+        "avgdl": index.avgdl,
+        "params": {"k1": index.k1, "b": index.b, "epsilon": index.epsilon},
+        "sections": {},
+    })
+    # section offsets are relative to the (aligned) end of the header
+    pos = 0
+    for name, data, typecode in sections:
+        header["sections"][name] = [pos, len(data), typecode]
+        pos += _align(len(data))
+    header_bytes = json.dumps(header).encode("utf-8")
+    base = _align(_PREFIX.size + len(header_bytes))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".bm25_index.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\x00" * (base - _PREFIX.size - len(header_bytes)))
+            for _, data, _ in sections:
+                f.write(data)
+                f.write(b"\x00" * (_align(len(data)) - len(data)))
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def load(path: str, expected: Dict[str, Any]) -> Optional[Tuple[BM25Index, ChunkStore]]:
+    """
+    Memory-map an artifact written by `save`. Returns None when the file is missing,
+    unreadable, from another format version, or when any key in `expected`
+    (content hash, chunk size, ...) differs from what was stored.
+    """
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        magic, version, header_len = _PREFIX.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        header = json.loads(mm[_PREFIX.size:_PREFIX.size + header_len])
+    except (struct.error, ValueError):
+        return None
+    if any(header.get(key) != value for key, value in expected.items()):
+        return None
+
+    base = _align(_PREFIX.size + header_len)
+    view = memoryview(mm)
+    arrays = {}
+    for name, (offset, length, typecode) in header["sections"].items():
+        section = view[base + offset:base + offset + length]
+        arrays[name] = section if typecode == "B" else section.cast(typecode)
+
+    params = header["params"]
+    index = BM25Index(k1=params["k1"], b=params["b"], epsilon=params["epsilon"])
+    for name in _INDEX_ARRAYS:
+        setattr(index, name, arrays[name])
+    index.avgdl = header["avgdl"]
+    terms = str(arrays["vocab"], "utf-8").split("\n") if header["n_terms"] else []
+    index.vocab = dict(zip(terms, range(len(terms))))
+    # keep the mapping alive for as long as the index references it
+    index.buffer = mm
+
+    # read-only views into the mapping; chunks are materialized on access
+    chunks = ChunkStore(header["files"], arrays["chunk_file"], arrays["chunk_num"],
+                        arrays["text_offsets"], arrays["text"])
+    return index, chunks
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
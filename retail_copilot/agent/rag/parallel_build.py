@@ -0,0 +1,63 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from agent.rag.bm25_index import BM25Index
+from agent.rag.chunk_store import CHUNKERS, ChunkStore
+
+# shards per worker: smaller shards even out files of very different sizes
+SHARDS_PER_WORKER = 4
+
+
+def shard_files(doc_texts: Dict[str, str], n_shards: int) -> List[List[Tuple[str, str]]]:
+    """
+    Split (filename, content) pairs, in corpus order, into at most `n_shards`
+    contiguous shards of roughly equal text size.
+    """
+    items = list(doc_texts.items())
+    total = sum(len(content) for _, content in items) or 1
+    shards: List[List[Tuple[str, str]]] = [[]]
+    size = 0
+    for filename, content in items:
+        if shards[-1] and size >= total * len(shards) / n_shards:
+            shards.append([])
+        shards[-1].append((filename, content))
+        size += len(content)
+    return shards
+
+
+def _build_shard(shard: List[Tuple[str, str]], chunk_size: int, chunking: str):
+    """
+    Worker: chunk and tokenize the files of one shard. Returns (filename, chunk
+    count) pairs, the encoded chunk texts with their end offsets, and the shard's
+    partial postings.
+    """
+    file_chunks = []
+    text = bytearray()
+    text_ends = array("Q")
+    corpus = []
+    split = CHUNKERS[chunking]
+    for filename, content in shard:
+        texts = split(content, chunk_size)
+        file_chunks.append((filename, len(texts)))
+        for chunk_text in texts:
+            text += chunk_text.encode("utf-8")
+            text_ends.append(len(text))
+            corpus.append(chunk_text.lower().split())
+    return file_chunks, bytes(text), text_ends, BM25Index.partial(corpus)
+
+
+def parallel_build(doc_texts: Dict[str, str], chunk_size: int, workers: int,
+                   chunking: str = "lines") -> Tuple[BM25Index, ChunkStore]:
+    """
+    Chunk, tokenize and index `doc_texts` on a pool of `workers` processes. Shards
+    are merged in corpus order, so chunk ids and every index array are identical
+    to the serial build.
+    """
+    shards = shard_files(doc_texts, workers * SHARDS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_build_shard, shards, [chunk_size] * len(shards), [chunking] * len(shards)))
+    chunks = ChunkStore()
+    for file_chunks, text, text_ends, _ in results:
+        chunks.extend_encoded(file_chunks, text, text_ends)
+    return BM25Index.merge([part for _, _, _, part in results]), chunks
@@ -1,66 +1,391 @@
+import hashlib
 import os
-from typing import List, Dict, Any
-from rank_bm25 import BM25Okapi
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 
+from agent.rag import index_store
+from agent.rag.bm25_index import BM25Index
+from agent.rag.chunk_store import CHUNKERS, ChunkStore, DocumentChunk, chunk_id
 
-class DocumentChunk:
-    def __init__(self, chunk_id: str, source: str, text: str):
-        self.chunk_id = chunk_id
-        self.source = source
-        self.text = text
-        self.tokens = text.lower().split()
+DEFAULT_CHUNK_SIZE = 80
+
+
+# --------------------------
+# Docs folder
+# --------------------------
+def list_documents(docs_path: str) -> Dict[str, Tuple[int, int]]:
+    """
+    (mtime_ns, size) of every markdown file in `docs_path`, by filename.
+    """
+    stats = {}
+    for filename in sorted(os.listdir(docs_path)):
+        if not filename.endswith(".md"):
+            continue
+        st = os.stat(os.path.join(docs_path, filename))
+        stats[filename] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def read_document(docs_path: str, filename: str) -> str:
+    with open(os.path.join(docs_path, filename), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def text_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def docs_content_hash(doc_hashes: Dict[str, str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      chunking: str = "lines") -> str:
+    """
+    Version of a docs corpus and the chunking applied to it (BM25Retriever.content_hash).
+    """
+    digest = hashlib.sha256(f"chunk_size={chunk_size}\n".encode("utf-8"))
+    if chunking != "lines":
+        digest.update(f"chunking={chunking}\n".encode("utf-8"))
+    for filename in sorted(doc_hashes):
+        digest.update(f"{filename}\0{doc_hashes[filename]}\n".encode("utf-8"))
+    return digest.hexdigest()
 
 
 class BM25Retriever:
     """
     BM25 retriever over docs/ directory. Builds chunks of each md file.
+
+    engine="inverted" (default) scores through the postings of the query terms only;
+    engine="rank_bm25" scores every chunk with rank_bm25 and is kept for comparison.
+
+    With `index_path`, the inverted index and chunk table are persisted to a single
+    memory-mapped artifact and reopened on the next start instead of being rebuilt.
+    The artifact is keyed on a hash of the docs/ contents, so any edit rebuilds it.
+    The raw markdown is kept in `doc_texts` for callers that need full documents.
+    With `build_workers > 1`, a fresh index is chunked, tokenized and indexed on a
+    process pool (see parallel_build); the result is identical to the serial build.
+    Chunks live in a compact ChunkStore (one text buffer plus integer arrays).
+    chunking="lines" (default) cuts every line into `chunk_size`-token windows;
+    chunking="sections" keeps each markdown section, with its headings, together.
+
+    Results are cached (LRU of `cache_size` queries, 0 disables) per query token
+    multiset and k; any index change drops the cache. Query terms are scored in
+    sorted order, so every permutation of a query gets the same scores.
+
+    Single files can be added, replaced or removed in place (`add_document`,
+    `replace_document`, `remove_document`); only that file's chunks and postings
+    are touched before the corpus statistics are refreshed. `refresh()` polls
+    docs/ (mtime/size, then content hash) and applies whatever changed.
     """
 
-    def __init__(self, docs_path: str, chunk_size: int = 80):
+    def __init__(self, docs_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, engine: str = "inverted",
+                 index_path: Optional[str] = None, build_workers: int = 1, chunking: str = "lines",
+                 cache_size: int = 1024):
+        if engine not in ("inverted", "rank_bm25"):
+            raise ValueError(f"unknown BM25 engine: {engine}")
+        if chunking not in CHUNKERS:
+            raise ValueError(f"unknown chunking: {chunking}")
         self.docs_path = docs_path
         self.chunk_size = chunk_size
-        self.chunks: List[DocumentChunk] = []
-        self._load_documents()
-        self._build_index()
+        self.chunking = chunking
+        self.engine = engine
+        self.index_path = index_path
+        self.chunks = ChunkStore()
+        self.doc_texts: Dict[str, str] = {}
+        self.doc_hashes: Dict[str, str] = {}
+        # bumped on every index change, so callers can invalidate derived state
+        self.generation = 0
+        self._doc_stats: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.RLock()
+        # filename -> doc ids, plus canonical ordering once updates were applied
+        self._file_docs: Optional[Dict[str, List[int]]] = None
+        self._rank: Optional[array] = None
+        self._order: Optional[array] = None
+        # BM25Matrix for retrieve_batch, rebuilt lazily when `generation` changes
+        self._matrix = None
+        self._matrix_generation = -1
+        # (sorted query tokens, k) -> results, valid for `_cache_generation`
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[Tuple[str, ...], int], List[Dict[str, Any]]]" = OrderedDict()
+        self._cache_generation = 0
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self._read_documents()
+
+        if index_path and engine == "inverted" and self._open_index():
+            return
+        if build_workers > 1 and engine == "inverted" and len(self.doc_texts) > 1:
+            # imported here: the process pool machinery is only needed to build
+            from agent.rag.parallel_build import parallel_build
+            self.index, self.chunks = parallel_build(self.doc_texts, chunk_size, build_workers, chunking)
+            self.bm25 = None
+            if len(self.chunks) == 0:
+                self.index = None
+        else:
+            self._load_documents()
+            self._build_index()
+        if index_path and self.index is not None:
+            index_store.save(index_path, self.index, self.chunks, list(self.doc_texts), self._index_meta())
+
+    def _list_documents(self) -> Dict[str, Tuple[int, int]]:
+        return list_documents(self.docs_path)
+
+    def _read_file(self, filename: str) -> str:
+        return read_document(self.docs_path, filename)
+
+    def _read_documents(self):
+        self._doc_stats = self._list_documents()
+        for filename in self._doc_stats:
+            content = self._read_file(filename)
+            self.doc_texts[filename] = content
+            self.doc_hashes[filename] = text_hash(content)
+        self._update_content_hash()
+
+    def _update_content_hash(self):
+        self.content_hash = docs_content_hash(self.doc_hashes, self.chunk_size, self.chunking)
+
+    def _index_meta(self) -> Dict[str, Any]:
+        return {"content_hash": self.content_hash, "chunk_size": self.chunk_size}
+
+    def _open_index(self) -> bool:
+        loaded = index_store.load(self.index_path, self._index_meta())
+        if loaded is None:
+            return False
+        self.index, self.chunks = loaded
+        self.bm25 = None
+        return True
 
     def _load_documents(self):
-        for filename in sorted(os.listdir(self.docs_path)):
-            if not filename.endswith(".md"):
-                continue
-            full_path = os.path.join(self.docs_path, filename)
-            with open(full_path, "r", encoding="utf-8") as f:
-                content = f.read()
-            paragraphs = [p.strip() for p in content.split("\n") if p.strip()]
-            chunk_counter = 0
-            for para in paragraphs:
-                tokens = para.split()
-                for i in range(0, len(tokens), self.chunk_size):
-                    window = tokens[i : i + self.chunk_size]
-                    text_chunk = " ".join(window)
-                    chunk_id = f"{filename.replace('.md','')}::chunk{chunk_counter}"
-                    self.chunks.append(DocumentChunk(chunk_id, filename, text_chunk))
-                    chunk_counter += 1
+        for filename, content in self.doc_texts.items():
+            for num, text_chunk in enumerate(self._chunk_texts(content)):
+                self.chunks.add(filename, num, text_chunk)
+
+    def _chunk_texts(self, content: str) -> List[str]:
+        return CHUNKERS[self.chunking](content, self.chunk_size)
+
+    def _chunk_document(self, filename: str, content: str) -> List[DocumentChunk]:
+        return [DocumentChunk(chunk_id(filename, num), filename, text_chunk)
+                for num, text_chunk in enumerate(self._chunk_texts(content))]
 
     def _build_index(self):
-        corpus = [chunk.tokens for chunk in self.chunks]
-        if len(corpus) == 0:
-            self.bm25 = None
+        # tokens are re-derived from the stored text, one chunk at a time
+        corpus = (self.chunks.tokens_at(d) for d in range(len(self.chunks)))
+        self.bm25 = None
+        self.index = None
+        if len(self.chunks) == 0:
+            return
+        if self.engine == "rank_bm25":
+            from rank_bm25 import BM25Okapi
+            self.bm25 = BM25Okapi(list(corpus))
         else:
-            self.bm25 = BM25Okapi(corpus)
+            self.index = BM25Index.build(corpus)
+
+    # --------------------------
+    # Incremental updates
+    # --------------------------
+    def add_document(self, filename: str, content: Optional[str] = None):
+        """
+        Index (or re-index) one markdown file. Reads it from docs/ when `content` is None.
+        """
+        with self._lock:
+            if content is None:
+                content = self._read_file(filename)
+            if filename in self.doc_texts:
+                self._drop_chunks(filename)
+            new_chunks = self._chunk_texts(content)
+            self.doc_texts[filename] = content
+            self.doc_hashes[filename] = text_hash(content)
+            file_docs = self._mutable_chunks()
+            if self.engine == "inverted" and self.index is None:
+                self.index = BM25Index()
+            file_docs[filename] = []
+            for num, text_chunk in enumerate(new_chunks):
+                if self.engine == "inverted":
+                    self.index.add_document(text_chunk.lower().split())
+                file_docs[filename].append(len(self.chunks))
+                self.chunks.add(filename, num, text_chunk)
+            self._after_update()
+
+    def replace_document(self, filename: str, content: Optional[str] = None):
+        self.add_document(filename, content)
+
+    def remove_document(self, filename: str):
+        with self._lock:
+            if filename not in self.doc_texts:
+                return
+            self._mutable_chunks()
+            self._drop_chunks(filename)
+            del self.doc_texts[filename]
+            del self.doc_hashes[filename]
+            del self._file_docs[filename]
+            self._after_update()
+
+    def refresh(self) -> List[str]:
+        """
+        Poll docs/ and apply added, edited and deleted files. Files whose mtime/size
+        changed but whose content hash did not are skipped. Returns changed filenames.
+        """
+        with self._lock:
+            stats = self._list_documents()
+            changed = []
+            for filename, stat in stats.items():
+                if self._doc_stats.get(filename) == stat:
+                    continue
+                content = self._read_file(filename)
+                if self.doc_hashes.get(filename) != text_hash(content):
+                    self.add_document(filename, content)
+                    changed.append(filename)
+            for filename in [fn for fn in self.doc_texts if fn not in stats]:
+                self.remove_document(filename)
+                changed.append(filename)
+            self._doc_stats = stats
+            return changed
+
+    def compact(self):
+        """
+        Renumber chunks in corpus order and rebuild the index from the in-memory
+        chunks (docs/ is not re-read), then persist it when `index_path` is set.
+        """
+        with self._lock:
+            if self._file_docs is not None:
+                self.chunks = self.chunks.select(self._order)
+                self._file_docs = None
+                self._rank = None
+                self._order = None
+            self._build_index()
+            if self.index_path and self.index is not None:
+                index_store.save(self.index_path, self.index, self.chunks, list(self.doc_texts), self._index_meta())
+            self.generation += 1
+
+    def _mutable_chunks(self) -> Dict[str, List[int]]:
+        """
+        Switch to an editable chunk list and per-file doc id lists before the first update.
+        """
+        if self._file_docs is None:
+            self.chunks = self.chunks.mutable()
+            self._file_docs = {}
+            for d in range(len(self.chunks)):
+                self._file_docs.setdefault(self.chunks.source_at(d), []).append(d)
+        return self._file_docs
+
+    def _drop_chunks(self, filename: str):
+        for d in self._mutable_chunks().get(filename, []):
+            if self.engine == "inverted" and self.index is not None:
+                self.index.remove_document(d, self.chunks.tokens_at(d))
+            self.chunks[d] = None
+        self._file_docs[filename] = []
+
+    def _after_update(self):
+        self._update_content_hash()
+        # corpus order is filename order, then chunk order within each file
+        self._order = array("I")
+        for filename in sorted(self._file_docs):
+            self._order.extend(self._file_docs[filename])
+        self._rank = array("I", bytes(4 * len(self.chunks)))
+        for pos, d in enumerate(self._order):
+            self._rank[d] = pos
+        if self.engine != "inverted":
+            self.compact()
+        elif self.index is not None:
+            # None while no file has had a chunk (empty docs/ or empty files only)
+            self.index.refresh_stats()
+        self.generation += 1
+
+    # --------------------------
+    # Retrieval
+    # --------------------------
+    @staticmethod
+    def _query_key(query: str) -> Tuple[str, ...]:
+        # the token multiset, as sorted tokens; also the order terms are scored in
+        return tuple(sorted(query.lower().split()))
+
+    def _cache_get(self, key: Tuple[Tuple[str, ...], int]) -> Optional[List[Dict[str, Any]]]:
+        if self.cache_size <= 0:
+            return None
+        if self._cache_generation != self.generation:
+            self._cache.clear()
+            self._cache_generation = self.generation
+        results = self._cache.get(key)
+        if results is None:
+            self.cache_stats["misses"] += 1
+            return None
+        self._cache.move_to_end(key)
+        self.cache_stats["hits"] += 1
+        return [dict(r) for r in results]
+
+    def _cache_put(self, key: Tuple[Tuple[str, ...], int], results: List[Dict[str, Any]]):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = [dict(r) for r in results]
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
     def retrieve(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        if not self.bm25:
-            return []
-        tokens = query.lower().split()
-        scores = self.bm25.get_scores(tokens)
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+        tokens = self._query_key(query)
+        with self._lock:
+            cached = self._cache_get((tokens, k))
+            if cached is not None:
+                return cached
+            results = self._retrieve(tokens, k)
+            self._cache_put((tokens, k), results)
+        return results
+
+    def _retrieve(self, tokens: Tuple[str, ...], k: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self.index is not None:
+                top = self.index.top_k(tokens, k, rank=self._rank, order=self._order)
+            elif self.bm25 is not None:
+                scores = self.bm25.get_scores(tokens)
+                top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+                top = [(idx, scores[idx]) for idx in top_indices]
+            else:
+                return []
+            chunks = [self.chunks[idx] for idx, _ in top]
+        return self._results(chunks, top)
+
+    def retrieve_batch(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve for many queries at once; same results as calling `retrieve` on
+        each. With the inverted engine, NumPy installed and at least
+        BM25Matrix.MIN_DOCS chunks, the whole batch is scored as one sparse matrix
+        product (see BM25Matrix); otherwise this falls back to one `retrieve` call
+        per query.
+        """
+        if self.engine != "inverted":
+            return [self.retrieve(q, k) for q in queries]
+        try:
+            from agent.rag.bm25_matrix import BM25Matrix
+        except ImportError:
+            return [self.retrieve(q, k) for q in queries]
+        keys = [self._query_key(q) for q in queries]
+        with self._lock:
+            if self.index is None:
+                return [[] for _ in queries]
+            if len(self.index) < BM25Matrix.MIN_DOCS:
+                return [self.retrieve(q, k) for q in queries]
+            results: List[Optional[List[Dict[str, Any]]]] = [self._cache_get((key, k)) for key in keys]
+            # score each distinct missed query once
+            missed = list(dict.fromkeys(key for key, res in zip(keys, results) if res is None))
+            if missed:
+                if self._matrix is None or self._matrix_generation != self.generation:
+                    self._matrix = BM25Matrix.from_index(self.index, order=self._order)
+                    self._matrix_generation = self.generation
+                tops = self._matrix.top_k_batch(missed, k)
+                fresh = {}
+                for key, top in zip(missed, tops):
+                    fresh[key] = self._results([self.chunks[idx] for idx, _ in top], top)
+                    self._cache_put((key, k), fresh[key])
+                results = [res if res is not None else [dict(r) for r in fresh[key]]
+                           for key, res in zip(keys, results)]
+        return results
+
+    @staticmethod
+    def _results(chunks: List[DocumentChunk], top: List[Tuple[int, float]]) -> List[Dict[str, Any]]:
         results = []
-        for idx in top_indices:
-            chunk = self.chunks[idx]
+        for chunk, (_, score) in zip(chunks, top):
             results.append({
                 "chunk_id": chunk.chunk_id,
                 "source": chunk.source,
                 "text": chunk.text,
-                "score": float(scores[idx])
+                "score": float(score)
             })
         return results
@@ -0,0 +1,249 @@
+import calendar
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# Keyword rules for RetailAgent.router / planner. All keywords are compiled into
+# one Aho-Corasick automaton, so a question is scanned once however many
+# campaigns, categories and KPIs the docs define; the rules below are then
+# plain set lookups on the matched keywords.
+
+CATEGORIES = ["Beverages", "Condiments", "Confections", "Dairy Products", "Produce", "Seafood",
+              "Meat/Poultry", "Grains/Cereals"]
+
+# (route, reason, groups): the rule fires when every group has a keyword in the
+# question. First matching rule wins; "@campaign" stands for any campaign keyword.
+ROUTER_RULES: List[Tuple[str, str, List[Tuple[str, ...]]]] = [
+    ("sql", "top 3 aggregate", [("top 3",)]),
+    ("hybrid", "aov hybrid", [("average order value", "aov")]),
+    ("hybrid", "margin hybrid", [("gross margin", "margin")]),
+    ("hybrid", "date-based hybrid", [("summer", "winter", "@campaign")]),
+    ("rag", "policy hybrid", [("return",), ("beverage",)]),
+]
+
+# extra question keywords per KPI code, besides the names in kpi_definitions.md
+KPI_ALIASES: Dict[str, List[str]] = {"GM": ["margin"]}
+
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_ISO_RANGE = re.compile(r"(\d{4}-\d{2}-\d{2})\s*(?:to|–|—|-)\s*(\d{4}-\d{2}-\d{2})")
+# "June 1–30, 1997", "June 1 – July 15, 1997", "June 1, 1997 to June 30, 1997"
+_TEXT_RANGE = re.compile(r"([A-Za-z]+)\s+(\d{1,2})(?:,\s*(\d{4}))?\s*(?:to|–|—|-)\s*"
+                         r"(?:([A-Za-z]+)\s+)?(\d{1,2}),\s*(\d{4})")
+_SECTION = re.compile(r"^##\s+(.+?)\s*$", re.MULTILINE)
+
+
+@dataclass
+class Campaign:
+    name: str
+    date_from: Optional[str]
+    date_to: Optional[str]
+    categories: List[str] = field(default_factory=list)
+
+
+@dataclass
+class KPI:
+    name: str
+    code: str
+    formula: str = ""
+    keywords: List[str] = field(default_factory=list)
+
+
+# used when the docs do not define them (same values the planner always had)
+DEFAULT_CAMPAIGNS = [
+    Campaign("Summer Beverages 1997", "1997-06-01", "1997-06-30", ["Beverages"]),
+    Campaign("Winter Classics 1997", "1997-12-01", "1997-12-31", ["Dairy Products", "Confections"]),
+]
+DEFAULT_KPIS = [
+    KPI("Average Order Value", "AOV", "", ["average order value", "aov"]),
+    KPI("Gross Margin", "GM", "", ["gross margin"]),
+]
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: `find(text)` returns every keyword occurring in
+    `text` as a substring (same as `kw in text` for each keyword) in one pass.
+    Failure links are folded into a full transition table, so each character
+    costs one dict lookup.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+        for kw in set(keywords):
+            if kw:
+                self._insert(kw)
+        self._link()
+
+    def _insert(self, keyword: str):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += (keyword,)
+
+    def _link(self):
+        # breadth-first: a state's failure link is the longest proper suffix in the
+        # trie, and its transitions are those of its failure state plus its own
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])] + [{} for _ in self._goto[1:]]
+        todo = deque(self._goto[0].values())
+        while todo:
+            state = todo.popleft()
+            self._delta[state] = {**self._delta[self._fail[state]], **self._goto[state]}
+            for ch, nxt in self._goto[state].items():
+                todo.append(nxt)
+                self._fail[nxt] = self._delta[self._fail[state]].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Set[str]:
+        delta, out = self._delta, self._out
+        found: Set[str] = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+# --------------------------
+# Doc parsing
+# --------------------------
+def _sections(text: str) -> List[Tuple[str, str]]:
+    heads = list(_SECTION.finditer(text))
+    return [(m.group(1), text[m.end():heads[i + 1].start() if i + 1 < len(heads) else len(text)])
+            for i, m in enumerate(heads)]
+
+
+def _categories_in(text: str) -> List[str]:
+    low = text.lower()
+    found = [(low.find(cat.lower()), cat) for cat in CATEGORIES if cat.lower() in low]
+    return [cat for _, cat in sorted(found)]
+
+
+def parse_date_range(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    First date range in `text` as ISO (date_from, date_to), inclusive.
+    """
+    m = _ISO_RANGE.search(text)
+    if m:
+        return m.group(1), m.group(2)
+    for m in _TEXT_RANGE.finditer(text):
+        month1, day1, year1, month2, day2, year2 = m.groups()
+        start_month = _MONTHS.get(month1.lower())
+        end_month = _MONTHS.get(month2.lower()) if month2 else start_month
+        if start_month and end_month:
+            return (f"{year1 or year2}-{start_month:02d}-{int(day1):02d}",
+                    f"{year2}-{end_month:02d}-{int(day2):02d}")
+    return None, None
+
+
+def parse_campaigns(text: str) -> List[Campaign]:
+    """
+    `## Name` sections of marketing_calendar.md that state a date range. The
+    categories named in the title, else those in the section body.
+    """
+    campaigns = []
+    for title, body in _sections(text):
+        date_from, date_to = parse_date_range(body)
+        if date_from is None:
+            continue
+        campaigns.append(Campaign(title, date_from, date_to, _categories_in(title) or _categories_in(body)))
+    return campaigns
+
+
+def parse_kpis(text: str) -> List[KPI]:
+    """
+    `## Name (ABBR)` sections of kpi_definitions.md with their `CODE = ...` formula.
+    """
+    kpis = []
+    for title, body in _sections(text):
+        m = re.match(r"(.+?)\s*\((\w+)\)\s*$", title)
+        name, abbr = (m.group(1), m.group(2)) if m else (title, "")
+        formula = re.search(r"^\s*(\w+)\s*=\s*(.+?)\s*$", body, re.MULTILINE)
+        code = formula.group(1) if formula else abbr or "".join(w[0] for w in name.split()).upper()
+        keywords = [name.lower()] + ([abbr.lower()] if abbr else [])
+        kpis.append(KPI(name, code, formula.group(0).strip() if formula else "", keywords))
+    return kpis
+
+
+class RuleEngine:
+    """
+    Router and planner rules compiled from the docs: campaigns (name -> date
+    range, categories) from marketing_calendar.md and KPIs (name -> code,
+    formula) from kpi_definitions.md, plus the category names. Built once per
+    docs version.
+    """
+
+    def __init__(self, doc_texts: Dict[str, str]):
+        self.campaigns = self._merge(DEFAULT_CAMPAIGNS, parse_campaigns(doc_texts.get("marketing_calendar.md", "")))
+        self.kpis = self._merge(DEFAULT_KPIS, parse_kpis(doc_texts.get("kpi_definitions.md", "")))
+        # keyword -> index into campaigns / kpis / CATEGORIES
+        self.campaign_keys: Dict[str, int] = {}
+        for i, campaign in enumerate(self.campaigns):
+            name = campaign.name.lower()
+            for kw in (name, re.sub(r"\s+\d{4}$", "", name)):
+                self.campaign_keys.setdefault(kw, i)
+        for i, campaign in enumerate(self.campaigns):
+            # the first word ("summer") names the first campaign that starts with it
+            self.campaign_keys.setdefault(campaign.name.lower().split()[0], i)
+        self.kpi_keys: Dict[str, int] = {}
+        for i, kpi in enumerate(self.kpis):
+            for kw in kpi.keywords + KPI_ALIASES.get(kpi.code, []):
+                self.kpi_keys.setdefault(kw, i)
+        self.category_keys = {cat.lower(): i for i, cat in enumerate(CATEGORIES)}
+        self.router_rules = [(route, reason, [self._expand(group) for group in groups])
+                             for route, reason, groups in ROUTER_RULES]
+        keywords = set(self.campaign_keys) | set(self.kpi_keys) | set(self.category_keys)
+        for _, _, groups in self.router_rules:
+            for group in groups:
+                keywords.update(group)
+        self.automaton = KeywordAutomaton(keywords)
+        # router and planner scan the same question: keep recent scans
+        self._hits: Dict[str, FrozenSet[str]] = {}
+
+    @staticmethod
+    def _merge(defaults, parsed):
+        # parsed entries replace defaults of the same name; document order is kept
+        names = {p.name.lower() for p in parsed}
+        return [d for d in defaults if d.name.lower() not in names] + parsed
+
+    def _expand(self, group: Tuple[str, ...]) -> Set[str]:
+        words = set(group) - {"@campaign"}
+        if "@campaign" in group:
+            words.update(self.campaign_keys)
+        return words
+
+    def match(self, question: str) -> FrozenSet[str]:
+        q = question.lower()
+        hits = self._hits.get(q)
+        if hits is None:
+            if len(self._hits) >= 1024:
+                self._hits.clear()
+            hits = self._hits[q] = frozenset(self.automaton.find(q))
+        return hits
+
+    def route(self, hits: FrozenSet[str]) -> Optional[Tuple[str, str]]:
+        for route, reason, groups in self.router_rules:
+            if all(not hits.isdisjoint(group) for group in groups):
+                return route, reason
+        return None
+
+    def matched_campaigns(self, hits: FrozenSet[str]) -> List[Campaign]:
+        return [self.campaigns[i] for i in sorted({self.campaign_keys[h] for h in hits if h in self.campaign_keys})]
+
+    def matched_kpi(self, hits: FrozenSet[str]) -> Optional[KPI]:
+        # several KPIs named: the one defined last wins
+        found = [self.kpi_keys[h] for h in hits if h in self.kpi_keys]
+        return self.kpis[max(found)] if found else None
+
+    def matched_categories(self, hits: FrozenSet[str]) -> List[str]:
+        return [CATEGORIES[i] for i in sorted(self.category_keys[h] for h in hits if h in self.category_keys)]
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+# Warm agent server: one long-lived RetailAgent answers requests from many
+# short-lived clients, so imports, SQLite connections and the BM25 index are
+# paid once. The protocol is JSON lines over a Unix socket or a localhost TCP
+# port: every request line is a batch item ({"id", "question", ...}) and gets
+# one response line, its run_one output, in request order per connection.
+# Clients may pipeline: requests are read and answered concurrently while the
+# responses are still written in order. A line with an "op" key is a control
+# request instead: {"op": "ping"} or {"op": "stats"}.
+
+Address = Union[str, Tuple[str, int]]
+
+# requests read ahead per connection (answered or in flight, not yet written)
+DEFAULT_PIPELINE = 64
+# longest request line accepted; a longer one gets an error and ends the connection
+LINE_LIMIT = 2 ** 24
+
+
+def parse_address(address: str) -> Address:
+    """
+    "HOST:PORT" or ":PORT" for TCP, anything else is a Unix socket path.
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class AgentServer:
+    """
+    Serves `agent` (a RetailAgent) on `address` until `stop()`.
+
+    Requests run through `agent.arun_one`, so at most `agent.async_concurrency`
+    are answered at once on the agent's bounded executor and `timeout` interrupts
+    a request's running query. A request that is malformed (no "question"
+    string), fails or times out gets {"id": ..., "error": ...} as its response.
+    """
+
+    def __init__(self, agent, address: Address, timeout: Optional[float] = None,
+                 pipeline: int = DEFAULT_PIPELINE, line_limit: int = LINE_LIMIT):
+        self.agent = agent
+        self.address = address
+        self.timeout = timeout
+        self.pipeline = max(pipeline, 1)
+        self.line_limit = line_limit
+        self.stats = {"connections": 0, "requests": 0, "errors": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if isinstance(self.address, tuple):
+            host, port = self.address
+            self._server = await asyncio.start_server(self._serve, host, port, limit=self.line_limit)
+        else:
+            if os.path.exists(self.address):
+                # left over by a server that did not shut down cleanly
+                os.unlink(self.address)
+            self._server = await asyncio.start_unix_server(self._serve, self.address, limit=self.line_limit)
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    # --------------------------
+    # Connections
+    # --------------------------
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        # answers in request order; the bound makes a fast client wait for slow answers
+        pending: "asyncio.Queue[Optional[asyncio.Future]]" = asyncio.Queue(self.pipeline)
+        responder = asyncio.ensure_future(self._respond(pending, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await pending.put(asyncio.ensure_future(self._answer(line)))
+        except (asyncio.LimitOverrunError, ValueError):
+            # the stream cannot be resynchronized: answer in order, then close
+            self.stats["errors"] += 1
+            error = asyncio.get_running_loop().create_future()
+            error.set_result({"error": f"request line longer than {self.line_limit} bytes"})
+            await pending.put(error)
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def _respond(self, pending: "asyncio.Queue[Optional[asyncio.Future]]", writer: asyncio.StreamWriter):
+        broken = False
+        while True:
+            task = await pending.get()
+            if task is None:
+                return
+            response = await task
+            if broken:
+                continue
+            try:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+            except ConnectionError:
+                # the client went away: finish what is queued, drop the answers
+                broken = True
+
+    async def _answer(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+        except ValueError as exc:
+            self.stats["errors"] += 1
+            return {"error": f"invalid JSON: {exc}"}
+        if not isinstance(request, dict):
+            self.stats["errors"] += 1
+            return {"error": "request must be a JSON object"}
+        if "op" in request:
+            return self._control(request)
+        if not isinstance(request.get("question"), str):
+            self.stats["errors"] += 1
+            return {"id": request.get("id"), "error": "missing question"}
+        if request.get("id") is not None and not isinstance(request["id"], str):
+            self.stats["errors"] += 1
+            return {"id": request["id"], "error": "id must be a string"}
+        self.stats["requests"] += 1
+        try:
+            return await self.agent.arun_one(request, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["errors"] += 1
+            return {"id": request.get("id"), "error": f"timed out after {self.timeout}s"}
+        except Exception as exc:
+            self.stats["errors"] += 1
+            return {"id": request.get("id"), "error": f"{type(exc).__name__}: {exc}"}
+
+    def _control(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request["op"]
+        if op == "ping":
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, "stats": dict(self.stats), "sql_cache": self.agent.db.cache_info()}
+        return {"error": f"unknown op: {op}"}
+
+
+# --------------------------
+# Client
+# --------------------------
+class AgentClient:
+    """
+    Blocking client for AgentServer. `stream(items)` pipelines: up to `window`
+    requests are sent ahead of the responses, which come back in request order.
+    """
+
+    def __init__(self, address: Address, timeout: Optional[float] = None):
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self._reader = self.sock.makefile("rb")
+
+    def request(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return list(self.stream([item], window=1))[0]
+
+    def stream(self, items: Iterable[Dict[str, Any]], window: int = DEFAULT_PIPELINE) -> Iterator[Dict[str, Any]]:
+        slots = threading.Semaphore(max(window, 1))
+        # one token per request sent, None once the sender is done
+        outstanding: "queue.Queue[Optional[bool]]" = queue.Queue()
+        errors = []
+
+        def send():
+            try:
+                for item in items:
+                    slots.acquire()
+                    self.sock.sendall(json.dumps(item).encode("utf-8") + b"\n")
+                    outstanding.put(True)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                outstanding.put(None)
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        while outstanding.get() is not None:
+            line = self._reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            slots.release()
+            yield json.loads(line)
+        sender.join()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+    def __enter__(self) -> "AgentClient":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,94 @@
+from typing import Any, List, Sequence, Tuple
+
+from agent.dspy_signatures import ColumnarResult
+from agent.sql_templates import SHARED_CONDITIONS, SHARED_DATE_PARAM, SHARED_MEASURES, SHARED_TEMPLATES
+from agent.tools.sqlite_tool import SQLiteTool
+
+# Shared scans for batches. Questions of one template that differ only in their
+# params (one campaign window each) would scan Orders ⋈ "Order Details" once
+# per question. Instead, one query from SHARED_TEMPLATES scans the range
+# covering all their windows and computes every call's aggregate side by side,
+# each over the rows matching that call's condition; the per-call results are
+# then cut out of its columns. Fact-table scans grow with the number of
+# templates in a batch, not with the number of questions.
+
+# calls per shared query: each one adds a CASE per scanned row
+MAX_SHARED_CALLS = 32
+
+
+def window(template_id: str, params: Sequence[Any]) -> Tuple[Any, Any]:
+    """
+    The (date_from, date_to) params of a template call, date_to exclusive.
+    """
+    i = SHARED_DATE_PARAM[template_id]
+    return params[i], params[i + 1]
+
+
+def shareable(template_id: str, params: Sequence[Any]) -> bool:
+    if template_id not in SHARED_TEMPLATES:
+        return False
+    lo, hi = window(template_id, params)
+    return isinstance(lo, str) and isinstance(hi, str)
+
+
+def shared_query(template_id: str, params_list: List[Sequence[Any]]) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    The shared query for the calls in `params_list` (column w{i} for call i) and
+    its params.
+    """
+    measure = SHARED_MEASURES[template_id].format(cond=SHARED_CONDITIONS[template_id])
+    # the condition binds the call's params each time it occurs in the measure
+    repeats = SHARED_MEASURES[template_id].count("{cond}")
+    columns = ",\n       ".join(f"{measure} AS w{i}" for i in range(len(params_list)))
+    params: List[Any] = []
+    for call in params_list:
+        params.extend(tuple(call) * repeats)
+    windows = [window(template_id, call) for call in params_list]
+    params.extend((min(lo for lo, _ in windows), max(hi for _, hi in windows)))
+    return SHARED_TEMPLATES[template_id].format(measures=columns), tuple(params)
+
+
+def split(template_id: str, shared: ColumnarResult, i: int) -> ColumnarResult:
+    """
+    The result the template itself returns for call `i`, from the shared query's rows.
+    """
+    values = shared.column(f"w{i}")
+    if template_id == "top_category_by_quantity":
+        return _top(shared.column("category"), values, "category", "quantity")
+    if template_id == "top_customer_by_margin":
+        return _top(shared.column("customer"), values, "customer", "margin")
+    if template_id == "aov":
+        return ColumnarResult(columns=["aov"], data=[values])
+    if template_id == "category_revenue":
+        return ColumnarResult(columns=["revenue"], data=[values])
+    raise KeyError(template_id)
+
+
+def _top(labels: Sequence[Any], values: Sequence[Any], label: str, value: str) -> ColumnarResult:
+    # ORDER BY value DESC LIMIT 1 over the groups with rows in the window (value not
+    # NULL); rows come in group key order and the first of tied groups wins
+    best = None
+    for j, v in enumerate(values):
+        if v is not None and (best is None or v > values[best]):
+            best = j
+    if best is None:
+        return ColumnarResult(columns=[label, value], data=[(), ()])
+    return ColumnarResult(columns=[label, value], data=[(labels[best],), (values[best],)])
+
+
+def run_shared(db: SQLiteTool, template_id: str,
+               params_list: List[Sequence[Any]]) -> Tuple[List[ColumnarResult], str]:
+    """
+    Answer every call of `template_id` in `params_list`, MAX_SHARED_CALLS calls
+    per query. Returns the per-call results in order, or ([], error) if a query
+    failed.
+    """
+    results: List[ColumnarResult] = []
+    for start in range(0, len(params_list), MAX_SHARED_CALLS):
+        calls = params_list[start:start + MAX_SHARED_CALLS]
+        sql, params = shared_query(template_id, calls)
+        shared, err = db.execute_columnar(sql, params)
+        if err:
+            return [], err
+        results.extend(split(template_id, shared, i) for i in range(len(calls)))
+    return results, ""
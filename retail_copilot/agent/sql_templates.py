@@ -0,0 +1,196 @@
+from datetime import date, timedelta
+from typing import Dict, Tuple
+
+# Parameterized SQL used by RetailAgent.nl_to_sql. The text of each template is
+# constant, so SQLite's statement cache re-uses the prepared statement and the
+# result cache can share entries across calls; only the bound `?` values change.
+#
+# Date ranges are half-open ISO string comparisons on the raw OrderDate column
+# (`OrderDate >= from AND OrderDate < day after to`) so an index on OrderDate can
+# be used, unlike `date(O.OrderDate) BETWEEN ...`.
+SQL_TEMPLATES: Dict[str, str] = {
+    "top3_products_by_revenue": """
+SELECT P.ProductName AS product,
+       SUM(OD.UnitPrice * OD.Quantity * (1 - OD.Discount)) AS revenue
+FROM "Order Details" OD
+JOIN Products P ON P.ProductID = OD.ProductID
+GROUP BY P.ProductID
+ORDER BY revenue DESC
+LIMIT 3;
+""".strip(),
+
+    # params: date_from, date_to (exclusive)
+    "top_category_by_quantity": """
+SELECT C.CategoryName AS category,
+       SUM(OD.Quantity) AS quantity
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+JOIN Products P ON P.ProductID = OD.ProductID
+JOIN Categories C ON C.CategoryID = P.CategoryID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?
+GROUP BY C.CategoryID
+ORDER BY quantity DESC
+LIMIT 1;
+""".strip(),
+
+    # params: date_from, date_to (exclusive)
+    "aov": """
+SELECT SUM(OD.UnitPrice * OD.Quantity * (1 - OD.Discount)) * 1.0
+       / COUNT(DISTINCT O.OrderID) AS aov
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?;
+""".strip(),
+
+    # params: category name, date_from, date_to (exclusive)
+    "category_revenue": """
+SELECT SUM(OD.UnitPrice * OD.Quantity * (1 - OD.Discount)) AS revenue
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+JOIN Products P ON P.ProductID = OD.ProductID
+JOIN Categories C ON C.CategoryID = P.CategoryID
+WHERE C.CategoryName = ?
+  AND O.OrderDate >= ? AND O.OrderDate < ?;
+""".strip(),
+
+    # params: date_from, date_to (exclusive); cost approximated as 70% of UnitPrice
+    "top_customer_by_margin": """
+SELECT CU.CompanyName AS customer,
+       SUM((OD.UnitPrice - 0.7*OD.UnitPrice) * OD.Quantity * (1 - OD.Discount)) AS margin
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+JOIN Customers CU ON CU.CustomerID = O.CustomerID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?
+GROUP BY CU.CustomerID
+ORDER BY margin DESC
+LIMIT 1;
+""".strip(),
+}
+
+
+# Equivalents of the templates above answered from the daily rollup tables
+# maintained by agent.tools.db_maintenance. Same parameters, same output
+# columns; money is summed as exact integers and scaled once. Rankings return
+# their top two groups so near-ties can be left to the base template (see
+# db_maintenance.rollup_ambiguous).
+ROLLUP_TEMPLATES: Dict[str, str] = {
+    "top_category_by_quantity": """
+SELECT CategoryName AS category,
+       SUM(quantity) AS quantity
+FROM rollup_daily_category
+WHERE day >= ? AND day < ?
+GROUP BY CategoryID
+ORDER BY quantity DESC
+LIMIT 2;
+""".strip(),
+
+    "aov": """
+SELECT SUM(revenue_e4) / 10000.0 / SUM(order_count) AS aov
+FROM rollup_daily_orders
+WHERE day >= ? AND day < ?;
+""".strip(),
+
+    "category_revenue": """
+SELECT SUM(revenue_e4) / 10000.0 AS revenue
+FROM rollup_daily_category
+WHERE CategoryName = ?
+  AND day >= ? AND day < ?;
+""".strip(),
+
+    "top_customer_by_margin": """
+SELECT CompanyName AS customer,
+       SUM(margin_e5) / 100000.0 AS margin
+FROM rollup_daily_customer
+WHERE day >= ? AND day < ?
+GROUP BY CustomerID
+ORDER BY margin DESC
+LIMIT 2;
+""".strip(),
+}
+
+
+# Shared aggregates for batches (see agent.shared_scan): one query answers many
+# calls of a template by scanning the covering date range once. `{measures}`
+# becomes one column per call, the template's own aggregate restricted to rows
+# matching that call's WHERE condition (SHARED_CONDITIONS, which binds the
+# template's params in order).
+SHARED_TEMPLATES: Dict[str, str] = {
+    "top_category_by_quantity": """
+SELECT C.CategoryID AS category_id,
+       C.CategoryName AS category,
+       {measures}
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+JOIN Products P ON P.ProductID = OD.ProductID
+JOIN Categories C ON C.CategoryID = P.CategoryID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?
+GROUP BY C.CategoryID
+ORDER BY C.CategoryID;
+""".strip(),
+
+    "aov": """
+SELECT {measures}
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?;
+""".strip(),
+
+    "category_revenue": """
+SELECT {measures}
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+JOIN Products P ON P.ProductID = OD.ProductID
+JOIN Categories C ON C.CategoryID = P.CategoryID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?;
+""".strip(),
+
+    "top_customer_by_margin": """
+SELECT CU.CustomerID AS customer_id,
+       CU.CompanyName AS customer,
+       {measures}
+FROM Orders O
+JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+JOIN Customers CU ON CU.CustomerID = O.CustomerID
+WHERE O.OrderDate >= ? AND O.OrderDate < ?
+GROUP BY CU.CustomerID
+ORDER BY CU.CustomerID;
+""".strip(),
+}
+
+# per-call aggregate of each shared template; {cond} is the call's condition
+SHARED_MEASURES: Dict[str, str] = {
+    "top_category_by_quantity": "SUM(CASE WHEN {cond} THEN OD.Quantity END)",
+    "aov": "SUM(CASE WHEN {cond} THEN OD.UnitPrice * OD.Quantity * (1 - OD.Discount) END) * 1.0"
+           " / COUNT(DISTINCT CASE WHEN {cond} THEN O.OrderID END)",
+    "category_revenue": "SUM(CASE WHEN {cond} THEN OD.UnitPrice * OD.Quantity * (1 - OD.Discount) END)",
+    "top_customer_by_margin": "SUM(CASE WHEN {cond} THEN (OD.UnitPrice - 0.7*OD.UnitPrice)"
+                              " * OD.Quantity * (1 - OD.Discount) END)",
+}
+
+# the WHERE condition of each template; binds the same params in the same order
+SHARED_CONDITIONS: Dict[str, str] = {
+    "top_category_by_quantity": "O.OrderDate >= ? AND O.OrderDate < ?",
+    "aov": "O.OrderDate >= ? AND O.OrderDate < ?",
+    "category_revenue": "C.CategoryName = ? AND O.OrderDate >= ? AND O.OrderDate < ?",
+    "top_customer_by_margin": "O.OrderDate >= ? AND O.OrderDate < ?",
+}
+
+# position of date_from in each template's params (date_to follows it)
+SHARED_DATE_PARAM: Dict[str, int] = {
+    "top_category_by_quantity": 0,
+    "aov": 0,
+    "category_revenue": 1,
+    "top_customer_by_margin": 0,
+}
+
+
+def date_bounds(date_from: str, date_to: str) -> Tuple[str, str]:
+    """
+    Turn an inclusive [date_from, date_to] day range into half-open ISO bounds.
+    """
+    end = date.fromisoformat(date_to) + timedelta(days=1)
+    return date_from, end.isoformat()
+
+
+def year_bounds(year: int) -> Tuple[str, str]:
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
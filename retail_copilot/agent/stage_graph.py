@@ -0,0 +1,58 @@
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+Requires = Union[Sequence[str], Callable[["StageGraph"], Sequence[str]]]
+
+
+class StageCancelled(Exception):
+    """
+    Raised between stages once the request's cancel event is set.
+    """
+
+
+class StageGraph:
+    """
+    Demand-driven evaluation of named pipeline stages.
+
+    Each stage is `fn(values, span) -> value` plus the stages it reads, given either as
+    a list or as a callable that picks them from values computed so far (e.g.
+    "nl_to_sql needs the planner unless the route is rag"). `get(name)` computes
+    a stage's requirements first, then the stage itself inside its own trace
+    span, and keeps the value; a stage nobody asks for never runs. `provide`
+    injects values computed elsewhere (batched retrieval, memoized plans).
+    When `cancelled` is set, the next stage raises StageCancelled instead of running.
+    """
+
+    def __init__(self, trace, cancelled: Optional[threading.Event] = None):
+        self.trace = trace
+        self.cancelled = cancelled
+        self.values: Dict[str, Any] = {}
+        self._stages: Dict[str, Tuple[Callable[[Dict[str, Any], Any], Any], Requires]] = {}
+
+    def stage(self, name: str, fn: Callable[[Dict[str, Any], Any], Any], requires: Requires = ()):
+        self._stages[name] = (fn, requires)
+
+    def provide(self, name: str, value: Any):
+        self.values[name] = value
+
+    def get(self, name: str) -> Any:
+        if name in self.values:
+            return self.values[name]
+        fn, requires = self._stages[name]
+        for dep in (requires(self) if callable(requires) else requires):
+            self.get(dep)
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise StageCancelled(name)
+        with self.trace.span(name) as span:
+            value = fn(self.values, span)
+        self.values[name] = value
+        return value
+
+    def run(self, names: Iterable[str]) -> List[Any]:
+        return [self.get(name) for name in names]
+
+    def snapshot(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        The already computed values among `names`.
+        """
+        return {name: self.values[name] for name in names if name in self.values}
@@ -0,0 +1,313 @@
+import math
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+from agent.dspy_signatures import ColumnarResult
+from agent.sql_templates import SQL_TEMPLATES, date_bounds
+from agent.tools.sqlite_tool import SQLiteTool
+
+# --------------------------
+# Index advisor
+# --------------------------
+# Covering indexes for the joins and date filters of the KPI templates. The
+# advisor tries each one on the templates that touch its table and keeps it only
+# if EXPLAIN QUERY PLAN shows the planner actually using it.
+CANDIDATE_INDEXES: Dict[str, List[Tuple[str, str]]] = {
+    "Orders": [
+        ("idx_orders_orderdate",
+         "CREATE INDEX IF NOT EXISTS idx_orders_orderdate ON Orders(OrderDate, OrderID, CustomerID)"),
+    ],
+    "Order Details": [
+        ("idx_order_details_order",
+         'CREATE INDEX IF NOT EXISTS idx_order_details_order '
+         'ON "Order Details"(OrderID, ProductID, UnitPrice, Quantity, Discount)'),
+    ],
+    "Products": [
+        ("idx_products_category",
+         "CREATE INDEX IF NOT EXISTS idx_products_category ON Products(ProductID, CategoryID, ProductName)"),
+    ],
+}
+
+# representative parameters used to plan each template
+SAMPLE_PARAMS: Dict[str, Tuple[Any, ...]] = {
+    "top3_products_by_revenue": (),
+    "top_category_by_quantity": date_bounds("1997-06-01", "1997-06-30"),
+    "aov": date_bounds("1997-12-01", "1997-12-31"),
+    "category_revenue": ("Beverages",) + date_bounds("1997-06-01", "1997-06-30"),
+    "top_customer_by_margin": date_bounds("1997-01-01", "1997-12-31"),
+}
+
+_TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+("[^"]+"|\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQL_KEYWORDS = {"on", "where", "join", "group", "order", "limit", "inner", "left", "cross"}
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """
+    Map every alias (and bare table name) in FROM/JOIN clauses to its table.
+    """
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        table = table.strip('"')
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def full_scans(db: SQLiteTool, sql: str, params: Sequence[Any] = ()) -> List[str]:
+    """
+    Tables that the query plan reads with a full (non-covering) scan.
+    """
+    aliases = table_aliases(sql)
+    scanned = []
+    for detail in db.explain_query_plan(sql, params):
+        m = re.match(r"SCAN (?:TABLE )?(\S+)", detail)
+        if m and "COVERING INDEX" not in detail:
+            scanned.append(aliases.get(m.group(1), m.group(1)))
+    return scanned
+
+
+def _write(db: SQLiteTool, *statements: str):
+    with db.connection(write=True) as conn:
+        for stmt in statements:
+            conn.execute(stmt)
+        conn.commit()
+
+
+def _create_index(db: SQLiteTool, ddl: str) -> bool:
+    """
+    Run a candidate's CREATE INDEX; False if the index already exists (e.g. made
+    by another process since the advisor listed the indexes).
+    """
+    try:
+        _write(db, ddl.replace(" IF NOT EXISTS", "", 1))
+    except sqlite3.OperationalError as exc:
+        if "already exists" in str(exc):
+            return False
+        raise
+    return True
+
+
+def advise_indexes(db: SQLiteTool, templates: Dict[str, str] = SQL_TEMPLATES) -> List[Dict[str, Any]]:
+    """
+    For every known template, try the candidate indexes of the tables it reads:
+    create one, re-run EXPLAIN QUERY PLAN, and keep it only if the new plan uses it
+    without adding full scans. Reports the plan before and after per template.
+    Only indexes created by this call are ever dropped again.
+    """
+    report = []
+    with db.connection(write=True) as conn:
+        existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    for template_id, sql in templates.items():
+        params = SAMPLE_PARAMS.get(template_id, ())
+        try:
+            before = db.explain_query_plan(sql, params)
+            created, rejected = [], []
+            for table in dict.fromkeys(table_aliases(sql).values()):
+                if table not in tables:
+                    continue
+                for name, ddl in CANDIDATE_INDEXES.get(table, []):
+                    if name in existing:
+                        continue
+                    scans = len(full_scans(db, sql, params))
+                    if not _create_index(db, ddl):
+                        existing.add(name)
+                        continue
+                    plan = db.explain_query_plan(sql, params)
+                    if any(name in detail for detail in plan) and len(full_scans(db, sql, params)) <= scans:
+                        existing.add(name)
+                        created.append(name)
+                    else:
+                        _write(db, f"DROP INDEX IF EXISTS {name}")
+                        rejected.append(name)
+            after = db.explain_query_plan(sql, params) if created else before
+            report.append({"template": template_id, "before": before, "after": after,
+                           "created": created, "rejected": rejected})
+        except Exception as exc:
+            report.append({"template": template_id, "error": str(exc)})
+    if any(r.get("created") for r in report):
+        _write(db, "ANALYZE")
+    return report
+
+
+# --------------------------
+# Daily rollups
+# --------------------------
+# Pre-aggregated revenue / quantity / margin (cost = 70% of UnitPrice) per day,
+# by category, by customer, and per day overall with the number of orders.
+# Money is stored as exact integers, so re-adding daily partials at query time
+# adds no rounding: a line's revenue UnitPrice * Quantity * (1 - Discount) is
+# cents * Quantity * (100 - discount percent) in units of 1e-4, and its margin
+# 3 * that in units of 1e-5. Rollups are only built when every price is whole
+# cents and every discount a whole percent (see ROLLUP_INEXACT).
+ROLLUP_NAME = "daily_exact"
+_CENTS = "CAST(ROUND(OD.UnitPrice * 100) AS INTEGER)"
+_NET_PCT = "(100 - CAST(ROUND(OD.Discount * 100) AS INTEGER))"
+_REVENUE_E4 = f"SUM({_CENTS} * OD.Quantity * {_NET_PCT})"
+_MARGIN_E5 = f"SUM(3 * {_CENTS} * OD.Quantity * {_NET_PCT})"
+
+# order lines whose amounts have no exact fixed-point form
+ROLLUP_INEXACT = f"""
+SELECT COUNT(*) FROM "Order Details" OD
+WHERE ABS(OD.UnitPrice * 100 - {_CENTS}) > 1e-6
+   OR ABS(OD.Discount * 100 - ROUND(OD.Discount * 100)) > 1e-6
+""".strip()
+
+ROLLUP_TABLES = ["rollup_daily_orders", "rollup_daily_category", "rollup_daily_customer"]
+
+ROLLUP_DDL = [
+    """CREATE TABLE IF NOT EXISTS rollup_meta (
+        name TEXT PRIMARY KEY, built_at TEXT, stale INTEGER NOT NULL DEFAULT 1)""",
+    """CREATE TABLE rollup_daily_orders (
+        day TEXT PRIMARY KEY, revenue_e4 INTEGER, order_count INTEGER) WITHOUT ROWID""",
+    """CREATE TABLE rollup_daily_category (
+        day TEXT NOT NULL, CategoryID INTEGER NOT NULL, CategoryName TEXT,
+        revenue_e4 INTEGER, quantity INTEGER, margin_e5 INTEGER,
+        PRIMARY KEY (day, CategoryID)) WITHOUT ROWID""",
+    """CREATE TABLE rollup_daily_customer (
+        day TEXT NOT NULL, CustomerID TEXT NOT NULL, CompanyName TEXT,
+        revenue_e4 INTEGER, quantity INTEGER, margin_e5 INTEGER,
+        PRIMARY KEY (day, CustomerID)) WITHOUT ROWID""",
+]
+
+ROLLUP_REFRESH = [
+    f"""INSERT INTO rollup_daily_orders (day, revenue_e4, order_count)
+       SELECT substr(O.OrderDate, 1, 10),
+              {_REVENUE_E4},
+              COUNT(DISTINCT O.OrderID)
+       FROM Orders O
+       JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+       GROUP BY substr(O.OrderDate, 1, 10)""",
+    f"""INSERT INTO rollup_daily_category (day, CategoryID, CategoryName, revenue_e4, quantity, margin_e5)
+       SELECT substr(O.OrderDate, 1, 10), C.CategoryID, C.CategoryName,
+              {_REVENUE_E4},
+              SUM(OD.Quantity),
+              {_MARGIN_E5}
+       FROM Orders O
+       JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+       JOIN Products P ON P.ProductID = OD.ProductID
+       JOIN Categories C ON C.CategoryID = P.CategoryID
+       GROUP BY substr(O.OrderDate, 1, 10), C.CategoryID""",
+    f"""INSERT INTO rollup_daily_customer (day, CustomerID, CompanyName, revenue_e4, quantity, margin_e5)
+       SELECT substr(O.OrderDate, 1, 10), CU.CustomerID, CU.CompanyName,
+              {_REVENUE_E4},
+              SUM(OD.Quantity),
+              {_MARGIN_E5}
+       FROM Orders O
+       JOIN "Order Details" OD ON OD.OrderID = O.OrderID
+       JOIN Customers CU ON CU.CustomerID = O.CustomerID
+       GROUP BY substr(O.OrderDate, 1, 10), CU.CustomerID""",
+]
+
+# any write to a source table marks the rollups stale until the next refresh
+ROLLUP_SOURCES = ["Orders", "Order Details", "Products", "Categories", "Customers"]
+
+
+def _staleness_triggers(tables: Sequence[str]) -> List[str]:
+    ddl = []
+    for table in tables:
+        slug = table.lower().replace(" ", "_")
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            ddl.append(
+                f'CREATE TRIGGER rollup_stale_{slug}_{op.lower()} AFTER {op} ON "{table}" '
+                f"BEGIN UPDATE rollup_meta SET stale = 1 WHERE name = '{ROLLUP_NAME}'; END"
+            )
+    return ddl
+
+
+# Rollup sums are exact; the base templates add floats, whose last bits depend
+# on the order of the rows (relative error far below ROLLUP_TOLERANCE). Answers
+# are ranked and rounded to cents, so where that noise could decide them the
+# base template answers instead.
+ROLLUP_TOLERANCE = 1e-12
+ROLLUP_RANKINGS = {"top_category_by_quantity": "quantity", "top_customer_by_margin": "margin"}
+
+
+def _near(a: float, b: float, magnitude: float) -> bool:
+    return abs(a - b) <= ROLLUP_TOLERANCE * max(abs(magnitude), 1.0)
+
+
+def rollup_ambiguous(template_id: str, result: ColumnarResult) -> bool:
+    """
+    True if the base template could answer differently from this rollup result:
+    the top two groups of a ranking (fetched with LIMIT 2) are (near-)tied, or a
+    float value lies on a cent rounding boundary.
+    """
+    if len(result) == 0:
+        return False
+    ranked = ROLLUP_RANKINGS.get(template_id)
+    if ranked is not None and len(result) > 1:
+        values = result.column(ranked)
+        if values[0] is not None and values[1] is not None and _near(values[0], values[1], values[0]):
+            return True
+    for value in result.row(0).values():
+        if isinstance(value, float):
+            cents = value * 100
+            if _near(cents - math.floor(cents), 0.5, cents):
+                return True
+    return False
+
+
+def has_rollups(db: SQLiteTool) -> bool:
+    _, rows, err = db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='rollup_meta'")
+    return not err and bool(rows)
+
+
+def rollups_fresh(db: SQLiteTool) -> bool:
+    """
+    True when the rollup tables exist and no source table changed since they were built.
+    The check goes through the result cache, which is dropped on any data change.
+    """
+    _, rows, err = db.execute("SELECT stale FROM rollup_meta WHERE name = ?", (ROLLUP_NAME,))
+    return not err and bool(rows) and rows[0]["stale"] == 0
+
+
+def refresh_rollups(db: SQLiteTool) -> bool:
+    """
+    (Re)build the rollup tables in one transaction and install the staleness
+    triggers. Returns False, leaving no rollups, if some order line has no exact
+    fixed-point form.
+    """
+    with db.connection(write=True) as conn:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        triggers = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'rollup_stale_%'")]
+        with conn:
+            conn.execute("BEGIN")
+            # rebuilt from scratch, so rollups of an older layout go away too
+            for name in triggers:
+                conn.execute(f"DROP TRIGGER {name}")
+            for name in ROLLUP_TABLES:
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute("DROP TABLE IF EXISTS rollup_meta")
+            if "Order Details" in tables and conn.execute(ROLLUP_INEXACT).fetchone()[0]:
+                return False
+            for ddl in ROLLUP_DDL:
+                conn.execute(ddl)
+            for ddl in _staleness_triggers([t for t in ROLLUP_SOURCES if t in tables]):
+                conn.execute(ddl)
+            for stmt in ROLLUP_REFRESH:
+                conn.execute(stmt)
+            conn.execute(
+                "INSERT INTO rollup_meta (name, built_at, stale) VALUES (?, ?, 0)",
+                (ROLLUP_NAME, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+            )
+    return True
+
+
+def run_maintenance(db: SQLiteTool) -> Dict[str, Any]:
+    """
+    Startup/maintenance step: create missing covering indexes for the KPI templates
+    and rebuild the daily rollups if they are missing or stale.
+    """
+    report: Dict[str, Any] = {"indexes": advise_indexes(db), "rollups": "fresh"}
+    if not rollups_fresh(db):
+        try:
+            built = refresh_rollups(db)
+            report["rollups"] = "rebuilt" if built else "skipped: amounts not in whole cents / percents"
+        except Exception as exc:
+            report["rollups"] = f"error: {exc}"
+    return report
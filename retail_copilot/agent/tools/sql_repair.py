@@ -0,0 +1,197 @@
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agent.tools.db_maintenance import table_aliases
+from agent.tools.sqlite_tool import SQLiteTool, is_budget_error, normalize_sql
+
+# --------------------------
+# Error classification
+# --------------------------
+# sqlite3 error text -> repair kind; the first group, if any, is the offending name
+ERROR_KINDS: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("no_such_table", re.compile(r"no such table: (?:main\.)?(.+)$")),
+    ("no_such_column", re.compile(r"no such column: (.+)$")),
+    ("ambiguous_column", re.compile(r"ambiguous column name: (.+)$")),
+    ("syntax", re.compile(r'near "(.*)": syntax error|incomplete input|unrecognized token: "?(.*?)"?$')),
+]
+
+# the agent's legacy lowercase view names for the Northwind tables
+VIEW_NAMES = {"order_items": "Order Details", "orders": "Orders", "products": "Products",
+              "customers": "Customers", "categories": "Categories"}
+
+
+def classify_error(error: str) -> Tuple[str, str]:
+    """
+    Return (kind, offending name) for a sqlite3 error message. Kinds: no_such_table,
+    no_such_column, ambiguous_column, syntax, budget (not repairable), other.
+    """
+    if is_budget_error(error) or error == "interrupted":
+        return "budget", ""
+    for kind, pattern in ERROR_KINDS:
+        m = pattern.search(error)
+        if m:
+            name = next((g for g in m.groups() if g), "")
+            return kind, name.strip()
+    return "other", ""
+
+
+def _squash(name: str) -> str:
+    # "Order Details" ~ order_details ~ OrderDetails
+    return re.sub(r"[\s_\"'\[\]`]", "", name).lower()
+
+
+def _quote(name: str) -> str:
+    return name if re.fullmatch(r"\w+", name) else '"' + name.replace('"', '""') + '"'
+
+
+class SQLRepairer:
+    """
+    Repairs failing SQL in as few executions as possible.
+
+    `candidates(sql, error)` yields rewrites for the classified error, most
+    specific first: schema-matched table and column names (from
+    `SQLiteTool.get_schema`), quoting of table names that contain spaces, then the
+    agent's original substitutions. Each candidate is validated without running
+    it (`sqlite3.complete_statement`, then `EXPLAIN`, which only compiles the
+    statement against the schema), so only a candidate that compiles is executed.
+
+    Successful repairs are remembered per template: the same failing SQL is
+    rewritten before its first execution, and for a new failing SQL of that
+    template the rule that fixed the same kind of error is tried first.
+    """
+
+    def __init__(self, db: SQLiteTool, schema: Optional[Dict[str, List[str]]] = None):
+        self.db = db
+        self.schema = schema if schema is not None else db.get_schema()
+        self._lock = threading.Lock()
+        # (template id, normalized failing SQL) -> (repaired SQL, rule)
+        self._fixes: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        # (template id, error kind) -> rule that repaired it last
+        self._rules: Dict[Tuple[str, str], str] = {}
+        self.stats = {"known_fixes": 0, "repairs": 0, "rejected_candidates": 0}
+        self._rewrites: List[Tuple[str, Callable[[str, str, str], str]]] = [
+            ("table_name", self._fix_table),
+            ("column_name", self._fix_column),
+            ("qualify_column", self._qualify_column),
+            ("quote_tables", self._quote_tables),
+            ("unquote", self._unquote),
+            ("legacy_views", self._legacy_views),
+        ]
+
+    # --------------------------
+    # Memo of repairs
+    # --------------------------
+    def known_fix(self, template_id: str, sql: str) -> Optional[Tuple[str, str]]:
+        """
+        (repaired SQL, rule) remembered for this failing SQL, if any.
+        """
+        with self._lock:
+            fix = self._fixes.get((template_id, normalize_sql(sql)))
+            if fix is not None:
+                self.stats["known_fixes"] += 1
+            return fix
+
+    def remember(self, template_id: str, sql: str, error: str, repaired: str, rule: str):
+        kind, _ = classify_error(error)
+        with self._lock:
+            self._fixes[(template_id, normalize_sql(sql))] = (repaired, rule)
+            self._rules[(template_id, kind)] = rule
+            self.stats["repairs"] += 1
+
+    def forget(self, template_id: str, sql: str):
+        with self._lock:
+            self._fixes.pop((template_id, normalize_sql(sql)), None)
+
+    # --------------------------
+    # Candidates
+    # --------------------------
+    def candidates(self, sql: str, error: str, template_id: str = "") -> List[Tuple[str, str]]:
+        """
+        Distinct (rule, rewritten SQL) pairs for `error`, in the order to try them.
+        Budget violations and interrupts get none.
+        """
+        kind, name = classify_error(error)
+        if kind == "budget":
+            return []
+        rewrites = list(self._rewrites)
+        with self._lock:
+            preferred = self._rules.get((template_id, kind))
+        rewrites.sort(key=lambda r: r[0] != preferred)
+        out: List[Tuple[str, str]] = []
+        seen = {sql}
+        for rule, rewrite in rewrites:
+            candidate = rewrite(sql, kind, name)
+            if candidate not in seen:
+                seen.add(candidate)
+                out.append((rule, candidate))
+        return out
+
+    def validate(self, sql: str, params: Sequence[Any] = ()) -> str:
+        """
+        "" if `sql` compiles against the database, else the error; nothing is executed.
+        """
+        text = sql.strip()
+        if not sqlite3.complete_statement(text if text.endswith(";") else text + ";"):
+            return "incomplete input"
+        err = self.db.compile_check(text, params)
+        if err:
+            with self._lock:
+                self.stats["rejected_candidates"] += 1
+        return err
+
+    def _fix_table(self, sql: str, kind: str, name: str) -> str:
+        if kind != "no_such_table" or not name:
+            return sql
+        target = self._match(name.strip('"'), list(self.schema))
+        if target is None and name.lower() in VIEW_NAMES:
+            target = self._match(VIEW_NAMES[name.lower()], list(self.schema))
+        if target is None:
+            return sql
+        pattern = r'(?<![\w."])"?' + re.escape(name.strip('"')) + r'"?(?![\w"])'
+        return re.sub(pattern, lambda m: _quote(target), sql)
+
+    def _fix_column(self, sql: str, kind: str, name: str) -> str:
+        if kind != "no_such_column" or not name:
+            return sql
+        qualifier, _, column = name.rpartition(".")
+        target = self._match(column, sorted({c for cols in self.schema.values() for c in cols}))
+        if target is None:
+            return sql
+        prefix = re.escape(qualifier + ".") if qualifier else r"(?<![\w.])"
+        return re.sub(prefix + r'"?' + re.escape(column) + r'"?(?!\w)',
+                      lambda m: (qualifier + "." if qualifier else "") + _quote(target), sql)
+
+    def _qualify_column(self, sql: str, kind: str, name: str) -> str:
+        if kind != "ambiguous_column" or not name:
+            return sql
+        # qualify with the first alias in FROM/JOIN order whose table has the column
+        for alias, table in table_aliases(sql).items():
+            if alias != table and name in self.schema.get(table, []):
+                return re.sub(r'(?<![\w."])' + re.escape(name) + r'(?![\w"])', lambda m: f"{alias}.{name}", sql)
+        return sql
+
+    def _quote_tables(self, sql: str, kind: str, name: str) -> str:
+        # unquoted table names with spaces (FROM Order Details) do not parse
+        for table in self.schema:
+            if " " in table:
+                sql = re.sub(r'(?<!["\w])' + re.escape(table) + r'(?!["\w])', lambda m: _quote(table), sql)
+        return sql
+
+    @staticmethod
+    def _unquote(sql: str, kind: str, name: str) -> str:
+        # the agent's original first repair: drop identifier quotes
+        return sql.replace('"Order Details"', "'Order Details'").replace('"', '')
+
+    @staticmethod
+    def _legacy_views(sql: str, kind: str, name: str) -> str:
+        # the agent's original second repair: lowercase view names
+        return sql.replace('"Order Details"', "order_items").replace("Orders", "orders")
+
+    def _match(self, name: str, names: List[str]) -> Optional[str]:
+        by_case = [n for n in names if n.lower() == name.lower()]
+        if by_case:
+            return by_case[0]
+        squashed = [n for n in names if _squash(n) == _squash(name)]
+        return squashed[0] if squashed else None
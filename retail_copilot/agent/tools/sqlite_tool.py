@@ -1,44 +1,504 @@
+import os
+import queue
+import re
 import sqlite3
-from typing import Any, Dict, List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from agent.dspy_signatures import ColumnarResult
+
+# string literals / quoted identifiers are kept verbatim when normalizing SQL
+_SQL_TOKENS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+")
+_NON_DETERMINISTIC = re.compile(r"\brandom\s*\(|'now'|\bcurrent_(?:date|time|timestamp)\b", re.IGNORECASE)
+
+# per-connection tuning applied to pooled read-only connections
+DEFAULT_POOL_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative = KiB
+    "temp_store": "MEMORY",
+}
+
+# the progress handler runs every this many SQLite VM instructions
+PROGRESS_STEP = 1000
+# cost guard: a join of full scans whose estimated row product exceeds this is rejected
+DEFAULT_MAX_CROSS_ROWS = 10_000_000
+# "FROM t [AS] a" / "JOIN t a" / ", t a": table name and optional alias
+_TABLE_REFS = re.compile(r'(?:\bFROM|\bJOIN|,)\s+("(?:[^"]|"")+"|\w+)(?:\s+(?:AS\s+)?(?!(?:ON|USING|WHERE|JOIN|'
+                         r'INNER|LEFT|CROSS|NATURAL|GROUP|ORDER|LIMIT|UNION|HAVING|WINDOW)\b)(\w+))?',
+                         re.IGNORECASE)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    A query ran past its time / instruction budget or was rejected by the cost
+    guard before running. The message starts with "query budget exceeded".
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(f"query budget exceeded: {reason}")
+        self.reason = reason
+
+
+def is_budget_error(error: str) -> bool:
+    return error.startswith("query budget exceeded")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Collapse whitespace outside of quotes and drop trailing semicolons, so that
+    formatting differences do not produce different cache keys.
+    """
+    norm = _SQL_TOKENS.sub(lambda m: " " if m.group(0).isspace() else m.group(0), sql)
+    return norm.strip().rstrip(";").strip()
 
 
 class SQLiteTool:
     """
     Lightweight helper for interacting with the local Northwind SQLite database.
+
+    Read-only query results are kept in an LRU cache keyed on the normalized SQL
+    text and bound parameters. The cache is dropped as soon as the database changes, detected through
+    `PRAGMA data_version` (commits from other connections and processes),
+    `total_changes` (writes through this connection) and the db file mtime/size.
+    Set `cache_size=0` to disable it.
+
+    With `pool_size > 0`, reads are served by a pool of read-only connections
+    (`mode=ro` URI, `check_same_thread=False`, PRAGMA-tuned) that are checked out
+    per query, so one instance can be shared by many threads. Writes still go
+    through the primary connection under a lock. Without a pool, the primary
+    connection is itself checked out, so concurrent callers are serialized.
+
+    Reads that miss the cache run under budgets: `time_limit` seconds and
+    `instruction_limit` SQLite VM instructions, enforced by a progress handler
+    that aborts the statement. With `cost_guard`, EXPLAIN QUERY PLAN is checked
+    first and a join of full table scans whose estimated row product exceeds
+    `max_cross_rows` (a cartesian product) is rejected without running. Both
+    raise QueryBudgetExceeded, reported by the execute* methods as their error.
     """
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, cache_size: int = 128, cache_max_rows: int = 10000,
+                 pool_size: int = 0, pool_timeout: float = 30.0, pragmas: Optional[Dict[str, Any]] = None,
+                 statement_cache_size: int = 256, time_limit: Optional[float] = None,
+                 instruction_limit: Optional[int] = None, cost_guard: bool = False,
+                 max_cross_rows: int = DEFAULT_MAX_CROSS_ROWS):
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path)
+        # prepared statements are cached per connection, keyed on the exact SQL text
+        self.statement_cache_size = statement_cache_size
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=statement_cache_size)
         self.conn.row_factory = sqlite3.Row
+        self.cache_size = cache_size
+        self.cache_max_rows = cache_max_rows
+        self._cache: "OrderedDict[Tuple[str, Tuple[Any, ...]], Tuple[List[str], List[Tuple]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_stamp: Optional[Tuple] = None
+        self._seen_versions: Dict[int, int] = {}
+        # bumped on every invalidation; results read under an older epoch are not stored
+        self._cache_epoch = 0
+        self.cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self.time_limit = time_limit
+        self.instruction_limit = instruction_limit
+        self.cost_guard = cost_guard
+        self.max_cross_rows = max_cross_rows
+        # (normalized SQL, params) -> (cache epoch, cost guard verdict); recomputed after any db change
+        self._cost_verdicts: Dict[Tuple[str, Tuple[Any, ...]], Tuple[int, str]] = {}
+        self._table_rows: Dict[str, int] = {}
+        self._table_rows_epoch = 0
+
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self._write_lock = threading.Lock()
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        # thread id -> connection it has checked out, for interrupt()
+        self._in_use: Dict[int, sqlite3.Connection] = {}
+        self._pooled: List[sqlite3.Connection] = []
+        if pool_size > 0:
+            tuning = dict(DEFAULT_POOL_PRAGMAS)
+            tuning.update(pragmas or {})
+            for _ in range(pool_size):
+                conn = self._open_readonly(tuning)
+                self._pooled.append(conn)
+                self._pool.put(conn)
+        else:
+            self._pool.put(self.conn)
+
+    def _open_readonly(self, tuning: Dict[str, Any]) -> sqlite3.Connection:
+        uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.statement_cache_size)
+        conn.row_factory = sqlite3.Row
+        for name, value in tuning.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
 
-    def execute(self, sql: str) -> Tuple[List[str], List[Dict[str, Any]], str]:
+    @contextmanager
+    def connection(self, write: bool = False) -> Iterator[sqlite3.Connection]:
         """
-        Execute a SQL query and return columns, rows (list of dicts), and an error string.
+        Check out a connection for the duration of the block. Raises TimeoutError
+        if none becomes free within `pool_timeout` seconds.
         """
+        thread_id = threading.get_ident()
+        if write and self._pooled:
+            with self._write_lock:
+                self._in_use[thread_id] = self.conn
+                try:
+                    yield self.conn
+                finally:
+                    self._in_use.pop(thread_id, None)
+            return
         try:
-            cursor = self.conn.execute(sql)
-            columns = [col[0] for col in cursor.description] if cursor.description else []
-            rows = [dict(row) for row in cursor.fetchall()]
+            conn = self._pool.get(timeout=self.pool_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no SQLite connection available after {self.pool_timeout}s")
+        self._in_use[thread_id] = conn
+        try:
+            yield conn
+        finally:
+            self._in_use.pop(thread_id, None)
+            self._pool.put(conn)
+
+    def interrupt(self, thread_id: int) -> bool:
+        """
+        Abort the query running on the connection checked out by thread `thread_id`
+        (`sqlite3.Connection.interrupt`); it fails with "interrupted". Returns
+        False if that thread holds no connection.
+        """
+        conn = self._in_use.get(thread_id)
+        if conn is None:
+            return False
+        conn.interrupt()
+        return True
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> Tuple[List[str], List[Dict[str, Any]], str]:
+        """
+        Execute a SQL query (with optional `?` parameters) and return columns,
+        rows (list of dicts), and an error string.
+        """
+        try:
+            columns, values, _ = self._fetch(sql, params)
+            rows = [dict(zip(columns, v)) for v in values]
             return columns, rows, ""
         except Exception as exc:
             return [], [], str(exc)
 
+    def execute_columnar(self, sql: str, params: Sequence[Any] = (),
+                         max_rows: Optional[int] = None) -> Tuple[ColumnarResult, str]:
+        """
+        Execute a SQL query and return a ColumnarResult (one tuple per column) and an
+        error string. At most `max_rows` rows are kept; `truncated` flags the cut.
+        """
+        try:
+            columns, values, truncated = self._fetch(sql, params, max_rows)
+            data = list(zip(*values)) if values else [() for _ in columns]
+            return ColumnarResult(columns=columns, data=data, truncated=truncated), ""
+        except Exception as exc:
+            return ColumnarResult(columns=[], data=[]), str(exc)
+
+    def execute_stream(self, sql: str, params: Sequence[Any] = (),
+                       batch_size: int = 1000) -> Tuple[List[str], Iterator[List[Tuple]], str]:
+        """
+        Execute a SQL query and return columns, a generator of row-tuple batches
+        (fetched with `fetchmany(batch_size)`), and an error string. The connection
+        stays checked out until the generator is exhausted or closed. Streams bypass
+        the result cache and the query budgets.
+        """
+        checkout = self.connection(write=not _is_read(sql))
+        try:
+            conn = checkout.__enter__()
+        except Exception as exc:
+            return [], iter(()), str(exc)
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(sql, params)
+        except Exception as exc:
+            checkout.__exit__(None, None, None)
+            return [], iter(()), str(exc)
+        columns = [col[0] for col in cursor.description] if cursor.description else []
+        batches = self._stream(checkout, cursor, batch_size)
+        next(batches)
+        return columns, batches, ""
+
+    @staticmethod
+    def _stream(checkout, cursor: sqlite3.Cursor, batch_size: int) -> Iterator[List[Tuple]]:
+        try:
+            # primed by execute_stream so the finally clause always runs on close
+            yield []
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            cursor.close()
+            checkout.__exit__(None, None, None)
+
+    def _fetch(self, sql: str, params: Sequence[Any] = (),
+               max_rows: Optional[int] = None) -> Tuple[List[str], List[Tuple], bool]:
+        """
+        Run (or serve from cache) a query and return columns, row tuples and
+        whether the result was cut at `max_rows`.
+        """
+        key = self._cache_key(sql, params)
+        with self.connection(write=not _is_read(sql)) as conn:
+            cached, epoch = self._cache_get(key, conn) if key else (None, None)
+            if cached is not None:
+                columns, values = cached
+            else:
+                budgeted = _is_read(sql)
+                if budgeted and self.cost_guard:
+                    if epoch is None:
+                        # uncached reads still have to notice db changes for the guard's memory
+                        epoch = self._data_epoch(conn)
+                    self._check_cost(conn, sql, params, epoch)
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                with self._budget(conn, budgeted):
+                    cursor.execute(sql, params)
+                    columns = [col[0] for col in cursor.description] if cursor.description else []
+                    if max_rows is None:
+                        values = cursor.fetchall()
+                    else:
+                        values = cursor.fetchmany(max_rows + 1)
+                cursor.close()
+                complete = max_rows is None or len(values) <= max_rows
+                if key and columns and complete:
+                    self._cache_put(key, columns, values, epoch)
+        if max_rows is not None and len(values) > max_rows:
+            return columns, values[:max_rows], True
+        return columns, values, False
+
+    # --------------------------
+    # Budgets and cost guard
+    # --------------------------
+    @contextmanager
+    def _budget(self, conn: sqlite3.Connection, enabled: bool = True) -> Iterator[None]:
+        """
+        Abort the statements run in the block once they exceed `time_limit` or
+        `instruction_limit`; the abort surfaces as QueryBudgetExceeded.
+        """
+        if not enabled or (self.time_limit is None and self.instruction_limit is None):
+            yield
+            return
+        deadline = time.monotonic() + self.time_limit if self.time_limit is not None else None
+        state = {"steps": 0, "reason": ""}
+
+        def progress() -> int:
+            state["steps"] += 1
+            if self.instruction_limit is not None and state["steps"] * PROGRESS_STEP > self.instruction_limit:
+                state["reason"] = f"more than {self.instruction_limit} VM instructions"
+            elif deadline is not None and time.monotonic() > deadline:
+                state["reason"] = f"ran longer than {self.time_limit}s"
+            return 1 if state["reason"] else 0
+
+        conn.set_progress_handler(progress, PROGRESS_STEP)
+        try:
+            yield
+        except sqlite3.OperationalError:
+            if state["reason"]:
+                raise QueryBudgetExceeded(state["reason"]) from None
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def _check_cost(self, conn: sqlite3.Connection, sql: str, params: Sequence[Any], epoch: int):
+        norm = (normalize_sql(sql), tuple(params))
+        cached = self._cost_verdicts.get(norm)
+        if cached is not None and cached[0] == epoch:
+            verdict = cached[1]
+        else:
+            verdict = self._cross_join_verdict(conn, sql, params)
+            if len(self._cost_verdicts) >= 1024:
+                self._cost_verdicts.clear()
+            self._cost_verdicts[norm] = (epoch, verdict)
+        if verdict:
+            raise QueryBudgetExceeded(verdict)
+
+    def _cross_join_verdict(self, conn: sqlite3.Connection, sql: str, params: Sequence[Any]) -> str:
+        """
+        "" if the plan is acceptable, else why it is rejected. Sibling plan rows
+        that are all full scans form a nested loop without any usable join key;
+        their estimated row product is compared with `max_cross_rows`.
+        """
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        aliases = {}
+        for m in _TABLE_REFS.finditer(sql):
+            table = m.group(1).strip('"').replace('""', '"')
+            aliases[(m.group(2) or table).lower()] = table
+            aliases.setdefault(table.lower(), table)
+        scans: Dict[int, List[str]] = {}
+        for row in plan:
+            m = re.match(r"SCAN (?!CONSTANT ROW)(\S+)", row[3])
+            if m:
+                scans.setdefault(row[1], []).append(m.group(1))
+        for names in scans.values():
+            if len(names) < 2:
+                continue
+            tables = [aliases.get(name.lower()) for name in names]
+            estimate = 1
+            for table in tables:
+                # CTEs and subqueries have no table row count; they do not raise the estimate
+                estimate *= self._estimated_rows(conn, table) if table else 1
+            if estimate > self.max_cross_rows:
+                joined = " x ".join(t or n for t, n in zip(tables, names))
+                return f"cartesian product of full scans ({joined}, ~{estimate} rows) over {self.max_cross_rows}"
+        return ""
+
+    def _estimated_rows(self, conn: sqlite3.Connection, table: str) -> int:
+        if self._table_rows_epoch != self._cache_epoch:
+            self._table_rows.clear()
+            self._table_rows_epoch = self._cache_epoch
+        rows = self._table_rows.get(table)
+        if rows is None:
+            quoted = '"' + table.replace('"', '""') + '"'
+            try:
+                # counted once per table until the database changes
+                rows = conn.execute(f"SELECT count(*) FROM {quoted}").fetchone()[0]
+            except sqlite3.Error:
+                rows = 1
+            self._table_rows[table] = rows
+        return rows
+
+    # --------------------------
+    # Result cache
+    # --------------------------
+    def _cache_key(self, sql: str, params: Sequence[Any] = ()) -> Optional[Tuple[str, Tuple[Any, ...]]]:
+        if self.cache_size <= 0:
+            return None
+        norm = normalize_sql(sql)
+        if not _is_read(norm) or _NON_DETERMINISTIC.search(norm):
+            return None
+        return norm, tuple(params)
+
+    def data_version(self) -> Tuple:
+        """
+        Token that changes whenever the database content may have changed:
+        writes through this tool (`total_changes`) or db/WAL file modifications.
+        """
+        stamps = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamps.append(None)
+        return (self.conn.total_changes, tuple(stamps))
+
+    def file_version(self) -> str:
+        """
+        Process-independent version of the database content, usable as a key in
+        caches shared between processes: the file change counter from the SQLite
+        header (bumped by every commit outside WAL mode) plus db/WAL mtime and size.
+        """
+        try:
+            with open(self.db_path, "rb") as f:
+                header = f.read(28)
+            counter = int.from_bytes(header[24:28], "big") if len(header) == 28 else 0
+        except OSError:
+            counter = 0
+        return f"{counter}:{self.data_version()[1]}"
+
+    def _check_version(self, conn: sqlite3.Connection):
+        # PRAGMA data_version is per connection: compare each one with its own last value
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = self._seen_versions.get(id(conn), version) != version
+        self._seen_versions[id(conn)] = version
+        stamp = self.data_version()
+        if stamp != self._cache_stamp:
+            changed = changed or self._cache_stamp is not None
+            self._cache_stamp = stamp
+        if changed:
+            self._cache_epoch += 1
+            if self._cache:
+                self.cache_stats["invalidations"] += 1
+                self._cache.clear()
+
+    def _data_epoch(self, conn: sqlite3.Connection) -> int:
+        with self._cache_lock:
+            self._check_version(conn)
+            return self._cache_epoch
+
+    def _cache_get(self, key: Tuple[str, Tuple[Any, ...]], conn: sqlite3.Connection):
+        with self._cache_lock:
+            self._check_version(conn)
+            entry = self._cache.get(key)
+            if entry is None:
+                self.cache_stats["misses"] += 1
+                return None, self._cache_epoch
+            self._cache.move_to_end(key)
+            self.cache_stats["hits"] += 1
+            return entry, self._cache_epoch
+
+    def _cache_put(self, key: Tuple[str, Tuple[Any, ...]], columns: List[str], values: List[Tuple], epoch: int):
+        if len(values) > self.cache_max_rows:
+            return
+        with self._cache_lock:
+            if epoch != self._cache_epoch:
+                return
+            self._cache[key] = (columns, values)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.cache_stats["evictions"] += 1
+
+    def cache_info(self) -> Dict[str, int]:
+        """
+        Return hit/miss/eviction/invalidation counters plus current and max size.
+        """
+        with self._cache_lock:
+            info = dict(self.cache_stats)
+            info.update({"size": len(self._cache), "max_size": self.cache_size})
+        return info
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache_epoch += 1
+            self._cache.clear()
+
+    def compile_check(self, sql: str, params: Sequence[Any] = ()) -> str:
+        """
+        Compile `sql` with EXPLAIN, without running it, and return the error
+        (missing table or column, syntax) or "".
+        """
+        try:
+            with self.connection() as conn:
+                conn.execute(f"EXPLAIN {sql}", params).fetchone()
+            return ""
+        except Exception as exc:
+            return str(exc)
+
+    def explain_query_plan(self, sql: str, params: Sequence[Any] = ()) -> List[str]:
+        """
+        Return the `detail` column of EXPLAIN QUERY PLAN for a query.
+        """
+        with self.connection() as conn:
+            return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
     def get_schema(self) -> Dict[str, List[str]]:
         """
         Return a dict mapping table_name -> list of column names.
         """
-        schema = {}
-        tables = self.conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' OR type='view'"
-        ).fetchall()
-
-        for t in tables:
-            table_name = t[0]
-            cols = self.conn.execute(f"PRAGMA table_info('{table_name}')").fetchall()
-            schema[table_name] = [c[1] for c in cols]
+        schema: Dict[str, List[str]] = {}
+        # one query for every table's columns instead of a PRAGMA per table
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT m.name, c.name FROM sqlite_master AS m, pragma_table_info(m.name) AS c "
+                "WHERE m.type IN ('table', 'view') ORDER BY m.rowid, c.cid"
+            ).fetchall()
+        for table_name, column in rows:
+            schema.setdefault(table_name, []).append(column)
 
         return schema
 
     def close(self):
+        for conn in self._pooled:
+            conn.close()
         self.conn.close()
+
+
+def _is_read(sql: str) -> bool:
+    head = sql.lstrip().lstrip("(")[:7].lower()
+    return head.startswith("select") or head.startswith("with") or head.startswith("explain")
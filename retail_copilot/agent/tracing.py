@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# --------------------------
+# Spans
+# --------------------------
+# Spans follow the OpenTelemetry data model (trace/span ids, parent id, unix-nano
+# timestamps, attributes, status) so they can be shipped to any OTLP collector;
+# `Span.to_otel()` produces the OTLP/JSON shape of a single span.
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = 0  # unix epoch nanoseconds
+    end_ns: int = 0
+    cpu_ns: int = 0  # CPU time of the calling thread spent inside the span
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "OK"  # "OK" or "ERROR"
+
+    @property
+    def wall_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    @property
+    def cpu_ms(self) -> float:
+        return self.cpu_ns / 1e6
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def fail(self, message: str):
+        self.status = "ERROR"
+        self.attributes["error"] = message
+
+    def to_otel(self) -> Dict[str, Any]:
+        attributes = dict(self.attributes)
+        attributes["cpu_ms"] = round(self.cpu_ms, 3)
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otel_value(v)} for k, v in attributes.items()],
+            "status": {"code": 1 if self.status == "OK" else 2},
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def fail(self, message: str):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """
+    Collects the spans of one `run_one` call. The first span opened is the root;
+    spans opened inside it become its children. Finished spans are handed to
+    `exporter` (if any) when the root span ends.
+    """
+
+    def __init__(self, name: str = "run_one", exporter: Optional["SpanExporter"] = None):
+        self.name = name
+        self.trace_id = _new_id(16)
+        self.exporter = exporter
+        self.spans: List[Span] = []
+        self._stack: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        parent = self._stack[-1].span_id if self._stack else None
+        span = Span(name=name, trace_id=self.trace_id, span_id=_new_id(8), parent_id=parent,
+                    attributes=dict(attributes))
+        self._stack.append(span)
+        cpu_start = time.thread_time_ns()
+        wall_start = time.perf_counter_ns()
+        span.start_ns = started = time.time_ns()
+        try:
+            yield span
+        except BaseException as exc:
+            span.status = "ERROR"
+            span.set("exception.type", type(exc).__name__)
+            raise
+        finally:
+            # measured from the opening time: adopt() may move start_ns earlier
+            span.end_ns = started + (time.perf_counter_ns() - wall_start)
+            span.cpu_ns = time.thread_time_ns() - cpu_start
+            self._stack.pop()
+            self.spans.append(span)
+            if not self._stack and self.exporter is not None:
+                self.exporter.export(self.spans)
+
+    def adopt(self, spans: Sequence[Span]):
+        """
+        Copy finished spans of another trace (work done for this call before it
+        started, e.g. by run_batch) into this one, under the currently open span.
+        Copies get fresh span ids, so the same spans can be adopted by several traces.
+        Open spans starting after the earliest adopted span are moved back to it,
+        so parents still cover their children.
+        """
+        parent = self._stack[-1].span_id if self._stack else None
+        if spans:
+            earliest = min(s.start_ns for s in spans)
+            for open_span in self._stack:
+                open_span.start_ns = min(open_span.start_ns, earliest)
+        ids = {s.span_id: _new_id(8) for s in spans}
+        for s in spans:
+            self.spans.append(replace(s, trace_id=self.trace_id, span_id=ids[s.span_id],
+                                      parent_id=ids.get(s.parent_id, parent), attributes=dict(s.attributes)))
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Compact per-stage view attached to output records as `trace`: wall/CPU
+        milliseconds per child span of the root, plus the root's attributes.
+        """
+        root = next((s for s in self.spans if s.parent_id is None), None)
+        stages = {}
+        for s in self.spans:
+            if root is not None and s.parent_id == root.span_id:
+                stages[s.name] = {"wall_ms": round(s.wall_ms, 3), "cpu_ms": round(s.cpu_ms, 3)}
+        out: Dict[str, Any] = {"trace_id": self.trace_id, "stages": stages}
+        if root is not None:
+            out["total_ms"] = round(root.wall_ms, 3)
+            out.update(root.attributes)
+        return out
+
+
+class NullTrace:
+    """
+    Stand-in used when tracing is off: spans cost one no-op context manager.
+    """
+
+    spans: Sequence[Span] = ()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[_NullSpan]:
+        yield _NULL_SPAN
+
+    def adopt(self, spans: Sequence[Span]):
+        pass
+
+    def summary(self) -> Dict[str, Any]:
+        return {}
+
+
+# --------------------------
+# Exporters
+# --------------------------
+class SpanExporter:
+    def export(self, spans: Sequence[Span]):
+        raise NotImplementedError
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    Keeps finished spans in memory (like OpenTelemetry's exporter of the same
+    name); meant for tests and for inspecting traces in a notebook.
+    """
+
+    def __init__(self):
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Span]):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def get_finished_spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class JsonlSpanExporter(SpanExporter):
+    """
+    Appends one OTLP/JSON span per line to `path`. The file is opened per batch,
+    so the exporter can be pickled into process-pool workers; each batch is a
+    single append write, so several processes can share one file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Span]):
+        payload = "".join(json.dumps(s.to_otel()) + "\n" for s in spans)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(payload)
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+
+# --------------------------
+# Latency histograms
+# --------------------------
+class LatencyHistogram:
+    """
+    Per-stage latency samples with nearest-rank percentiles.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, value_ms: float):
+        self.samples.setdefault(stage, []).append(value_ms)
+
+    def add_trace(self, trace: Dict[str, Any]):
+        """
+        Record the stage timings of a `Trace.summary()` (an output's `trace` field).
+        """
+        for stage, timing in trace.get("stages", {}).items():
+            self.add(stage, timing["wall_ms"])
+        if "total_ms" in trace:
+            self.add("total", trace["total_ms"])
+
+    @staticmethod
+    def percentile(values: Sequence[float], pct: float) -> float:
+        ordered = sorted(values)
+        rank = max(1, -(-len(ordered) * pct // 100))  # ceil(n * pct / 100)
+        return ordered[int(rank) - 1]
+
+    def report(self, percentiles: Sequence[float] = (50, 95, 99)) -> Dict[str, Dict[str, float]]:
+        out = {}
+        # stages in first-seen order, the end-to-end total last
+        for stage in sorted(self.samples, key=lambda name: name == "total"):
+            values = self.samples[stage]
+            if not values:
+                continue
+            row = {"count": len(values), "mean": round(sum(values) / len(values), 3)}
+            for pct in percentiles:
+                row[f"p{pct:g}"] = round(self.percentile(values, pct), 3)
+            row["max"] = round(max(values), 3)
+            out[stage] = row
+        return out
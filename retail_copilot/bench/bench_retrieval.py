@@ -0,0 +1,82 @@
+import json
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import click
+from agent.rag.retrieval import BM25Retriever
+
+
+def write_synthetic_docs(path: str, n_files: int, paragraphs: int, vocab_size: int, seed: int = 7):
+    """
+    Write markdown files of Zipf-distributed words: one paragraph per line,
+    each paragraph long enough to become a single 80-token chunk.
+    """
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    for n in range(n_files):
+        with open(os.path.join(path, f"doc_{n:04d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Synthetic document {n}\n")
+            for _ in range(paragraphs):
+                f.write(" ".join(rng.choices(vocab, weights, k=rng.randint(20, 80))) + "\n")
+
+
+def sample_queries(n: int, vocab_size: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(f"w{rng.randint(0, vocab_size // 10)}" for _ in range(rng.randint(3, 10))) for _ in range(n)]
+
+
+def time_queries(retriever: BM25Retriever, queries: List[str], k: int):
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        results.append(retriever.retrieve(q, k=k))
+    return time.perf_counter() - start, results
+
+
+@click.command()
+@click.option("--files", default=50, show_default=True, type=int, help="Number of synthetic markdown files")
+@click.option("--paragraphs", default=400, show_default=True, type=int, help="Paragraphs (chunks) per file")
+@click.option("--vocab", default=50000, show_default=True, type=int, help="Vocabulary size")
+@click.option("--queries", default=50, show_default=True, type=int, help="Number of queries")
+@click.option("--k", default=5, show_default=True, type=int)
+def main(files: int, paragraphs: int, vocab: int, queries: int, k: int):
+    """
+    Compare the inverted-index BM25 engine (per query and batched) against the
+    rank_bm25 full scan.
+    """
+    with tempfile.TemporaryDirectory() as docs:
+        write_synthetic_docs(docs, files, paragraphs, vocab)
+        qs = sample_queries(queries, vocab)
+        report = {"chunks": 0, "queries": queries, "k": k, "engines": {}}
+        outputs = {}
+        for engine in ("rank_bm25", "inverted"):
+            start = time.perf_counter()
+            retriever = BM25Retriever(docs, engine=engine, cache_size=0)
+            build_s = time.perf_counter() - start
+            query_s, results = time_queries(retriever, qs, k)
+            report["chunks"] = len(retriever.chunks)
+            report["engines"][engine] = {
+                "build_s": round(build_s, 4),
+                "query_ms_avg": round(1000 * query_s / queries, 3),
+            }
+            outputs[engine] = [[(r["chunk_id"], r["score"]) for r in res] for res in results]
+            if engine == "inverted":
+                start = time.perf_counter()
+                batched = retriever.retrieve_batch(qs, k=k)
+                batch_s = time.perf_counter() - start
+                report["engines"]["inverted"]["batch_query_ms_avg"] = round(1000 * batch_s / queries, 3)
+                outputs["inverted_batch"] = [[(r["chunk_id"], r["score"]) for r in res] for res in batched]
+
+        report["identical_results"] = outputs["rank_bm25"] == outputs["inverted"] == outputs["inverted_batch"]
+        base = report["engines"]["rank_bm25"]["query_ms_avg"]
+        fast = report["engines"]["inverted"]["query_ms_avg"]
+        report["query_speedup"] = round(base / fast, 1) if fast else None
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
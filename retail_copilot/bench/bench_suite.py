@@ -0,0 +1,637 @@
+import calendar
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+from agent.graph_hybrid import RetailAgent
+from agent.rag.chunk_store import ChunkStore
+from agent.rag.retrieval import BM25Retriever
+from agent.server import AgentClient
+from agent.tools.db_maintenance import SAMPLE_PARAMS
+from agent.tools.sqlite_tool import SQLiteTool
+from agent.sql_templates import SQL_TEMPLATES
+from agent.tracing import LatencyHistogram
+from bench.datagen import scale_northwind, write_retail_docs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_BATCH = os.path.join(ROOT, "sample_questions_hybrid_eval.jsonl")
+
+# Results are JSON documents of the form
+#   {"meta": {...}, "metrics": {name: {"unit": "ms", "p50": ..., "p95": ..., ...}}}
+# Latency metrics ("ms") regress when they grow, throughput metrics ("items/s")
+# when they shrink; `compare` checks two such documents against each other.
+
+
+def _meta(**extra: Any) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    meta = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    meta.update(extra)
+    return meta
+
+
+def _questions(n: int) -> List[Dict[str, Any]]:
+    """
+    `n` evaluation items: the sample questions cycled, with unique ids that keep
+    the original id as prefix (the router and synthesizer key on it).
+    """
+    with open(SAMPLE_BATCH, "r", encoding="utf-8") as f:
+        base = [json.loads(line) for line in f if line.strip()]
+    return [dict(base[i % len(base)], id=f"{base[i % len(base)]['id']}__{i}") for i in range(n)]
+
+
+def _timed(fn: Callable[[], Any], repeat: int, histogram: LatencyHistogram, name: str):
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        histogram.add(name, 1000 * (time.perf_counter() - start))
+
+
+def _latency_metrics(histogram: LatencyHistogram, prefix: str = "") -> Dict[str, Dict[str, Any]]:
+    return {f"{prefix}{name}": dict(row, unit="ms") for name, row in histogram.report().items()}
+
+
+def _write(report: Dict[str, Any], out: Optional[str]):
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+@click.group()
+def cli():
+    """
+    Benchmark suite: data generation, microbenchmarks, end-to-end runs and
+    regression comparison of their JSON results.
+    """
+
+
+# --------------------------
+# Data generation
+# --------------------------
+@cli.command()
+@click.option("--src-db", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--src-docs", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--out-dir", default=os.path.join(ROOT, "data", "bench"), show_default=True)
+@click.option("--scale", default=10, show_default=True, type=int, help="Row multiplier (10-1000)")
+@click.option("--doc-files", default=200, show_default=True, type=int, help="Synthetic markdown files")
+def generate(src_db: str, src_docs: str, out_dir: str, scale: int, doc_files: int):
+    """
+    Write a scaled Northwind copy and a synthetic docs corpus under --out-dir.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    db_path = os.path.join(out_dir, f"northwind_x{scale}.sqlite")
+    docs_path = os.path.join(out_dir, f"docs_{doc_files}")
+    start = time.perf_counter()
+    counts = scale_northwind(src_db, db_path, scale)
+    db_s = time.perf_counter() - start
+    start = time.perf_counter()
+    n_files = write_retail_docs(docs_path, src_docs, doc_files)
+    docs_s = time.perf_counter() - start
+    print(json.dumps({"db": db_path, "rows": counts, "db_s": round(db_s, 2),
+                      "docs": docs_path, "files": n_files, "docs_s": round(docs_s, 2)}, indent=2))
+
+
+# --------------------------
+# Microbenchmarks
+# --------------------------
+@cli.command()
+@click.option("--db", "db_path", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--repeat", default=20, show_default=True, type=int, help="Runs per measured call")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def micro(db_path: str, docs_path: str, repeat: int, out: Optional[str]):
+    """
+    Time BM25Retriever.retrieve / retrieve_batch (scoring, cache off),
+    SQLiteTool.execute (cold and cached) per template and every RetailAgent stage.
+    """
+    items = _questions(6)
+    histogram = LatencyHistogram()
+
+    start = time.perf_counter()
+    retriever = BM25Retriever(docs_path, cache_size=0)
+    build_ms = 1000 * (time.perf_counter() - start)
+    for it in items:
+        _timed(lambda: retriever.retrieve(it["question"], k=5), repeat, histogram, "retrieve")
+    questions = [it["question"] for it in _questions(256)]
+    _timed(lambda: retriever.retrieve_batch(questions, k=5), repeat, histogram, "retrieve_batch.256")
+
+    cold = SQLiteTool(db_path, cache_size=0)
+    warm = SQLiteTool(db_path)
+    for template_id, sql in SQL_TEMPLATES.items():
+        params = SAMPLE_PARAMS.get(template_id, ())
+        _timed(lambda: cold.execute(sql, params), repeat, histogram, f"execute.{template_id}.cold")
+        warm.execute(sql, params)
+        _timed(lambda: warm.execute(sql, params), repeat, histogram, f"execute.{template_id}.cached")
+    cold.close()
+    warm.close()
+
+    # per-stage timings come from the agent's own tracing
+    agent = RetailAgent(db_path=db_path, docs_path=docs_path, trace=True)
+    stages = LatencyHistogram()
+    for _ in range(repeat):
+        for it in items:
+            stages.add_trace(agent.run_one(it)["trace"])
+
+    metrics = _latency_metrics(histogram)
+    metrics.update(_latency_metrics(stages, prefix="stage."))
+    metrics["retriever.build"] = {"unit": "ms", "value": round(build_ms, 3)}
+    _write({"meta": _meta(kind="micro", db=db_path, docs=docs_path, repeat=repeat,
+                          chunks=len(retriever.chunks)), "metrics": metrics}, out)
+
+
+# --------------------------
+# Retrieval quality
+# --------------------------
+# (query, source file, phrases): a chunk of that file holding every phrase
+# (case-insensitive) answers the query on its own. Facts from the real docs,
+# which the benchmark corpus copies next to its synthetic files.
+RETRIEVAL_JUDGMENTS = [
+    ("return window days for unopened beverages", "product_policy.md", ["beverages", "14 days"]),
+    ("return window for perishables", "product_policy.md", ["perishables", "3–7 days"]),
+    ("summer beverages 1997 campaign dates", "marketing_calendar.md", ["summer beverages 1997", "june 1–30"]),
+    ("winter classics 1997 dates", "marketing_calendar.md", ["winter classics 1997", "december 1–31"]),
+    ("which categories does winter classics promote", "marketing_calendar.md",
+     ["winter classics 1997", "dairy products"]),
+    ("average order value aov formula", "kpi_definitions.md", ["average order value", "count(distinct orderid)"]),
+    ("gross margin formula", "kpi_definitions.md", ["gross margin", "gm = sum"]),
+    ("gross margin when cost of goods is missing", "kpi_definitions.md", ["gross margin", "approximation"]),
+]
+
+
+def _first_relevant(results: List[Dict[str, Any]], source: str, phrases: List[str]) -> Optional[int]:
+    for rank, r in enumerate(results, 1):
+        text = r["text"].lower()
+        if r["source"] == source and all(p in text for p in phrases):
+            return rank
+    return None
+
+
+@cli.command()
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--repeat", default=20, show_default=True, type=int, help="Runs per measured call")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def retrieval(docs_path: str, repeat: int, out: Optional[str]):
+    """
+    Retrieval quality and latency per chunking mode. Quality is recall@k (the
+    share of RETRIEVAL_JUDGMENTS answered by one chunk in the top k) and MRR
+    over those judgments; latency is retrieve with the result cache off and on.
+    """
+    metrics: Dict[str, Dict[str, Any]] = {}
+    chunks = {}
+    for chunking in ("lines", "sections"):
+        histogram = LatencyHistogram()
+        start = time.perf_counter()
+        retriever = BM25Retriever(docs_path, chunking=chunking, cache_size=0)
+        metrics[f"{chunking}.build"] = {"unit": "ms", "value": round(1000 * (time.perf_counter() - start), 3)}
+        chunks[chunking] = len(retriever.chunks)
+        ranks = [_first_relevant(retriever.retrieve(q, k=10), source, phrases)
+                 for q, source, phrases in RETRIEVAL_JUDGMENTS]
+        for k in (1, 3, 5):
+            found = sum(1 for r in ranks if r is not None and r <= k)
+            metrics[f"{chunking}.recall@{k}"] = {"unit": "ratio", "value": round(found / len(ranks), 3)}
+        metrics[f"{chunking}.mrr"] = {"unit": "ratio",
+                                      "value": round(sum(1 / r for r in ranks if r) / len(ranks), 3)}
+
+        cached = BM25Retriever(docs_path, chunking=chunking)
+        for q, _, _ in RETRIEVAL_JUDGMENTS:
+            _timed(lambda: retriever.retrieve(q, k=5), repeat, histogram, f"{chunking}.retrieve")
+            _timed(lambda: cached.retrieve(q, k=5), repeat, histogram, f"{chunking}.retrieve.cached")
+        metrics.update(_latency_metrics(histogram))
+    _write({"meta": _meta(kind="retrieval", docs=docs_path, queries=len(RETRIEVAL_JUDGMENTS), chunks=chunks),
+            "metrics": metrics}, out)
+
+
+# --------------------------
+# Memory
+# --------------------------
+class _DictChunk:
+    # chunk layout before ChunkStore: one object with a __dict__ per chunk
+    def __init__(self, chunk_id: str, source: str, text: str):
+        self.chunk_id = chunk_id
+        self.source = source
+        self.text = text
+
+
+def _traced_bytes(build: Callable[[], Any]) -> Dict[str, int]:
+    """
+    Bytes still allocated by `build()` (while its result is alive) and its peak.
+    """
+    tracemalloc.start()
+    try:
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"current": current, "peak": peak}
+
+
+@cli.command()
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def memory(docs_path: str, out: Optional[str]):
+    """
+    Memory of the chunk store against one object per chunk, and of a whole
+    BM25Retriever (inverted and, if installed, rank_bm25 engines), next to the
+    raw size of the docs.
+    """
+    retriever = BM25Retriever(docs_path)
+    store = retriever.chunks
+    raw = sum(len(text.encode("utf-8")) for text in retriever.doc_texts.values())
+
+    objects = _traced_bytes(lambda: [_DictChunk(c.chunk_id, c.source, c.text) for c in store])
+    compact = _traced_bytes(lambda: ChunkStore.from_chunks(store))
+    metrics = {
+        "docs.raw": {"unit": "bytes", "value": raw},
+        "chunks.objects": {"unit": "bytes", "value": objects["current"]},
+        "chunks.store": {"unit": "bytes", "value": compact["current"]},
+    }
+    engines = ["inverted"]
+    try:
+        import rank_bm25  # noqa: F401
+        engines.append("rank_bm25")
+    except ImportError:
+        pass
+    for engine in engines:
+        used = _traced_bytes(lambda: BM25Retriever(docs_path, engine=engine))
+        metrics[f"retriever.{engine}"] = {"unit": "bytes", "value": used["current"]}
+        metrics[f"retriever.{engine}.peak"] = {"unit": "bytes", "value": used["peak"]}
+    _write({"meta": _meta(kind="memory", docs=docs_path, chunks=len(store),
+                          chunk_reduction=round(objects["current"] / max(compact["current"], 1), 2)),
+            "metrics": metrics}, out)
+
+
+def _same_build(a: BM25Retriever, b: BM25Retriever) -> bool:
+    arrays = ("offsets", "post_docs", "post_tfs", "doc_len", "idf", "norms")
+    return (a.index.vocab == b.index.vocab and a.index.avgdl == b.index.avgdl
+            and all(getattr(a.index, n) == getattr(b.index, n) for n in arrays)
+            and list(a.chunks.text_offsets) == list(b.chunks.text_offsets) and a.chunks.text == b.chunks.text
+            and [c.chunk_id for c in a.chunks] == [c.chunk_id for c in b.chunks])
+
+
+@cli.command()
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--workers", default="1,2,4", show_default=True, help="Comma-separated build process counts")
+@click.option("--repeat", default=3, show_default=True, type=int, help="Builds per worker count")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def build(docs_path: str, workers: str, repeat: int, out: Optional[str]):
+    """
+    Index build time by worker count (1 = the serial build), with the speedup
+    over the serial build. Every parallel index and chunk list must equal the
+    serial one; exits 1 otherwise.
+    """
+    serial = BM25Retriever(docs_path)
+    histogram = LatencyHistogram()
+    mismatched = []
+    for n in (int(w) for w in workers.split(",")):
+        _timed(lambda: BM25Retriever(docs_path, build_workers=n), repeat, histogram, f"build.w{n}")
+        if n > 1 and not _same_build(serial, BM25Retriever(docs_path, build_workers=n)):
+            mismatched.append(n)
+    metrics = _latency_metrics(histogram)
+    base = metrics.get("build.w1", {}).get("p50")
+    if base:
+        for name in list(metrics):
+            metrics[name + ".speedup"] = {"unit": "x", "value": round(base / metrics[name]["p50"], 2)}
+    _write({"meta": _meta(kind="build", docs=docs_path, chunks=len(serial.chunks), cpus=os.cpu_count(),
+                          identical=not mismatched), "metrics": metrics}, out)
+    if mismatched:
+        click.echo(f"parallel build differs from the serial build for workers={mismatched}", err=True)
+        sys.exit(1)
+
+
+# --------------------------
+# End-to-end
+# --------------------------
+@cli.command()
+@click.option("--db", "db_path", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--items", default=300, show_default=True, type=int, help="Questions per run")
+@click.option("--workers", default="1,4", show_default=True, help="Comma-separated worker counts")
+@click.option("--executor", default="thread", show_default=True, type=click.Choice(["thread", "process"]))
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def e2e(db_path: str, docs_path: str, items: int, workers: str, executor: str, out: Optional[str]):
+    """
+    Run run_agent_hybrid.py as a subprocess on a generated batch and report
+    wall time, throughput and per-item latency percentiles.
+    """
+    metrics: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        batch = os.path.join(tmp, "batch.jsonl")
+        with open(batch, "w", encoding="utf-8") as f:
+            for it in _questions(items):
+                f.write(json.dumps(it) + "\n")
+        for n in (int(w) for w in workers.split(",")):
+            result = os.path.join(tmp, f"out_{n}.jsonl")
+            cmd = [sys.executable, os.path.join(ROOT, "run_agent_hybrid.py"), "--batch", batch, "--out", result,
+                   "--db-path", db_path, "--docs-path", docs_path, "--index-path", "", "--trace",
+                   "--workers", str(n), "--executor", executor]
+            start = time.perf_counter()
+            subprocess.run(cmd, cwd=ROOT, check=True, capture_output=True)
+            wall_s = time.perf_counter() - start
+
+            latency = LatencyHistogram()
+            with open(result, "r", encoding="utf-8") as f:
+                for line in f:
+                    latency.add_trace(json.loads(line)["trace"])
+            prefix = f"e2e.workers{n}."
+            metrics.update(_latency_metrics(latency, prefix=prefix))
+            metrics[prefix + "wall"] = {"unit": "s", "value": round(wall_s, 3)}
+            metrics[prefix + "throughput"] = {"unit": "items/s", "value": round(items / wall_s, 2)}
+    _write({"meta": _meta(kind="e2e", db=db_path, docs=docs_path, items=items, executor=executor),
+            "metrics": metrics}, out)
+
+
+# --------------------------
+# Lazy vs eager pipeline
+# --------------------------
+@cli.command()
+@click.option("--db", "db_path", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--items", default=300, show_default=True, type=int, help="Questions per mode")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def lazy(db_path: str, docs_path: str, items: int, out: Optional[str]):
+    """
+    Per-stage latency of the same batch with the eager pipeline (every stage
+    runs), the lazy stage graph, and the lazy graph without doc citations on the
+    sql route. That the modes answer alike is checked in tests/test_lazy_agent.py.
+    """
+    batch = _questions(items)
+    modes = {
+        "eager": {"lazy": False},
+        "lazy": {"lazy": True},
+        "lazy_no_sql_doc_citations": {"lazy": True, "sql_doc_citations": False},
+    }
+    metrics: Dict[str, Dict[str, Any]] = {}
+    for mode, kwargs in modes.items():
+        agent = RetailAgent(db_path=db_path, docs_path=docs_path, trace=True, **kwargs)
+        latency = LatencyHistogram()
+        for it in batch:
+            latency.add_trace(agent.run_one(it)["trace"])
+        metrics.update(_latency_metrics(latency, prefix=f"{mode}."))
+    _write({"meta": _meta(kind="lazy", db=db_path, docs=docs_path, items=items), "metrics": metrics}, out)
+
+
+# --------------------------
+# Shared scans
+# --------------------------
+def _campaign_batch(docs_path: str, out_dir: str, year: int = 1997) -> List[Dict[str, Any]]:
+    """
+    Copy of the docs with one campaign per month of `year` added to the marketing
+    calendar (written to `out_dir`), and per campaign the category-quantity, AOV
+    and beverages-revenue questions.
+    """
+    shutil.copytree(docs_path, out_dir, dirs_exist_ok=True)
+    items = []
+    with open(os.path.join(out_dir, "marketing_calendar.md"), "a", encoding="utf-8") as f:
+        for month in range(1, 13):
+            name = f"Promo{month:02d} {year}"
+            last = calendar.monthrange(year, month)[1]
+            f.write(f"\n## {name}\n- Dates: {calendar.month_name[month]} 1–{last}, {year}\n")
+            items += [
+                {"id": f"hybrid_top_category_qty_summer_1997__{month}",
+                 "question": f"During '{name}', which product category had the highest total quantity sold?"},
+                {"id": f"hybrid_aov_winter_1997__{month}",
+                 "question": f"What was the Average Order Value during '{name}'?"},
+                {"id": f"hybrid_revenue_beverages_summer_1997__{month}",
+                 "question": f"Total revenue from the 'Beverages' category during '{name}' dates."},
+            ]
+    return items
+
+
+@cli.command()
+@click.option("--db", "db_path", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--repeat", default=5, show_default=True, type=int, help="Batch runs per mode")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def shared(db_path: str, docs_path: str, repeat: int, out: Optional[str]):
+    """
+    run_batch over 36 questions (3 templates x 12 monthly campaigns) with and
+    without shared scans, from a cold result cache each time. Reports batch time
+    and SQL queries run per batch; exits 1 if the outputs differ.
+    """
+    metrics: Dict[str, Dict[str, Any]] = {}
+    outputs: Dict[str, List[Dict[str, Any]]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        batch = _campaign_batch(docs_path, tmp)
+        for mode, enabled in (("own", False), ("shared", True)):
+            agent = RetailAgent(db_path=db_path, docs_path=tmp, shared_scans=enabled)
+            histogram = LatencyHistogram()
+            misses = agent.db.cache_info()["misses"]
+
+            def run_cold():
+                agent.db.clear_cache()
+                outputs[mode] = agent.run_batch(batch)
+
+            _timed(run_cold, repeat, histogram, f"{mode}.batch")
+            metrics.update(_latency_metrics(histogram))
+            queries = (agent.db.cache_info()["misses"] - misses) / repeat
+            metrics[f"{mode}.queries"] = {"unit": "queries", "value": queries}
+            agent.close()
+    identical = outputs["own"] == outputs["shared"]
+    _write({"meta": _meta(kind="shared", db=db_path, docs=docs_path, items=len(batch), identical_outputs=identical),
+            "metrics": metrics}, out)
+    sys.exit(0 if identical else 1)
+
+
+# --------------------------
+# Warm server vs cold runs
+# --------------------------
+def _wait_for_server(address: str, proc: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with AgentClient(address) as client:
+                client.request({"op": "ping"})
+            return
+        except OSError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise click.ClickException("agent server did not start")
+            time.sleep(0.1)
+
+
+@cli.command()
+@click.option("--db", "db_path", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--requests", "n_requests", default=12, show_default=True, type=int, help="Requests per mode")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def server(db_path: str, docs_path: str, n_requests: int, out: Optional[str]):
+    """
+    Per-request latency of one-question batches: a fresh run_agent_hybrid.py
+    process per request (cold, reusing a persisted index), against a warm
+    serve_agent_hybrid.py answering client_agent_hybrid.py processes and
+    in-process AgentClient requests. Exits 1 if the answers differ.
+    """
+    histogram = LatencyHistogram()
+    outputs: Dict[str, List[Dict[str, Any]]] = {"warmup": [], "cold": [], "warm.client": [], "warm.request": []}
+    items = _questions(n_requests)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, "bm25_index.bin")
+        address = os.path.join(tmp, "agent.sock")
+        batch = os.path.join(tmp, "batch.jsonl")
+        result = os.path.join(tmp, "out.jsonl")
+
+        def one(cmd: List[str], item: Dict[str, Any], mode: str):
+            with open(batch, "w", encoding="utf-8") as f:
+                f.write(json.dumps(item) + "\n")
+            start = time.perf_counter()
+            subprocess.run(cmd, cwd=ROOT, check=True, capture_output=True)
+            histogram.add(mode, 1000 * (time.perf_counter() - start))
+            with open(result, "r", encoding="utf-8") as f:
+                outputs[mode].append(json.loads(f.readline()))
+
+        cold = [sys.executable, os.path.join(ROOT, "run_agent_hybrid.py"), "--batch", batch, "--out", result,
+                "--db-path", db_path, "--docs-path", docs_path, "--index-path", index]
+        # the first run persists the index that the measured runs reopen
+        one(cold, items[0], "warmup")
+        for it in items:
+            one(cold, it, "cold")
+
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve_agent_hybrid.py"), "--address", address,
+                                 "--db-path", db_path, "--docs-path", docs_path, "--index-path", index],
+                                cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_server(address, proc)
+            client = [sys.executable, os.path.join(ROOT, "client_agent_hybrid.py"), "--batch", batch,
+                      "--out", result, "--address", address]
+            for it in items:
+                one(client, it, "warm.client")
+            with AgentClient(address) as conn:
+                for it in items:
+                    start = time.perf_counter()
+                    outputs["warm.request"].append(conn.request(it))
+                    histogram.add("warm.request", 1000 * (time.perf_counter() - start))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    metrics = _latency_metrics(histogram)
+    del metrics["warmup"]
+    cold_p50 = metrics["cold"]["p50"]
+    for mode in ("warm.client", "warm.request"):
+        metrics[f"{mode}.speedup"] = {"unit": "x", "value": round(cold_p50 / max(metrics[mode]["p50"], 1e-6), 1)}
+    identical = outputs["cold"] == outputs["warm.client"] == outputs["warm.request"]
+    _write({"meta": _meta(kind="server", db=db_path, docs=docs_path, requests=n_requests,
+                          identical_outputs=identical), "metrics": metrics}, out)
+    sys.exit(0 if identical else 1)
+
+
+# --------------------------
+# Cold start
+# --------------------------
+# run_agent_hybrid.profile_startup in a fresh interpreter; prints its timings as JSON
+_STARTUP_PROBE = ("import json, sys; from run_agent_hybrid import profile_startup; "
+                  "print(json.dumps(profile_startup(json.loads(sys.argv[1]))[1]))")
+
+
+@cli.command()
+@click.option("--db", "db_path", default=os.path.join(ROOT, "data", "northwind.sqlite"), show_default=True)
+@click.option("--docs", "docs_path", default=os.path.join(ROOT, "docs"), show_default=True)
+@click.option("--repeat", default=10, show_default=True, type=int, help="Fresh processes per measurement")
+@click.option("--max-ms", default=1000.0, show_default=True, type=float,
+              help="Cap on the p50 of a cold one-question run; exits 1 above it")
+@click.option("--out", default=None, type=str, help="Write the JSON results here as well")
+def startup(db_path: str, docs_path: str, repeat: int, max_ms: float, out: Optional[str]):
+    """
+    Cold-start cost of the CLI, each sample in a fresh process: `--help`, a
+    one-question run reusing a persisted index, and the import / init time of
+    every agent component (as reported by --profile-startup). Exits 1 if the
+    one-question run's p50 exceeds --max-ms.
+    """
+    histogram = LatencyHistogram()
+    with tempfile.TemporaryDirectory() as tmp:
+        index = os.path.join(tmp, "bm25_index.bin")
+        batch = os.path.join(tmp, "batch.jsonl")
+        with open(batch, "w", encoding="utf-8") as f:
+            f.write(json.dumps(_questions(1)[0]) + "\n")
+        script = os.path.join(ROOT, "run_agent_hybrid.py")
+        run = [sys.executable, script, "--batch", batch, "--out", os.path.join(tmp, "out.jsonl"),
+               "--db-path", db_path, "--docs-path", docs_path, "--index-path", index]
+        # the first run persists the index that the measured runs reopen
+        subprocess.run(run, cwd=ROOT, check=True, capture_output=True)
+        agent_kwargs = json.dumps({"db_path": db_path, "docs_path": docs_path, "index_path": index})
+        for _ in range(repeat):
+            _timed(lambda: subprocess.run([sys.executable, script, "--help"], cwd=ROOT, check=True,
+                                          capture_output=True), 1, histogram, "cold.help")
+            _timed(lambda: subprocess.run(run, cwd=ROOT, check=True, capture_output=True), 1, histogram, "cold.run")
+            probe = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, agent_kwargs], cwd=ROOT, check=True,
+                                   capture_output=True, text=True)
+            for component, ms in json.loads(probe.stdout).items():
+                histogram.add(f"init.{component}", ms)
+
+    metrics = _latency_metrics(histogram)
+    within_cap = metrics["cold.run"]["p50"] <= max_ms
+    _write({"meta": _meta(kind="startup", db=db_path, docs=docs_path, repeat=repeat, max_ms=max_ms,
+                          within_cap=within_cap), "metrics": metrics}, out)
+    sys.exit(0 if within_cap else 1)
+
+
+# --------------------------
+# Regression check
+# --------------------------
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compare the metrics two result documents share. A metric regresses when it got
+    worse by more than `threshold` (relative): p50/p95 or value for ms and s,
+    value for items/s, x (speedups) and ratio (retrieval quality).
+    """
+    rows = []
+    for name, cur in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None:
+            continue
+        higher_is_better = cur.get("unit") in ("items/s", "x", "ratio")
+        for field in ("p50", "p95", "value"):
+            if field not in cur or field not in base or not base[field]:
+                continue
+            change = (cur[field] - base[field]) / base[field]
+            worse = -change if higher_is_better else change
+            rows.append({"metric": name, "field": field, "baseline": base[field], "current": cur[field],
+                         "change": round(change, 4), "regression": worse > threshold})
+    return rows
+
+
+@cli.command()
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("current", type=click.Path(exists=True))
+@click.option("--threshold", default=0.2, show_default=True, type=float,
+              help="Relative slowdown tolerated before a metric counts as a regression")
+def compare(baseline: str, current: str, threshold: float):
+    """
+    Compare two result files; exits with status 1 if any metric regressed.
+    """
+    with open(baseline, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(current, "r", encoding="utf-8") as f:
+        cur = json.load(f)
+    rows = compare_results(base, cur, threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<48}{row['field']:>6}{row['baseline']:>12.3f}{row['current']:>12.3f}"
+              f"{100 * row['change']:>+9.1f}%  {flag}")
+    regressions = [r for r in rows if r["regression"]]
+    print(f"{len(regressions)} regression(s) over {100 * threshold:.0f}% "
+          f"({base['meta'].get('commit')} -> {cur['meta'].get('commit')})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    cli()
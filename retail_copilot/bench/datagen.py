@@ -0,0 +1,119 @@
+import itertools
+import os
+import random
+import re
+import shutil
+import sqlite3
+from typing import Dict, List
+
+# --------------------------
+# Scaled Northwind
+# --------------------------
+# Every extra copy c of the data gets its own customers, products and orders:
+# ids are shifted by c * span, names get a " #c" suffix, and orders keep their
+# OrderDate, so each KPI date window holds ~factor times as many rows. Products
+# are rotated per copy so the copies do not produce identical revenue ties.
+SCALED_TABLES = ["Categories", "Customers", "Products", "Orders", "Order Details"]
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _copy_rows(conn: sqlite3.Connection, table: str, overrides: Dict[str, str], params: Dict[str, int]):
+    cols = _columns(conn, table)
+    select = ", ".join(overrides.get(c, f'"{c}"') for c in cols)
+    col_list = ", ".join(f'"{c}"' for c in cols)
+    conn.execute(f'INSERT INTO "{table}" ({col_list}) SELECT {select} FROM "{table}" WHERE {overrides["_where"]}',
+                 params)
+
+
+def scale_northwind(src: str, dst: str, factor: int) -> Dict[str, int]:
+    """
+    Write a copy of the Northwind database at `src` to `dst` with `factor` times
+    the customers, products, orders and order lines. Categories are left as is.
+    Returns the row count per table.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    source = sqlite3.connect(src)
+    conn = sqlite3.connect(dst)
+    source.backup(conn)
+    source.close()
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    max_order, = conn.execute("SELECT MAX(OrderID) FROM Orders").fetchone()
+    max_product, = conn.execute("SELECT MAX(ProductID) FROM Products").fetchone()
+    n_products, = conn.execute("SELECT COUNT(*) FROM Products").fetchone()
+    order_span = 10 ** len(str(max_order))
+    product_span = 10 ** len(str(max_product))
+
+    with conn:
+        for c in range(1, factor):
+            params = {"c": c, "order_shift": c * order_span, "product_shift": c * product_span,
+                      "n_products": n_products, "order_span": order_span, "product_span": product_span}
+            _copy_rows(conn, "Customers", {
+                "_where": "instr(CustomerID, '#') = 0",
+                "CustomerID": "CustomerID || '#' || :c",
+                "CompanyName": "CompanyName || ' #' || :c",
+            }, params)
+            _copy_rows(conn, "Products", {
+                "_where": "ProductID < :product_span",
+                "ProductID": "ProductID + :product_shift",
+                "ProductName": "ProductName || ' #' || :c",
+            }, params)
+            _copy_rows(conn, "Orders", {
+                "_where": "OrderID < :order_span",
+                "OrderID": "OrderID + :order_shift",
+                "CustomerID": "CustomerID || '#' || :c",
+            }, params)
+            _copy_rows(conn, "Order Details", {
+                "_where": "OrderID < :order_span",
+                "OrderID": "OrderID + :order_shift",
+                "ProductID": "(ProductID + :c - 1) % :n_products + 1 + :product_shift",
+            }, params)
+    counts = {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in SCALED_TABLES}
+    conn.close()
+    return counts
+
+
+# --------------------------
+# Synthetic docs corpus
+# --------------------------
+def _vocabulary(docs_path: str) -> List[str]:
+    words = []
+    for name in sorted(os.listdir(docs_path)):
+        if name.endswith(".md"):
+            with open(os.path.join(docs_path, name), "r", encoding="utf-8") as f:
+                words.extend(re.findall(r"[a-z][a-z0-9]+", f.read().lower()))
+    return list(dict.fromkeys(words))
+
+
+def write_retail_docs(dst: str, src_docs: str, n_files: int, sections: int = 20, paragraphs: int = 5,
+                      filler_vocab: int = 20000, seed: int = 7) -> int:
+    """
+    Copy the real docs/ files to `dst` and add `n_files` synthetic markdown files
+    with `sections` headed sections of `paragraphs` paragraphs each. Words are drawn
+    Zipf-style from the real docs vocabulary mixed with filler words, so synthetic
+    chunks compete with the real ones for retail queries. Returns the file count.
+    """
+    os.makedirs(dst, exist_ok=True)
+    for name in sorted(os.listdir(src_docs)):
+        if name.endswith(".md"):
+            shutil.copy(os.path.join(src_docs, name), os.path.join(dst, name))
+
+    rng = random.Random(seed)
+    real = _vocabulary(src_docs)
+    vocab = [w for pair in zip(real, (f"term{i}" for i in range(len(real)))) for w in pair]
+    vocab += [f"term{i}" for i in range(len(real), filler_vocab)]
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(vocab))))
+    for n in range(n_files):
+        with open(os.path.join(dst, f"synthetic_{n:05d}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Synthetic handbook {n}\n\n")
+            for s in range(sections):
+                f.write(f"## {' '.join(rng.choices(real, k=3)).title()} {s}\n")
+                for _ in range(paragraphs):
+                    f.write(" ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(20, 80))) + "\n")
+                f.write("\n")
+    return n_files + sum(1 for name in os.listdir(src_docs) if name.endswith(".md"))
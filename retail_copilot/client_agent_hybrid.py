@@ -0,0 +1,45 @@
+import json
+import sys
+from typing import Any, Dict, Iterator
+
+import click
+from agent.server import DEFAULT_PIPELINE, AgentClient, parse_address
+
+ADDRESS = "data/agent.sock"
+
+
+def read_items(batch: str) -> Iterator[Dict[str, Any]]:
+    with (sys.stdin if batch == "-" else open(batch, "r", encoding="utf-8")) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+@click.command()
+@click.option("--batch", required=True, type=str, help="Input JSONL batch file ('-' for stdin)")
+@click.option("--out", default="-", show_default=True, type=str, help="Output JSONL file ('-' for stdout)")
+@click.option("--address", default=ADDRESS, show_default=True, type=str,
+              help="Server address: Unix socket path, or HOST:PORT")
+@click.option("--window", default=DEFAULT_PIPELINE, show_default=True, type=int,
+              help="Requests sent ahead of their responses")
+def main(batch: str, out: str, address: str, window: int):
+    """
+    Send a JSONL batch to a running serve_agent_hybrid.py and write the outputs
+    (same format as run_agent_hybrid.py, in input order).
+    """
+    written = 0
+    f = sys.stdout if out == "-" else open(out, "w", encoding="utf-8")
+    try:
+        with AgentClient(parse_address(address)) as client:
+            for result in client.stream(read_items(batch), window=window):
+                f.write(json.dumps(result) + "\n")
+                written += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    if out != "-":
+        print(f"Wrote {written} outputs to {out}")
+
+
+if __name__ == "__main__":
+    main()
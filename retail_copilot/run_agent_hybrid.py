@@ -1,28 +1,303 @@
+import itertools
 import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Set, Tuple
+
 import click
-from agent.graph_hybrid import RetailAgent
+from agent.tracing import JsonlSpanExporter, LatencyHistogram
+
+if TYPE_CHECKING:
+    from agent.graph_hybrid import RetailAgent
+
+DB_PATH = "data/northwind.sqlite"
+DOCS_PATH = "docs"
+INDEX_PATH = "data/bm25_index.bin"
+
+# --------------------------
+# Per-worker agents
+# --------------------------
+# Every worker owns its own RetailAgent (and therefore its own SQLite connection),
+# created lazily the first time the worker picks up an item.
+_local = threading.local()
+_agent_kwargs: Dict[str, Any] = {}
+
+
+def _init_worker(agent_kwargs: Dict[str, Any]):
+    _agent_kwargs.update(agent_kwargs)
+
+
+def _worker_agent() -> "RetailAgent":
+    agent = getattr(_local, "agent", None)
+    if agent is None:
+        from agent.graph_hybrid import RetailAgent
+        agent = RetailAgent(**_agent_kwargs)
+        _local.agent = agent
+    return agent
+
+
+def _run_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    return _worker_agent().run_one(item)
+
+
+# --------------------------
+# Startup
+# --------------------------
+# The agent package is imported on first use, and the agent builds its retriever,
+# schema and repairer on first use, so `--help` and short runs only pay for what
+# they touch.
+def profile_startup(agent_kwargs: Dict[str, Any]) -> Tuple["RetailAgent", Dict[str, float]]:
+    """
+    Import the agent package and build an agent with every lazy component, timing
+    each step in ms ("import", "agent" for the constructor, then one entry per
+    component, see RetailAgent.warm_up).
+    """
+    start = time.perf_counter()
+    from agent.graph_hybrid import RetailAgent
+    timings = {"import": (time.perf_counter() - start) * 1000}
+    start = time.perf_counter()
+    agent = RetailAgent(**agent_kwargs)
+    timings["agent"] = (time.perf_counter() - start) * 1000
+    timings.update(agent.warm_up())
+    return agent, timings
+
+
+def maintain_database(db_path: str) -> Dict[str, Any]:
+    """
+    Run the startup maintenance (index advisor + rollups) once from this process.
+    Pooled runs call it before the pool starts: advisors running in several
+    workers at once would judge and drop each other's indexes.
+    """
+    from agent.tools import db_maintenance
+    from agent.tools.sqlite_tool import SQLiteTool
+    db = SQLiteTool(db_path)
+    try:
+        return db_maintenance.run_maintenance(db)
+    finally:
+        db.close()
+
+
+# --------------------------
+# Input / resume helpers
+# --------------------------
+def iter_items(batch: str, skip_ids: Set[str],
+               counts: Optional[Dict[str, int]] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Lazily yield (position, item) pairs from a JSONL batch, skipping ids already
+    done; `counts["skipped"]` counts the batch items skipped.
+    """
+    with open(batch, "r", encoding="utf-8") as f:
+        pos = 0
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if item.get("id") in skip_ids:
+                if counts is not None:
+                    counts["skipped"] = counts.get("skipped", 0) + 1
+                continue
+            yield pos, item
+            pos += 1
+
+
+def completed_ids(out: str) -> Set[str]:
+    """
+    Return ids already written to an output file. A trailing partial line left by
+    a crashed run is truncated so appended records stay valid JSONL.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(out):
+        return done
+    with open(out, "rb+") as f:
+        data = f.read()
+        keep = data.rfind(b"\n") + 1
+        if keep != len(data):
+            f.truncate(keep)
+        for line in data[:keep].splitlines():
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict):
+                done.add(rec.get("id"))
+    return done
+
+
+# --------------------------
+# Batch execution
+# --------------------------
+def run_sequential(items: Iterator[Tuple[int, Dict[str, Any]]], f, agent_kwargs: Dict[str, Any],
+                   histogram: Optional[LatencyHistogram] = None, batch_size: int = 64,
+                   agent: Optional["RetailAgent"] = None) -> int:
+    """
+    Answer items in groups of `batch_size`, so retrieval for each group is one
+    vectorized retrieve_batch call, and stream the results to `f`. `agent` reuses
+    an agent already built from `agent_kwargs`.
+    """
+    if agent is None:
+        from agent.graph_hybrid import RetailAgent
+        agent = RetailAgent(**agent_kwargs)
+    written = 0
+    source = iter(items)
+    while True:
+        group = [it for _, it in itertools.islice(source, max(batch_size, 1))]
+        if not group:
+            break
+        for result in agent.run_batch(group):
+            if histogram is not None and "trace" in result:
+                histogram.add_trace(result["trace"])
+            f.write(json.dumps(result) + "\n")
+            written += 1
+        f.flush()
+    return written
+
+
+def run_pooled(items: Iterator[Tuple[int, Dict[str, Any]]], f, agent_kwargs: Dict[str, Any],
+               workers: int, executor: str, ordered: bool,
+               histogram: Optional[LatencyHistogram] = None) -> int:
+    """
+    Fan items out to a worker pool and stream results to `f` as they complete.
+    At most `workers * 4` items are in flight or, with `ordered`, held back until
+    every earlier item is written, so memory stays bounded even behind a slow item.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    max_in_flight = workers * 4
+    written = 0
+    next_pos = 0
+    held: Dict[int, Dict[str, Any]] = {}
+    pending = {}
+
+    def emit(result: Dict[str, Any]):
+        nonlocal written
+        if histogram is not None and "trace" in result:
+            histogram.add_trace(result["trace"])
+        f.write(json.dumps(result) + "\n")
+        f.flush()
+        written += 1
+
+    with pool_cls(max_workers=workers, initializer=_init_worker, initargs=(agent_kwargs,)) as pool:
+        source = iter(items)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) + len(held) < max_in_flight:
+                try:
+                    pos, it = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(_run_item, it)] = pos
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pos = pending.pop(fut)
+                result = fut.result()
+                if not ordered:
+                    emit(result)
+                    continue
+                held[pos] = result
+                while next_pos in held:
+                    emit(held.pop(next_pos))
+                    next_pos += 1
+    return written
 
 
 @click.command()
 @click.option("--batch", required=True, type=str, help="Input JSONL batch file")
 @click.option("--out", required=True, type=str, help="Output JSONL file path")
-def run(batch: str, out: str):
-    with open(batch, "r", encoding="utf-8") as f:
-        items = [json.loads(line) for line in f if line.strip()]
+@click.option("--workers", default=1, show_default=True, type=int, help="Number of parallel workers")
+@click.option("--executor", default="thread", show_default=True, type=click.Choice(["thread", "process"]),
+              help="Worker pool type used when --workers > 1")
+@click.option("--ordered/--unordered", default=False, show_default=True,
+              help="Keep outputs in input order instead of completion order")
+@click.option("--retrieve-batch", default=64, show_default=True, type=int,
+              help="Questions per vectorized retrieval call in sequential mode")
+@click.option("--resume/--no-resume", default=False, show_default=True,
+              help="Append to --out and skip ids already written there")
+@click.option("--db-path", default=DB_PATH, show_default=True, type=str, help="Northwind SQLite database")
+@click.option("--docs-path", default=DOCS_PATH, show_default=True, type=str, help="Folder of markdown docs")
+@click.option("--index-path", default=INDEX_PATH, show_default=True, type=str,
+              help="Persistent BM25 index artifact ('' to rebuild in memory every run)")
+@click.option("--maintain-db/--no-maintain-db", default=False, show_default=True,
+              help="Create advised indexes and refresh daily rollups at startup")
+@click.option("--trace/--no-trace", default=False, show_default=True,
+              help="Add per-stage timings to each output and print p50/p95/p99 per stage")
+@click.option("--spans-out", default=None, type=str,
+              help="Append OpenTelemetry-style spans (OTLP/JSON, one per line) to this file")
+@click.option("--memo-size", default=0, show_default=True, type=int,
+              help="Memoize plans and answers in an in-memory LRU of this size per worker (0 disables)")
+@click.option("--memo-ttl", default=3600.0, show_default=True, type=float, help="Memo entry lifetime in seconds")
+@click.option("--memo-path", default=None, type=str,
+              help="SQLite file for memoized answers shared by all workers and runs")
+@click.option("--sql-doc-citations/--no-sql-doc-citations", default=True, show_default=True,
+              help="Cite retrieved doc chunks on the sql route (off skips retrieval there)")
+@click.option("--query-timeout", default=30.0, show_default=True, type=float,
+              help="Per-query time budget in seconds (0 disables)")
+@click.option("--query-instructions", default=0, show_default=True, type=int,
+              help="Per-query budget of SQLite VM instructions (0 disables)")
+@click.option("--index-workers", default=1, show_default=True, type=int,
+              help="Processes used to build the BM25 index when it is missing or stale")
+@click.option("--shared-scans/--no-shared-scans", default=True, show_default=True,
+              help="In sequential mode, answer a template asked for several date windows with one shared query")
+@click.option("--chunking", default="lines", show_default=True, type=click.Choice(["lines", "sections"]),
+              help="Doc chunks: fixed windows per line, or whole markdown sections with their headings")
+@click.option("--retrieval-k", default=5, show_default=True, type=int, help="Doc chunks retrieved per question")
+@click.option("--profile-startup/--no-profile-startup", "profile", default=False, show_default=True,
+              help="Print the import time and the init time of each agent component before the run")
+def run(batch: str, out: str, workers: int, executor: str, ordered: bool, retrieve_batch: int, resume: bool,
+        db_path: str, docs_path: str, index_path: str, maintain_db: bool, trace: bool, spans_out: Optional[str],
+        memo_size: int, memo_ttl: float, memo_path: Optional[str], sql_doc_citations: bool,
+        query_timeout: float, query_instructions: int, index_workers: int, shared_scans: bool,
+        chunking: str, retrieval_k: int, profile: bool):
+    agent_kwargs = {"db_path": db_path, "docs_path": docs_path, "index_path": index_path or None,
+                    "maintain_db": maintain_db, "trace": trace,
+                    "span_exporter": JsonlSpanExporter(spans_out) if spans_out else None,
+                    "memo_size": memo_size, "memo_ttl": memo_ttl, "memo_path": memo_path,
+                    "sql_doc_citations": sql_doc_citations,
+                    "query_timeout": query_timeout or None, "query_instructions": query_instructions or None,
+                    "index_workers": index_workers, "shared_scans": shared_scans,
+                    "chunking": chunking, "retrieval_k": retrieval_k}
+    histogram = LatencyHistogram() if trace else None
+    skip_ids = completed_ids(out) if resume else set()
+    counts: Dict[str, int] = {}
+    items = iter_items(batch, skip_ids, counts)
 
-    agent = RetailAgent(db_path="data/northwind.sqlite", docs_path="docs")
+    if maintain_db and workers > 1:
+        maintain_database(db_path)
+        agent_kwargs["maintain_db"] = False
 
-    outputs = []
-    for it in items:
-        result = agent.run_one(it)
-        outputs.append(result)
+    agent = None
+    if profile:
+        agent, timings = profile_startup(agent_kwargs)
+        print(f"{'startup':<22}{'ms':>10}")
+        for component, ms in timings.items():
+            print(f"{component:<22}{ms:>10.3f}")
+        print(f"{'total':<22}{sum(timings.values()):>10.3f}")
+        if workers > 1:
+            # pool workers build their own agents
+            agent.close()
+            agent = None
 
-    # write outputs to JSONL
-    with open(out, "w", encoding="utf-8") as f:
-        for r in outputs:
-            f.write(json.dumps(r) + "\n")
+    # stream outputs to JSONL as they are produced
+    with open(out, "a" if resume else "w", encoding="utf-8") as f:
+        if workers <= 1:
+            written = run_sequential(items, f, agent_kwargs, histogram, retrieve_batch, agent)
+        else:
+            written = run_pooled(items, f, agent_kwargs, workers, executor, ordered, histogram)
 
-    print(f"Wrote {len(outputs)} outputs to {out}")
+    if counts.get("skipped"):
+        print(f"Skipped {counts['skipped']} ids already in {out}")
+    print(f"Wrote {written} outputs to {out}")
+    if histogram is not None:
+        print(f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage, row in histogram.report().items():
+            print(f"{stage:<22}{row['count']:>7}{row['p50']:>10.3f}{row['p95']:>10.3f}"
+                  f"{row['p99']:>10.3f}{row['max']:>10.3f}")
 
 
 if __name__ == "__main__":
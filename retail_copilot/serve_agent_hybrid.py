@@ -0,0 +1,68 @@
+import asyncio
+import signal
+
+import click
+from agent.graph_hybrid import RetailAgent
+from agent.server import DEFAULT_PIPELINE, AgentServer, parse_address
+
+DB_PATH = "data/northwind.sqlite"
+DOCS_PATH = "docs"
+INDEX_PATH = "data/bm25_index.bin"
+ADDRESS = "data/agent.sock"
+
+
+async def serve(agent: RetailAgent, server: AgentServer):
+    await server.start()
+    task = asyncio.ensure_future(server.serve_forever())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+    print(f"Serving on {server.address} (Ctrl+C to stop)", flush=True)
+    try:
+        await task
+    finally:
+        await server.stop()
+        agent.close()
+
+
+@click.command()
+@click.option("--address", default=ADDRESS, show_default=True, type=str,
+              help="Unix socket path, or HOST:PORT / :PORT for localhost TCP")
+@click.option("--workers", default=4, show_default=True, type=int,
+              help="Requests answered at once (each with its own SQLite connection)")
+@click.option("--pipeline", default=DEFAULT_PIPELINE, show_default=True, type=int,
+              help="Requests read ahead per connection before earlier ones are answered")
+@click.option("--request-timeout", default=0.0, show_default=True, type=float,
+              help="Per-request time limit in seconds (0 disables)")
+@click.option("--db-path", default=DB_PATH, show_default=True, type=str, help="Northwind SQLite database")
+@click.option("--docs-path", default=DOCS_PATH, show_default=True, type=str, help="Folder of markdown docs")
+@click.option("--index-path", default=INDEX_PATH, show_default=True, type=str,
+              help="Persistent BM25 index artifact ('' to rebuild in memory)")
+@click.option("--docs-poll-interval", default=5.0, show_default=True, type=float,
+              help="Re-index edited docs/ files at most this often, in seconds (0 disables)")
+@click.option("--memo-size", default=0, show_default=True, type=int,
+              help="Memoize plans and answers in an in-memory LRU of this size (0 disables)")
+@click.option("--query-timeout", default=30.0, show_default=True, type=float,
+              help="Per-query time budget in seconds (0 disables)")
+@click.option("--chunking", default="lines", show_default=True, type=click.Choice(["lines", "sections"]),
+              help="Doc chunks: fixed windows per line, or whole markdown sections with their headings")
+@click.option("--retrieval-k", default=5, show_default=True, type=int, help="Doc chunks retrieved per question")
+def main(address: str, workers: int, pipeline: int, request_timeout: float, db_path: str, docs_path: str,
+         index_path: str, docs_poll_interval: float, memo_size: int, query_timeout: float, chunking: str,
+         retrieval_k: int):
+    """
+    Keep one warm RetailAgent and answer JSON-lines requests (see agent/server.py);
+    send batches with client_agent_hybrid.py.
+    """
+    agent = RetailAgent(db_path=db_path, docs_path=docs_path, index_path=index_path or None,
+                        docs_poll_interval=docs_poll_interval or None, pool_size=workers,
+                        async_concurrency=workers, memo_size=memo_size, query_timeout=query_timeout or None,
+                        chunking=chunking, retrieval_k=retrieval_k)
+    # build the lazy components now, not on the first request
+    agent.warm_up()
+    server = AgentServer(agent, parse_address(address), timeout=request_timeout or None, pipeline=pipeline)
+    asyncio.run(serve(agent, server))
+
+
+if __name__ == "__main__":
+    main()
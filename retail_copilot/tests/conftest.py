@@ -0,0 +1,28 @@
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(ROOT, "data", "northwind.sqlite")
+DOCS_PATH = os.path.join(ROOT, "docs")
+SAMPLE_BATCH = os.path.join(ROOT, "sample_questions_hybrid_eval.jsonl")
+
+
+@pytest.fixture
+def db_path() -> str:
+    # the database is downloaded separately (README, "Download the database")
+    if not os.path.exists(DB_PATH):
+        pytest.skip(f"{DB_PATH} not found")
+    return DB_PATH
+
+
+@pytest.fixture
+def sample_items() -> List[Dict[str, Any]]:
+    with open(SAMPLE_BATCH, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,32 @@
+from agent.graph_hybrid import RetailAgent
+
+from conftest import DOCS_PATH
+
+
+def _answers(db_path, items, **kwargs):
+    agent = RetailAgent(db_path=db_path, docs_path=DOCS_PATH, **kwargs)
+    try:
+        return [agent.run_one(it) for it in items]
+    finally:
+        agent.close()
+
+
+def test_lazy_outputs_equal_eager(db_path, sample_items):
+    assert _answers(db_path, sample_items, lazy=True) == _answers(db_path, sample_items, lazy=False)
+
+
+def test_lazy_batch_equals_eager(db_path, sample_items):
+    agent = RetailAgent(db_path=db_path, docs_path=DOCS_PATH, lazy=True)
+    try:
+        batch = agent.run_batch(sample_items)
+    finally:
+        agent.close()
+    assert batch == _answers(db_path, sample_items, lazy=False)
+
+
+def test_no_sql_doc_citations_keeps_answers(db_path, sample_items):
+    def strip(outputs):
+        return [{k: v for k, v in out.items() if k != "citations"} for out in outputs]
+
+    eager = _answers(db_path, sample_items, lazy=False)
+    assert strip(_answers(db_path, sample_items, sql_doc_citations=False)) == strip(eager)
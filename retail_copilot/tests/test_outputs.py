@@ -0,0 +1,20 @@
+from agent.graph_hybrid import RetailAgent
+from agent.tools.sqlite_tool import SQLiteTool
+
+from conftest import DOCS_PATH
+
+
+def test_records_carry_the_bound_params(db_path, sample_items):
+    agent = RetailAgent(db_path=db_path, docs_path=DOCS_PATH)
+    db = SQLiteTool(db_path)
+    try:
+        for item in sample_items:
+            out = agent.run_one(item)
+            assert out["sql"].count("?") == len(out["params"])
+            if out["sql"]:
+                # the record alone is enough to re-run the query
+                _, _, err = db.execute(out["sql"], tuple(out["params"]))
+                assert err == ""
+    finally:
+        agent.close()
+        db.close()
@@ -0,0 +1,73 @@
+import json
+import shutil
+
+import pytest
+
+from agent.rag.bm25_matrix import BM25Matrix
+from agent.rag.retrieval import BM25Retriever
+
+from conftest import DOCS_PATH, SAMPLE_BATCH
+
+
+def _queries():
+    with open(SAMPLE_BATCH, "r", encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+    return questions + [" ".join(q.split()[::-1]) for q in questions] + ["", "zzz unknown"]
+
+
+@pytest.mark.parametrize("min_docs", [BM25Matrix.MIN_DOCS, 0])
+def test_batch_equals_per_query(monkeypatch, min_docs):
+    # the real docs are far below MIN_DOCS; 0 forces the matrix path
+    monkeypatch.setattr(BM25Matrix, "MIN_DOCS", min_docs)
+    retriever = BM25Retriever(DOCS_PATH, cache_size=0)
+    queries = _queries()
+    for k in (1, 5, 100):
+        assert retriever.retrieve_batch(queries, k=k) == [retriever.retrieve(q, k=k) for q in queries]
+    assert (retriever._matrix is not None) == (min_docs == 0)
+
+
+def _fresh(path, queries):
+    retriever = BM25Retriever(path, cache_size=0)
+    return [retriever.retrieve(q, k=5) for q in queries]
+
+
+def test_updates_match_a_fresh_build(tmp_path):
+    shutil.copytree(DOCS_PATH, tmp_path, dirs_exist_ok=True)
+    retriever = BM25Retriever(str(tmp_path))
+    queries = _queries()
+    retriever.retrieve_batch(queries)  # warm the cache and the matrix
+
+    (tmp_path / "extra.md").write_text("# Returns\nBeverages returns window is 30 days.\n", encoding="utf-8")
+    retriever.add_document("extra.md")
+    policy = (tmp_path / "product_policy.md").read_text(encoding="utf-8")
+    (tmp_path / "product_policy.md").write_text(policy + "\nDairy returns: 10 days.\n", encoding="utf-8")
+    retriever.replace_document("product_policy.md")
+    (tmp_path / "kpi_definitions.md").unlink()
+    retriever.remove_document("kpi_definitions.md")
+    expected = _fresh(str(tmp_path), queries)
+    assert [retriever.retrieve(q, k=5) for q in queries] == expected
+    assert retriever.retrieve_batch(queries, k=5) == expected
+
+
+def test_refresh_applies_changes_on_disk(tmp_path):
+    shutil.copytree(DOCS_PATH, tmp_path, dirs_exist_ok=True)
+    retriever = BM25Retriever(str(tmp_path))
+    assert retriever.refresh() == []
+    (tmp_path / "extra.md").write_text("# Returns\nBeverages returns window is 30 days.\n", encoding="utf-8")
+    (tmp_path / "catalog.md").unlink()
+    assert sorted(retriever.refresh()) == ["catalog.md", "extra.md"]
+    queries = _queries()
+    assert [retriever.retrieve(q, k=5) for q in queries] == _fresh(str(tmp_path), queries)
+
+
+def test_updates_on_a_corpus_of_empty_files(tmp_path):
+    (tmp_path / "empty.md").write_text("", encoding="utf-8")
+    retriever = BM25Retriever(str(tmp_path))
+    assert retriever.index is None and retriever.retrieve("returns") == []
+    retriever.remove_document("empty.md")
+    (tmp_path / "empty.md").write_text("", encoding="utf-8")
+    assert retriever.refresh() == ["empty.md"]
+    (tmp_path / "empty.md").unlink()
+    assert retriever.refresh() == ["empty.md"]
+    retriever.add_document("notes.md", "Beverages returns window is 30 days.")
+    assert [r["source"] for r in retriever.retrieve("beverages returns")] == ["notes.md"]
@@ -0,0 +1,56 @@
+import calendar
+
+import pytest
+
+from agent.dspy_signatures import NL2SQLOutput
+from agent.graph_hybrid import RetailAgent
+from agent.sql_templates import ROLLUP_TEMPLATES, SQL_TEMPLATES, date_bounds
+from agent.tools import db_maintenance
+from bench.datagen import scale_northwind
+
+from conftest import DOCS_PATH
+
+
+def _windows():
+    for year in (1996, 1997, 1998):
+        yield date_bounds(f"{year}-01-01", f"{year}-12-31")
+        for month in range(1, 13):
+            yield date_bounds(f"{year}-{month:02d}-01", f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}")
+
+
+def _answer(out):
+    result = out.as_columnar()
+    if len(result) == 0:
+        return None
+    return tuple(round(v, 2) if isinstance(v, float) else v for v in result.row(0).values())
+
+
+@pytest.fixture
+def scaled_agent(db_path, tmp_path):
+    # scaled copies repeat every customer and product, so rankings are full of exact ties
+    scaled = str(tmp_path / "northwind_x10.sqlite")
+    scale_northwind(db_path, scaled, 10)
+    agent = RetailAgent(db_path=scaled, docs_path=DOCS_PATH, maintain_db=True)
+    yield agent
+    agent.close()
+
+
+def test_rollup_answers_match_base_templates(scaled_agent):
+    assert scaled_agent.maintenance_report["rollups"] == "rebuilt"
+    for template_id, rollup in ROLLUP_TEMPLATES.items():
+        for window in _windows():
+            params = ("Beverages",) + window if template_id == "category_revenue" else window
+            nl2sql = NL2SQLOutput(sql=SQL_TEMPLATES[template_id], template_id=template_id, params=params)
+            assert scaled_agent._executable(nl2sql) == rollup
+            base = scaled_agent.execute_with_repair(nl2sql.sql.strip(), params, template_id)
+            assert _answer(scaled_agent._execute(rollup, nl2sql)) == _answer(base), (template_id, window)
+
+
+def test_inexact_amounts_skip_rollups(scaled_agent):
+    db = scaled_agent.db
+    with db.connection(write=True) as conn:
+        conn.execute('UPDATE "Order Details" SET UnitPrice = UnitPrice + 0.001 WHERE rowid = 1')
+        conn.commit()
+    assert not db_maintenance.rollups_fresh(db)
+    assert not db_maintenance.refresh_rollups(db)
+    assert not db_maintenance.has_rollups(db)
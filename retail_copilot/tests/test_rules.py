@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from agent.graph_hybrid import RetailAgent
+from agent.rules import KeywordAutomaton
+
+from conftest import DOCS_PATH
+
+CATEGORIES = ["Beverages", "Condiments", "Confections", "Dairy Products", "Produce", "Seafood", "Meat/Poultry",
+              "Grains/Cereals"]
+
+EDGE_QUESTIONS = [
+    "Compare summer and winter revenue.",
+    "Winter Classics 1997 vs Summer Beverages 1997 AOV",
+    "What was the average order value and the gross margin?",
+    "Which margin beat the AOV?",
+    "Total seafood, produce and beverages quantity during winter",
+    "Dairy Products and Condiments revenue in Summer Beverages 1997",
+    "Top 3 products by margin",
+    "Beverages return policy",
+    "What is the return window for beverages during summer?",
+    "Meat/Poultry and Grains/Cereals",
+    "Nothing to see here",
+    "",
+]
+
+
+def legacy_router(question, qid=""):
+    # the keyword router RuleEngine replaced
+    q = question.lower()
+    if "rag_policy_beverages_return_days" in qid:
+        return "rag", "id-based"
+    if "sql_top3_products_by_revenue_alltime" in qid:
+        return "sql", "id-based"
+    if "hybrid" in qid:
+        return "hybrid", "id-based"
+    if "top 3" in q:
+        return "sql", "top 3 aggregate"
+    if "average order value" in q or "aov" in q:
+        return "hybrid", "aov hybrid"
+    if "gross margin" in q or "margin" in q:
+        return "hybrid", "margin hybrid"
+    if "summer" in q or "winter" in q:
+        return "hybrid", "date-based hybrid"
+    if "return" in q and "beverage" in q:
+        return "rag", "policy hybrid"
+    return "hybrid", "default fallback"
+
+
+def legacy_planner(question):
+    # the keyword planner RuleEngine replaced: (date_from, date_to, categories, kpi)
+    q = question.lower()
+    date_from = date_to = kpi = None
+    categories = []
+    if "summer" in q:
+        date_from, date_to = "1997-06-01", "1997-06-30"
+        categories.append("Beverages")
+    if "winter" in q:
+        date_from, date_to = "1997-12-01", "1997-12-31"
+        categories += ["Dairy Products", "Confections"]
+    if "average order value" in q or "aov" in q:
+        kpi = "AOV"
+    if "gross margin" in q or "margin" in q:
+        kpi = "GM"
+    categories += [cat for cat in CATEGORIES if cat.lower() in q]
+    return date_from, date_to, list(dict.fromkeys(categories)), kpi
+
+
+def _agent(db_path, docs_path):
+    return RetailAgent(db_path=db_path, docs_path=docs_path)
+
+
+@pytest.mark.parametrize("docs", ["docs", "missing"])
+def test_router_and_planner_match_the_keyword_rules(db_path, sample_items, tmp_path, docs):
+    # without docs the engine falls back to DEFAULT_CAMPAIGNS / DEFAULT_KPIS
+    agent = _agent(db_path, DOCS_PATH if docs == "docs" else str(tmp_path))
+    try:
+        cases = [(it["question"], it["id"]) for it in sample_items]
+        cases += [(it["question"], "") for it in sample_items] + [(q, "") for q in EDGE_QUESTIONS]
+        for question, qid in cases:
+            route = agent.router(question, qid)
+            assert (route.route, route.reason) == legacy_router(question, qid), question
+            plan = agent.planner(question)
+            assert (plan.date_from, plan.date_to, plan.categories, plan.kpi) == legacy_planner(question), question
+    finally:
+        agent.close()
+
+
+def test_planner_notes_name_the_campaign_and_formula(db_path):
+    agent = _agent(db_path, DOCS_PATH)
+    try:
+        plan = agent.planner("Gross margin during Summer Beverages 1997 and Winter Classics 1997")
+    finally:
+        agent.close()
+    # both campaigns named: the one defined last in the calendar sets the dates
+    assert plan.notes["campaign"] == "Winter Classics 1997"
+    assert plan.notes["kpi_formula"].startswith("GM")
+
+
+def test_automaton_finds_overlapping_keywords():
+    keywords = ["he", "she", "his", "hers", "s", "ershe", "a", "aa", "aaa", "summer", "summer beverages", "mm"]
+    automaton = KeywordAutomaton(keywords)
+    rnd = random.Random(0)
+    texts = ["ushers", "ahishers", "aaaa", "summer beverages 1997", ""]
+    texts += ["".join(rnd.choice("aehimrsu ") for _ in range(rnd.randrange(30))) for _ in range(500)]
+    for text in texts:
+        assert automaton.find(text) == {kw for kw in keywords if kw in text}, text
@@ -0,0 +1,47 @@
+import io
+import json
+import time
+
+import run_agent_hybrid
+
+
+def test_ordered_pool_bounds_held_results(monkeypatch):
+    workers = 2
+    pulled = []
+    seen_by_slow_item = []
+
+    def items():
+        for pos in range(100):
+            pulled.append(pos)
+            yield pos, {"id": str(pos)}
+
+    def run_item(item):
+        if item["id"] == "0":
+            # the first item is slow: later results finish and are held back meanwhile
+            time.sleep(0.5)
+            seen_by_slow_item.append(len(pulled))
+        return {"id": item["id"]}
+
+    monkeypatch.setattr(run_agent_hybrid, "_run_item", run_item)
+    out = io.StringIO()
+    written = run_agent_hybrid.run_pooled(items(), out, {}, workers, "thread", ordered=True)
+    assert written == 100
+    assert [json.loads(line)["id"] for line in out.getvalue().splitlines()] == [str(i) for i in range(100)]
+    assert seen_by_slow_item[0] <= workers * 4
+
+
+def test_skipped_counts_only_batch_items(tmp_path):
+    batch = tmp_path / "batch.jsonl"
+    batch.write_text("".join(json.dumps({"id": i}) + "\n" for i in ("a", "b", "c")), encoding="utf-8")
+    counts = {}
+    items = list(run_agent_hybrid.iter_items(str(batch), {"a", "c", "not-in-batch"}, counts))
+    assert items == [(0, {"id": "b"})]
+    assert counts == {"skipped": 2}
+
+
+def test_completed_ids_skips_bad_records(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text('{"id": "a"}\n[]\n3\nnot json\n{"id": "b"}\n{"id": "c', encoding="utf-8")
+    assert run_agent_hybrid.completed_ids(str(out)) == {"a", "b"}
+    # the partial trailing record is cut so appended records stay valid JSONL
+    assert out.read_text(encoding="utf-8").endswith('{"id": "b"}\n')
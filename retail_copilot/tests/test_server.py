@@ -0,0 +1,61 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+from agent.graph_hybrid import RetailAgent
+from agent.server import AgentClient, AgentServer
+
+from conftest import DOCS_PATH
+
+
+@pytest.fixture
+def server(db_path, tmp_path):
+    agent = RetailAgent(db_path=db_path, docs_path=DOCS_PATH, pool_size=2)
+    srv = AgentServer(agent, str(tmp_path / "agent.sock"), line_limit=4096)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(srv.start())
+        started.set()
+        loop.run_until_complete(srv.serve_forever())
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    assert started.wait(10)
+    yield srv
+    asyncio.run_coroutine_threadsafe(srv.stop(), loop).result(10)
+    thread.join(10)
+    loop.close()
+    agent.close()
+
+
+def test_answers_match_run_one(server, sample_items):
+    with AgentClient(server.address, timeout=30) as client:
+        answers = list(client.stream(sample_items))
+    assert answers == [server.agent.run_one(it) for it in sample_items]
+
+
+def test_malformed_requests_get_errors(server):
+    with AgentClient(server.address, timeout=30) as client:
+        assert client.request({"id": "q1"}) == {"id": "q1", "error": "missing question"}
+        assert client.request({"id": 7, "question": "Top 3 products?"}) == {"id": 7, "error": "id must be a string"}
+        assert "error" in client.request(["not", "an", "object"])
+        assert client.request({"op": "ping"}) == {"ok": True}
+
+
+def test_overlong_line_gets_an_error_before_close(server):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(30)
+        sock.connect(server.address)
+        sock.sendall(json.dumps({"id": "ping", "op": "ping"}).encode("utf-8") + b"\n")
+        sock.sendall(json.dumps({"id": "big", "question": "x" * 10000}).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reader:
+            lines = reader.read().splitlines()
+    assert json.loads(lines[0]) == {"ok": True}
+    assert json.loads(lines[1]) == {"error": "request line longer than 4096 bytes"}
+    assert len(lines) == 2
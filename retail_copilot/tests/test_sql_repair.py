@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from agent.graph_hybrid import RetailAgent
+from agent.tools.sql_repair import classify_error
+
+from conftest import DOCS_PATH
+
+BAD_TABLE = "SELECT SUM(Quantity) AS qty FROM order_details"
+BAD_COLUMN = 'SELECT SUM(quantity_) AS qty FROM "Order Details"'
+
+
+@pytest.fixture
+def agent(tmp_path):
+    path = str(tmp_path / "shop.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE "Order Details" (OrderID INTEGER, ProductID INTEGER, Quantity INTEGER)')
+        conn.execute("CREATE TABLE Products (ProductID INTEGER, ProductName TEXT)")
+        conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?)', [(1, 1, 3), (1, 2, 4), (2, 1, 5)])
+        conn.executemany("INSERT INTO Products VALUES (?, ?)", [(1, "Chai"), (2, "Chang")])
+    agent = RetailAgent(db_path=path, docs_path=DOCS_PATH)
+    yield agent
+    agent.close()
+
+
+def test_candidates_only_run_when_they_compile(agent):
+    repairer = agent.repairer
+    err = "no such table: order_details"
+    assert classify_error(err) == ("no_such_table", "order_details")
+    candidates = repairer.candidates(BAD_TABLE, err)
+    assert candidates[0] == ("table_name", 'SELECT SUM(Quantity) AS qty FROM "Order Details"')
+    assert repairer.validate(candidates[0][1]) == ""
+    assert "no such table" in repairer.validate(BAD_TABLE)
+    assert repairer.validate("SELECT 'unterminated") == "incomplete input"
+    # an interrupted query is not a SQL problem: nothing to try
+    assert repairer.candidates(BAD_TABLE, "interrupted") == []
+
+
+@pytest.mark.parametrize("sql,rule", [(BAD_TABLE, "table_name"), (BAD_COLUMN, "column_name")])
+def test_known_fix_is_reused_then_dropped(agent, sql, rule):
+    out = agent.execute_with_repair(sql, (), "t")
+    assert out.error == "" and out.repair == rule and out.attempts == 2
+    assert out.columnar.data == [(12,)]
+    assert agent.repairer.known_fix("t", sql)[1] == rule
+
+    # the remembered rewrite runs first: one execution
+    out = agent.execute_with_repair(sql, (), "t")
+    assert out.error == "" and out.repair == rule and out.attempts == 1
+    assert agent.repairer.stats["known_fixes"] >= 2
+
+    # after a schema change the fix no longer compiles: it is dropped and nothing runs twice
+    with sqlite3.connect(agent.db.db_path) as conn:
+        conn.execute('ALTER TABLE "Order Details" RENAME TO OrderLines')
+    out = agent.execute_with_repair(sql, (), "t")
+    assert out.error and out.columnar is None
+    assert agent.repairer.known_fix("t", sql) is None
+
+
+def test_budget_errors_are_not_repaired(agent):
+    agent.db.instruction_limit = 1000
+    sql = 'SELECT count(*) FROM "Order Details" a, "Order Details" b, "Order Details" c, ' \
+          '"Order Details" d, "Order Details" e, "Order Details" f'
+    out = agent.execute_with_repair(sql, (), "t")
+    assert "instructions" in out.error and out.attempts == 1 and out.repair == ""
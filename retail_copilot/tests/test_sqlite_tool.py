@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from agent.tools.sqlite_tool import SQLiteTool
+
+CROSS_JOIN = "SELECT count(*) AS n FROM a, b"
+
+
+def _insert(path, table, n):
+    with sqlite3.connect(path) as conn:
+        conn.executemany(f"INSERT INTO {table} VALUES (?)", [(i,) for i in range(n)])
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "guard.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE a (x INTEGER)")
+        conn.execute("CREATE TABLE b (y INTEGER)")
+    _insert(path, "a", 5)
+    _insert(path, "b", 5)
+    return path
+
+
+@pytest.mark.parametrize("sql", [CROSS_JOIN, CROSS_JOIN + " WHERE random() IS NOT NULL"])
+@pytest.mark.parametrize("cache_size", [0, 128])
+def test_cost_guard_sees_db_changes(db, sql, cache_size):
+    tool = SQLiteTool(db, cache_size=cache_size, cost_guard=True, max_cross_rows=100)
+    try:
+        _, rows, err = tool.execute(sql)
+        assert err == "" and rows[0]["n"] == 25
+        # written by another connection: counts and verdicts are re-derived
+        _insert(db, "a", 50)
+        _, rows, err = tool.execute(sql)
+        assert rows == [] and "cartesian product" in err
+    finally:
+        tool.close()
+
+
+def test_cost_verdicts_are_keyed_on_params(db):
+    tool = SQLiteTool(db, cache_size=0, cost_guard=True, max_cross_rows=100)
+    try:
+        tool.execute("SELECT count(*) FROM a, b WHERE a.x > ?", (1,))
+        tool.execute("SELECT count(*) FROM a, b WHERE a.x > ?", (2,))
+        assert len(tool._cost_verdicts) == 2
+    finally:
+        tool.close()
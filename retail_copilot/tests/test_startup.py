@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+
+from conftest import DOCS_PATH, ROOT
+
+# runs in a fresh interpreter, so nothing imported by other tests leaks in
+_PROBE = """
+import json, sys
+from agent.graph_hybrid import RetailAgent
+agent = RetailAgent(db_path=sys.argv[1], docs_path=sys.argv[2], sql_doc_citations=False)
+loaded = {"import": sorted(m for m in ("rank_bm25", "numpy") if m in sys.modules),
+          "retriever_built": agent._retriever is not None}
+item = {"id": "sql_top3_products_by_revenue_alltime", "question": "Top 3 products by total revenue all-time.",
+        "format_hint": "list[{product:str, revenue:float}]"}
+agent.run_one(item)
+loaded["sql_run"] = sorted(m for m in ("rank_bm25", "numpy") if m in sys.modules)
+loaded["retriever_built_by_sql_run"] = agent._retriever is not None
+print(json.dumps(loaded))
+"""
+
+
+def _probe(db_path):
+    out = subprocess.run([sys.executable, "-c", _PROBE, db_path, DOCS_PATH], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def test_cold_start_defers_heavy_work(db_path):
+    loaded = _probe(db_path)
+    assert loaded["import"] == []
+    assert not loaded["retriever_built"]
+
+
+def test_sql_route_without_doc_citations_skips_retriever(db_path):
+    loaded = _probe(db_path)
+    assert loaded["sql_run"] == []
+    assert not loaded["retriever_built_by_sql_run"]
@@ -0,0 +1,117 @@
+import pytest
+
+from agent.graph_hybrid import RetailAgent
+from agent.tracing import InMemorySpanExporter, LatencyHistogram, Trace
+
+from bench.bench_suite import _campaign_batch
+
+from conftest import DOCS_PATH
+
+
+def test_spans_nest_under_their_parents():
+    exporter = InMemorySpanExporter()
+    trace = Trace(exporter=exporter)
+    with trace.span("run_one") as root:
+        with trace.span("planner") as planner:
+            with trace.span("sql") as sql:
+                pass
+        assert exporter.get_finished_spans() == []  # exported when the root ends
+        with trace.span("synthesize") as synth:
+            pass
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert set(spans) == {"run_one", "planner", "sql", "synthesize"}
+    assert root.parent_id is None
+    assert planner.parent_id == root.span_id
+    assert sql.parent_id == planner.span_id
+    assert synth.parent_id == root.span_id
+    assert {s.trace_id for s in spans.values()} == {trace.trace_id}
+    assert len({s.span_id for s in spans.values()}) == 4
+    assert list(trace.summary()["stages"]) == ["planner", "synthesize"]
+
+
+def test_failed_span_is_marked_and_exported():
+    exporter = InMemorySpanExporter()
+    trace = Trace(exporter=exporter)
+    with pytest.raises(ValueError):
+        with trace.span("run_one"):
+            with trace.span("execute_with_repair"):
+                raise ValueError("boom")
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert spans["execute_with_repair"].status == "ERROR"
+    assert spans["execute_with_repair"].attributes["exception.type"] == "ValueError"
+    assert spans["run_one"].status == "ERROR"
+
+
+def test_agent_stage_spans_share_one_root(db_path, sample_items):
+    exporter = InMemorySpanExporter()
+    agent = RetailAgent(db_path=db_path, docs_path=DOCS_PATH, span_exporter=exporter)
+    try:
+        for item in sample_items:
+            exporter.clear()
+            agent.run_one(item)
+            spans = exporter.get_finished_spans()
+            roots = [s for s in spans if s.parent_id is None]
+            assert len(roots) == 1
+            ids = {s.span_id for s in spans}
+            assert all(s.parent_id in ids for s in spans if s is not roots[0])
+            assert {s.trace_id for s in spans} == {roots[0].trace_id}
+            assert {"router", "synthesize"} <= {s.name for s in spans if s.parent_id == roots[0].span_id}
+    finally:
+        agent.close()
+
+
+def test_batch_runs_stages_once_and_traces_shared_scans(db_path, tmp_path):
+    items = _campaign_batch(DOCS_PATH, str(tmp_path))
+    exporter = InMemorySpanExporter()
+    agent = RetailAgent(db_path=db_path, docs_path=str(tmp_path), shared_scans=True, trace=True,
+                        span_exporter=exporter)
+    try:
+        outputs = agent.run_batch(items)
+    finally:
+        agent.close()
+    spans = exporter.get_finished_spans()
+    roots = {s.span_id: s for s in spans if s.parent_id is None}
+    assert len(roots) == len(items)
+    for name in ("router", "retrieve", "planner", "nl_to_sql", "select_sql", "execute_with_repair", "synthesize"):
+        assert sorted(s.parent_id for s in spans if s.name == name) == sorted(roots)
+    by_id = {s.span_id: s for s in spans}
+    for s in spans:
+        if s.parent_id is not None:
+            parent = by_id[s.parent_id]
+            assert parent.start_ns <= s.start_ns and s.end_ns <= parent.end_ns
+    for out in outputs:
+        stages = out["trace"]["stages"]
+        assert "retrieve" in stages
+        # stage times are rounded to the microsecond one by one
+        assert out["trace"]["total_ms"] >= sum(t["wall_ms"] for t in stages.values()) - 0.001 * len(stages)
+    shared = [out for out in outputs if "shared_scan" in out["trace"]]
+    assert shared
+    for out in shared:
+        assert out["trace"]["stages"]["execute_with_repair"]["wall_ms"] > 0
+
+
+def test_histogram_percentiles_on_known_values():
+    histogram = LatencyHistogram()
+    for value in range(100, 0, -1):
+        histogram.add("sql", float(value))
+    histogram.add("total", 7.0)
+    report = histogram.report()
+    assert list(report) == ["sql", "total"]
+    assert report["sql"] == {"count": 100, "mean": 50.5, "p50": 50.0, "p95": 95.0, "p99": 99.0, "max": 100.0}
+    assert report["total"]["p50"] == report["total"]["p99"] == 7.0
+
+
+def test_histogram_percentile_uses_nearest_rank():
+    assert LatencyHistogram.percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert LatencyHistogram.percentile([3.0, 1.0, 2.0], 1) == 1.0
+    assert LatencyHistogram.percentile([3.0, 1.0, 2.0], 100) == 3.0
+    assert LatencyHistogram().report(percentiles=(90,)) == {}
+
+
+def test_histogram_reads_trace_summaries():
+    histogram = LatencyHistogram()
+    histogram.add_trace({"stages": {"router": {"wall_ms": 1.5, "cpu_ms": 1.0}}, "total_ms": 4.0})
+    histogram.add_trace({"stages": {"router": {"wall_ms": 2.5, "cpu_ms": 2.0}}, "total_ms": 6.0})
+    report = histogram.report()
+    assert report["router"]["count"] == 2 and report["router"]["max"] == 2.5
+    assert report["total"]["p50"] == 4.0 and report["total"]["max"] == 6.0